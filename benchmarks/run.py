@@ -0,0 +1,259 @@
+"""Benchmark the ThingsBoard integration against the local stub server.
+
+Sets up config entries in a test Home Assistant instance, with the sensor and
+number platforms, and reports per scenario:
+
+- refresh latency: wall time of refreshing all entries at once
+- CPU time per refresh: process time of that refresh
+- state writes per refresh: calls of async_write_ha_state
+- memory per entity: traced allocations of the setup divided by the entities
+- write round trips: POST requests per attribute write and write latency
+
+Example: ``python -m benchmarks.run --entries 1,10,100 --keys 10,1000``.
+Requires pytest-homeassistant-custom-component, see benchmarks/requirements.txt.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+import json
+import os
+from pathlib import Path
+import statistics
+import tempfile
+import time
+import tracemalloc
+from typing import Any
+from unittest.mock import patch
+
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_test_home_assistant,
+)
+
+from homeassistant import loader
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity import Entity
+
+from custom_components.thingsboard.const import (
+    CONF_ACCESS_TOKEN,
+    CONF_HOST,
+    CONF_LONG_POLL,
+    CONF_OFFLINE_SPOOL,
+    CONF_WRITE_DELAY,
+    DOMAIN,
+)
+from custom_components.thingsboard.coordinator import ThingsBoardDataUpdateCoordinator
+
+from .stub_server import StubConfig, ThingsBoardStub
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+@dataclass
+class Result:
+    """Measurements of one scenario."""
+
+    entries: int
+    keys: int
+    entities: int
+    refresh_latency_ms: float
+    refresh_cpu_ms: float
+    state_writes_per_refresh: float
+    memory_per_entity_bytes: float
+    write_round_trips: float
+    write_latency_ms: float
+
+
+class StateWriteCounter:
+    """Count state writes of all entities."""
+
+    def __init__(self) -> None:
+        """Initialize the counter."""
+        self.count = 0
+
+    @contextmanager
+    def patch(self) -> Any:
+        """Count calls of Entity.async_write_ha_state while active."""
+        original = Entity.async_write_ha_state
+
+        def counting_write(entity: Entity) -> None:
+            self.count += 1
+            original(entity)
+
+        with patch.object(Entity, "async_write_ha_state", counting_write):
+            yield
+
+
+async def async_setup_entries(
+    hass: HomeAssistant, url: str, entries: int
+) -> list[ThingsBoardDataUpdateCoordinator]:
+    """Set up config entries against the stub and return their coordinators."""
+    coordinators = []
+    for index in range(entries):
+        entry = MockConfigEntry(
+            domain=DOMAIN,
+            title=f"Benchmark {index}",
+            data={CONF_HOST: url, CONF_ACCESS_TOKEN: f"token{index}"},
+            options={
+                CONF_LONG_POLL: False,
+                CONF_OFFLINE_SPOOL: False,
+                CONF_WRITE_DELAY: 0.05,
+            },
+        )
+        entry.add_to_hass(hass)
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        coordinators.append(hass.data[DOMAIN][entry.entry_id])
+    await hass.async_block_till_done()
+    return coordinators
+
+
+async def async_run_scenario(
+    config_dir: str, args: argparse.Namespace, entries: int, keys: int
+) -> Result:
+    """Measure one combination of entries and keys."""
+    stub = ThingsBoardStub(
+        StubConfig(
+            keys=keys,
+            value_size=args.value_size,
+            latency=args.latency,
+            error_rate=args.error_rate,
+            etag=args.etag,
+        )
+    )
+    url = await stub.async_start()
+    counter = StateWriteCounter()
+
+    async with async_test_home_assistant(config_dir=config_dir) as hass:
+        hass.data.pop(loader.DATA_CUSTOM_COMPONENTS, None)
+
+        with counter.patch():
+            # Memory of everything the entries allocate, entities included
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            coordinators = await async_setup_entries(hass, url, entries)
+            allocated = tracemalloc.get_traced_memory()[0] - baseline
+            tracemalloc.stop()
+
+            entities = sum(
+                len(platform)
+                for coordinator in coordinators
+                for platform in coordinator.entities.values()
+            )
+
+            latencies, cpu_times, writes = [], [], []
+            for _ in range(args.refreshes):
+                stub.mutate(args.change_rate)
+                counter.count = 0
+                wall, cpu = time.perf_counter(), time.process_time()
+                await asyncio.gather(
+                    *(coordinator.async_refresh() for coordinator in coordinators)
+                )
+                await hass.async_block_till_done()
+                latencies.append(time.perf_counter() - wall)
+                cpu_times.append(time.process_time() - cpu)
+                writes.append(counter.count)
+
+            # Burst of writes to different keys of every entry, like a slider
+            posts = stub.requests["POST /api/v1/{token}/attributes"]
+            wall = time.perf_counter()
+            await asyncio.gather(
+                *(
+                    coordinator.async_set_shared_attributes({f"s{key}": key})
+                    for coordinator in coordinators
+                    for key in range(args.writes)
+                )
+            )
+            write_latency = time.perf_counter() - wall
+            round_trips = stub.requests["POST /api/v1/{token}/attributes"] - posts
+
+        for entry in hass.config_entries.async_entries(DOMAIN):
+            await hass.config_entries.async_unload(entry.entry_id)
+
+    await stub.async_stop()
+
+    total_writes = entries * args.writes
+    return Result(
+        entries=entries,
+        keys=keys,
+        entities=entities,
+        refresh_latency_ms=statistics.median(latencies) * 1000,
+        refresh_cpu_ms=statistics.median(cpu_times) * 1000,
+        state_writes_per_refresh=statistics.mean(writes),
+        memory_per_entity_bytes=allocated / entities if entities else 0,
+        write_round_trips=round_trips / total_writes if total_writes else 0,
+        write_latency_ms=write_latency / total_writes * 1000 if total_writes else 0,
+    )
+
+
+def _print_table(results: list[Result]) -> None:
+    """Print the results as a table."""
+    columns = list(asdict(results[0]))
+    rows = [
+        [f"{value:.2f}" if isinstance(value, float) else str(value) for value in row]
+        for row in (asdict(result).values() for result in results)
+    ]
+    widths = [
+        max(len(column), *(len(row[index]) for row in rows))
+        for index, column in enumerate(columns)
+    ]
+    for line in (columns, *rows):
+        print("  ".join(v.rjust(w) for v, w in zip(line, widths, strict=True)))
+
+
+def _int_list(value: str) -> list[int]:
+    """Parse a comma separated list of integers."""
+    return [int(item) for item in value.split(",")]
+
+
+async def async_main(args: argparse.Namespace) -> list[Result]:
+    """Run all scenarios in a temporary configuration directory."""
+    results = []
+    with tempfile.TemporaryDirectory() as config_dir:
+        os.symlink(
+            REPO_ROOT / "custom_components", Path(config_dir, "custom_components")
+        )
+        for entries in args.entries:
+            for keys in args.keys:
+                results.append(
+                    await async_run_scenario(config_dir, args, entries, keys)
+                )
+                _print_table(results[-1:])
+    return results
+
+
+def main() -> None:
+    """Parse the arguments and run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=_int_list, default=[1, 10, 50])
+    parser.add_argument("--keys", type=_int_list, default=[10, 100, 1000])
+    parser.add_argument("--refreshes", type=int, default=5)
+    parser.add_argument(
+        "--change-rate",
+        type=float,
+        default=0.1,
+        help="share of attributes changed before each refresh",
+    )
+    parser.add_argument("--writes", type=int, default=10, help="writes per entry")
+    parser.add_argument("--value-size", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--etag", action="store_true")
+    parser.add_argument("--json", type=Path, help="also write the results here")
+    args = parser.parse_args()
+
+    results = asyncio.run(async_main(args))
+
+    print()
+    _print_table(results)
+    if args.json:
+        args.json.write_text(
+            json.dumps([asdict(result) for result in results], indent=2)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Local stub of the ThingsBoard device API for benchmarks.
+
+Serves the endpoints used by the integration for any access token:
+
+- GET  /api/v1/{token}/attributes (optionally with clientKeys/sharedKeys)
+- POST /api/v1/{token}/attributes
+- GET  /api/v1/{token}/attributes/updates?timeout=...
+- POST /api/v1/{token}/telemetry
+- GET  /api/v1/{token}/rpc?timeout=...
+- POST /api/v1/{token}/rpc/{id}
+
+Run it standalone with ``python -m benchmarks.stub_server --keys 100``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import Counter
+from dataclasses import dataclass, field
+import json
+import random
+import string
+from typing import Any
+
+from aiohttp import web
+
+
+@dataclass
+class StubConfig:
+    """Shape and behaviour of the stub devices."""
+
+    # Attributes per device, split evenly into client and shared attributes
+    keys: int = 100
+    # Length of string attribute values, 0 for numeric values only
+    value_size: int = 0
+    # Added delay of every response (seconds)
+    latency: float = 0.0
+    # Share of requests answered with error_status
+    error_rate: float = 0.0
+    error_status: int = 503
+    # Retry-After header sent with injected errors, if set
+    retry_after: int | None = None
+    # Send ETag headers and answer If-None-Match with 304
+    etag: bool = False
+    # Interval of shared attribute updates pushed to long-polls (seconds),
+    # shorter than the long-poll timeout
+    push_interval: float | None = None
+    # Interval of RPC requests sent to RPC long-polls (seconds), shorter than
+    # the long-poll timeout
+    rpc_interval: float | None = None
+
+
+@dataclass
+class StubDevice:
+    """Attributes and pending pushes of one access token."""
+
+    client: dict[str, Any]
+    shared: dict[str, Any]
+    version: int = 0
+    updates: asyncio.Queue[dict[str, Any]] = field(default_factory=asyncio.Queue)
+    rpc_ids: int = 0
+
+
+class ThingsBoardStub:
+    """In-memory ThingsBoard device API."""
+
+    def __init__(self, config: StubConfig, seed: int = 0) -> None:
+        """Initialize the stub."""
+        self.config = config
+        self.devices: dict[str, StubDevice] = {}
+        self.requests: Counter[str] = Counter()
+        self.telemetry_points = 0
+        self.rpc_replies: dict[int, Any] = {}
+        self._random = random.Random(seed)
+
+        self.app = web.Application(middlewares=[self._middleware])
+        self.app.router.add_get("/api/v1/{token}/attributes", self._get_attributes)
+        self.app.router.add_post("/api/v1/{token}/attributes", self._post_attributes)
+        self.app.router.add_get(
+            "/api/v1/{token}/attributes/updates", self._get_attribute_updates
+        )
+        self.app.router.add_post("/api/v1/{token}/telemetry", self._post_telemetry)
+        self.app.router.add_get("/api/v1/{token}/rpc", self._get_rpc)
+        self.app.router.add_post("/api/v1/{token}/rpc/{request_id}", self._post_rpc)
+
+    def _value(self, index: int) -> Any:
+        """Return a random attribute value."""
+        if self.config.value_size and index % 2:
+            return "".join(
+                self._random.choices(string.ascii_letters, k=self.config.value_size)
+            )
+        return round(self._random.uniform(0, 100), 2)
+
+    def device(self, token: str) -> StubDevice:
+        """Return the device of a token, creating its attributes on first use."""
+        if (device := self.devices.get(token)) is None:
+            half = self.config.keys // 2
+            device = self.devices[token] = StubDevice(
+                client={
+                    f"c{i}": self._value(i) for i in range(self.config.keys - half)
+                },
+                shared={f"s{i}": self._value(i) for i in range(half)},
+            )
+        return device
+
+    def mutate(self, fraction: float) -> int:
+        """Change a fraction of the attributes of every device.
+
+        Returns the number of changed attributes.
+        """
+        changed = 0
+        for device in self.devices.values():
+            for scope in (device.client, device.shared):
+                count = round(len(scope) * fraction)
+                for key in self._random.sample(sorted(scope), count):
+                    scope[key] = self._value(int(key[1:]))
+                    device.version += 1
+                changed += count
+        return changed
+
+    def push(self, token: str, updates: dict[str, Any]) -> None:
+        """Change shared attributes and notify the long-poll of a device."""
+        device = self.device(token)
+        device.shared.update(updates)
+        device.version += 1
+        device.updates.put_nowait(updates)
+
+    @web.middleware
+    async def _middleware(
+        self, request: web.Request, handler: Any
+    ) -> web.StreamResponse:
+        """Count requests and inject latency and errors."""
+        route = request.match_info.route.resource
+        self.requests[
+            f"{request.method} {route.canonical if route else request.path}"
+        ] += 1
+
+        if self.config.latency:
+            await asyncio.sleep(self.config.latency)
+
+        if self.config.error_rate and self._random.random() < self.config.error_rate:
+            headers = {}
+            if self.config.retry_after is not None:
+                headers["Retry-After"] = str(self.config.retry_after)
+            return web.Response(status=self.config.error_status, headers=headers)
+
+        return await handler(request)
+
+    async def _get_attributes(self, request: web.Request) -> web.Response:
+        """Return the client and shared attributes of a device."""
+        device = self.device(request.match_info["token"])
+        client, shared = device.client, device.shared
+
+        if "clientKeys" in request.query or "sharedKeys" in request.query:
+            client_keys = set(
+                filter(None, request.query.get("clientKeys", "").split(","))
+            )
+            shared_keys = set(
+                filter(None, request.query.get("sharedKeys", "").split(","))
+            )
+            client = {key: value for key, value in client.items() if key in client_keys}
+            shared = {key: value for key, value in shared.items() if key in shared_keys}
+
+        headers = {}
+        if self.config.etag:
+            etag = f'"{device.version}"'
+            if request.headers.get("If-None-Match") == etag:
+                return web.Response(status=304, headers={"ETag": etag})
+            headers["ETag"] = etag
+
+        return web.json_response({"client": client, "shared": shared}, headers=headers)
+
+    async def _post_attributes(self, request: web.Request) -> web.Response:
+        """Store attributes sent by the device."""
+        device = self.device(request.match_info["token"])
+        device.shared.update(await request.json())
+        device.version += 1
+        return web.Response()
+
+    async def _long_poll(
+        self, request: web.Request, interval: float | None, produce: Any
+    ) -> web.Response:
+        """Hold a request until there is something to send or it times out."""
+        timeout = int(request.query.get("timeout", "60000")) / 1000
+        device = self.device(request.match_info["token"])
+
+        try:
+            payload = await asyncio.wait_for(produce(device, interval), timeout)
+        except TimeoutError:
+            return web.Response(status=408)
+        return web.json_response(payload)
+
+    async def _get_attribute_updates(self, request: web.Request) -> web.Response:
+        """Long-poll shared attribute updates."""
+
+        async def produce(device: StubDevice, interval: float | None) -> dict[str, Any]:
+            if interval is not None and device.updates.empty() and device.shared:
+                await asyncio.sleep(interval)
+                key = self._random.choice(sorted(device.shared))
+                device.shared[key] = self._value(int(key[1:]))
+                device.version += 1
+                return {key: device.shared[key]}
+            return await device.updates.get()
+
+        return await self._long_poll(request, self.config.push_interval, produce)
+
+    async def _post_telemetry(self, request: web.Request) -> web.Response:
+        """Accept telemetry points."""
+        points = await request.json()
+        self.telemetry_points += len(points) if isinstance(points, list) else 1
+        return web.Response()
+
+    async def _get_rpc(self, request: web.Request) -> web.Response:
+        """Long-poll RPC requests."""
+
+        async def produce(device: StubDevice, interval: float | None) -> dict[str, Any]:
+            if interval is None:
+                await asyncio.Event().wait()
+            await asyncio.sleep(interval)
+            device.rpc_ids += 1
+            return {"id": device.rpc_ids, "method": "ping", "params": {}}
+
+        return await self._long_poll(request, self.config.rpc_interval, produce)
+
+    async def _post_rpc(self, request: web.Request) -> web.Response:
+        """Accept an RPC response."""
+        self.rpc_replies[int(request.match_info["request_id"])] = await request.json()
+        return web.Response()
+
+    async def async_start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving and return the base URL."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{self._runner.addresses[0][1]}"
+
+    async def async_stop(self) -> None:
+        """Stop serving."""
+        await self._runner.cleanup()
+
+
+def main() -> None:
+    """Serve the stub until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--keys", type=int, default=StubConfig.keys)
+    parser.add_argument("--value-size", type=int, default=StubConfig.value_size)
+    parser.add_argument("--latency", type=float, default=StubConfig.latency)
+    parser.add_argument("--error-rate", type=float, default=StubConfig.error_rate)
+    parser.add_argument("--error-status", type=int, default=StubConfig.error_status)
+    parser.add_argument("--retry-after", type=int)
+    parser.add_argument("--etag", action="store_true")
+    parser.add_argument("--push-interval", type=float)
+    parser.add_argument("--rpc-interval", type=float)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        keys=args.keys,
+        value_size=args.value_size,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        etag=args.etag,
+        push_interval=args.push_interval,
+        rpc_interval=args.rpc_interval,
+    )
+
+    async def serve() -> None:
+        stub = ThingsBoardStub(config)
+        url = await stub.async_start(args.host, args.port)
+        print(f"ThingsBoard stub listening on {url}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await stub.async_stop()
+            print(json.dumps(stub.requests, indent=2))
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,62 @@
 
 from __future__ import annotations
 
+import asyncio
+from datetime import timedelta
 import logging
+import os
+import time
+from typing import Any
 
 import voluptuous as vol
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME, Platform
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+)
 import homeassistant.helpers.config_validation as cv
+import homeassistant.helpers.device_registry as dr
+from homeassistant.util import dt as dt_util
 
-from .const import DOMAIN
-from .coordinator import ThingsBoardDataUpdateCoordinator
+from .const import (
+    CONF_EXPORT_ENTITIES,
+    CONF_GATEWAY,
+    CONF_LONG_POLL,
+    CONF_OFFLINE_SPOOL,
+    CONF_RPC,
+    CONF_RPC_SERVICES,
+    CONF_RPC_TIMEOUT,
+    CONF_RPC_WORKERS,
+    CONF_TELEMETRY_FLUSH_INTERVAL,
+    CONF_TELEMETRY_FLUSH_SIZE,
+    CONF_TELEMETRY_WINDOW,
+    DEFAULT_BULK_CONCURRENCY,
+    DEFAULT_GATEWAY,
+    DEFAULT_LONG_POLL,
+    DEFAULT_OFFLINE_SPOOL,
+    DEFAULT_RPC,
+    DEFAULT_RPC_TIMEOUT,
+    DEFAULT_RPC_WORKERS,
+    DEFAULT_TELEMETRY_FLUSH_INTERVAL,
+    DEFAULT_TELEMETRY_FLUSH_SIZE,
+    DEFAULT_TELEMETRY_WINDOW,
+    DOMAIN,
+    SPOOL_MAX_AGE,
+    SPOOL_MAX_ROWS,
+    SPOOL_REPLAY_BATCH_SIZE,
+    TELEMETRY_QUEUE_SIZE,
+)
+from .backfill import StatisticsBackfill, backfill_store, hour_start
+from .coordinator import ThingsBoardDataUpdateCoordinator, snapshot_store
+from .gateway import Gateway
+from .rest import TenantClient
+from .rpc import RpcDispatcher
+from .spool import OfflineSpool, spool_path
+from .telemetry import TelemetryUploader
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -21,10 +66,14 @@ PLATFORMS: list[Platform] = [Platform.SENSOR, Platform.NUMBER]
 # Service schemas
 SERVICE_SET_ATTRIBUTE = "set_attribute"
 SERVICE_SET_ATTRIBUTES = "set_attributes"
+SERVICE_RPC_REPLY = "rpc_reply"
+SERVICE_SET_ATTRIBUTES_BULK = "set_attributes_bulk"
+SERVICE_BACKFILL_STATISTICS = "backfill_statistics"
 
 SERVICE_SET_ATTRIBUTE_SCHEMA = vol.Schema(
     {
         vol.Required("config_entry_id"): cv.string,
+        vol.Optional("device_id"): cv.string,
         vol.Required("attribute_key"): cv.string,
         vol.Required("value"): vol.Any(str, int, float, bool),
     }
@@ -33,22 +82,250 @@ SERVICE_SET_ATTRIBUTE_SCHEMA = vol.Schema(
 SERVICE_SET_ATTRIBUTES_SCHEMA = vol.Schema(
     {
         vol.Required("config_entry_id"): cv.string,
+        vol.Optional("device_id"): cv.string,
         vol.Required("attributes"): dict,
     }
 )
 
+SERVICE_RPC_REPLY_SCHEMA = vol.Schema(
+    {
+        vol.Required("config_entry_id"): cv.string,
+        vol.Optional("device_id"): cv.string,
+        vol.Required("request_id"): vol.Coerce(int),
+        vol.Required("response"): object,
+    }
+)
+
+
+SERVICE_SET_ATTRIBUTES_BULK_SCHEMA = vol.Schema(
+    {
+        vol.Required("targets"): vol.All(
+            cv.ensure_list,
+            [
+                vol.Schema(
+                    {
+                        vol.Required("config_entry_id"): cv.string,
+                        vol.Optional("device_id"): cv.string,
+                        vol.Required("attributes"): dict,
+                    }
+                )
+            ],
+        ),
+        vol.Optional("max_concurrency", default=DEFAULT_BULK_CONCURRENCY): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=256)
+        ),
+    }
+)
+
+SERVICE_BACKFILL_STATISTICS_SCHEMA = vol.Schema(
+    {
+        vol.Required("config_entry_id"): cv.string,
+        vol.Required("thingsboard_device_id"): cv.string,
+        vol.Required("keys"): vol.All(cv.ensure_list, [cv.string]),
+        vol.Required("start"): cv.datetime,
+        vol.Optional("end"): cv.datetime,
+        vol.Optional("unit_of_measurement"): cv.string,
+    }
+)
+
+
+def _find_device_id(
+    hass: HomeAssistant,
+    coordinator: ThingsBoardDataUpdateCoordinator,
+    device_id: str | None,
+) -> str:
+    """Map a Home Assistant device ID to the ThingsBoard device of an entry.
+
+    Raises ValueError if there is no such device.
+    """
+    if device_id is None:
+        if coordinator.is_hub:
+            raise ValueError("A device_id is required for ThingsBoard hub entries")
+        return coordinator.entry.entry_id
+
+    if (device := dr.async_get(hass).async_get(device_id)) is not None:
+        for domain, identifier in device.identifiers:
+            if domain == DOMAIN and identifier in coordinator.devices:
+                return identifier
+
+    raise ValueError(f"Device {device_id} not found")
+
+
+def _resolve_device_id(
+    hass: HomeAssistant,
+    coordinator: ThingsBoardDataUpdateCoordinator,
+    device_id: str | None,
+) -> str | None:
+    """Map a Home Assistant device ID to a ThingsBoard device, logging errors."""
+    try:
+        return _find_device_id(hass, coordinator, device_id)
+    except ValueError as err:
+        _LOGGER.error("%s", err)
+        return None
+
+
+async def _async_write_target(
+    hass: HomeAssistant, target: dict[str, Any], semaphore: asyncio.Semaphore
+) -> dict[str, Any]:
+    """Write the attributes of one bulk target and return its result."""
+    result: dict[str, Any] = {
+        "config_entry_id": target["config_entry_id"],
+        "device_id": target.get("device_id"),
+        "success": False,
+        "latency": None,
+        "error": None,
+    }
+
+    coordinator: ThingsBoardDataUpdateCoordinator | None = hass.data.get(
+        DOMAIN, {}
+    ).get(target["config_entry_id"])
+    if coordinator is None:
+        result["error"] = f"Config entry {target['config_entry_id']} not found"
+        return result
+
+    try:
+        device_id = _find_device_id(hass, coordinator, target.get("device_id"))
+    except ValueError as err:
+        result["error"] = str(err)
+        return result
+
+    async with semaphore:
+        start = time.monotonic()
+        success = await coordinator.async_set_shared_attributes(
+            target["attributes"], device_id, immediate=True
+        )
+        result["latency"] = round(time.monotonic() - start, 3)
+
+    result["success"] = success
+    if not success:
+        result["error"] = "Write failed"
+    return result
+
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up ThingsBoard from a config entry."""
     coordinator = ThingsBoardDataUpdateCoordinator(hass, entry)
+    # Unloading tears the entry down in async_unload_entry, this only covers
+    # a failed setup
+    entry.async_on_unload(coordinator.async_close)
+    if not coordinator.uses_mqtt:
+        entry.async_on_unload(
+            coordinator.transport.async_add_open_listener(
+                coordinator.async_host_unavailable
+            )
+        )
+
+    # Keep writes on disk while ThingsBoard is unreachable
+    if entry.options.get(CONF_OFFLINE_SPOOL, DEFAULT_OFFLINE_SPOOL):
+        coordinator.spool = OfflineSpool(
+            hass,
+            coordinator,
+            spool_path(hass, entry.entry_id),
+            SPOOL_MAX_ROWS,
+            SPOOL_MAX_AGE,
+            SPOOL_REPLAY_BATCH_SIZE,
+        )
+        await coordinator.spool.async_setup()
+
+    # Handle server-side RPC requests, set up before MQTT subscribes to them
+    if entry.options.get(CONF_RPC, DEFAULT_RPC):
+        coordinator.rpc = RpcDispatcher(
+            hass,
+            coordinator,
+            entry.options.get(CONF_RPC_WORKERS, DEFAULT_RPC_WORKERS),
+            entry.options.get(CONF_RPC_TIMEOUT, DEFAULT_RPC_TIMEOUT),
+            entry.options.get(CONF_RPC_SERVICES, []),
+        )
+        entry.async_on_unload(coordinator.rpc.async_stop)
+
+    # Publish Home Assistant devices through the gateway API of the token,
+    # set up before MQTT subscribes to gateway attribute updates
+    if (
+        entry.data.get(CONF_GATEWAY, DEFAULT_GATEWAY)
+        and (mqtt := next(iter(coordinator.devices.values())).mqtt) is not None
+    ):
+        coordinator.gateway = Gateway(hass, coordinator, mqtt)
+        coordinator.gateway.async_start()
+
+    # Import historical telemetry through the REST API of the tenant
+    if entry.data.get(CONF_USERNAME) and entry.data.get(CONF_PASSWORD):
+        coordinator.backfill = StatisticsBackfill(
+            hass,
+            coordinator,
+            TenantClient(
+                hass,
+                coordinator.transport,
+                entry.data[CONF_USERNAME],
+                entry.data[CONF_PASSWORD],
+            ),
+        )
+        await coordinator.backfill.async_load()
+
+    # Connect before the first refresh, which requests the attributes over MQTT
+    if coordinator.uses_mqtt:
+        coordinator.async_connect_mqtt()
 
-    await coordinator.async_config_entry_first_refresh()
+    # Start from the attributes of the last run, without waiting for ThingsBoard
+    restored = await coordinator.async_restore_snapshot()
+    if not restored:
+        await coordinator.async_config_entry_first_refresh()
 
     hass.data.setdefault(DOMAIN, {})
     hass.data[DOMAIN][entry.entry_id] = coordinator
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
+    if restored:
+        entry.async_create_background_task(
+            hass, coordinator.async_refresh(), f"{DOMAIN}_first_refresh"
+        )
+
+    # Push shared attribute changes instead of waiting for the next poll.
+    # Hub entries default to polling so they don't hold a connection per device.
+    # MQTT connections push updates on their own.
+    if not coordinator.uses_mqtt and entry.options.get(
+        CONF_LONG_POLL, DEFAULT_LONG_POLL and not coordinator.is_hub
+    ):
+        coordinator.async_start_subscription()
+
+    if coordinator.rpc is not None:
+        coordinator.rpc.async_start()
+
+    # Continue backfills interrupted by the last shutdown
+    if coordinator.backfill is not None and "recorder" in hass.config.components:
+        coordinator.backfill.async_resume()
+
+    # Send state changes of exported entities to ThingsBoard
+    export_entities = entry.options.get(CONF_EXPORT_ENTITIES)
+    telemetry_device = coordinator.telemetry_device
+    if export_entities and telemetry_device is None:
+        # Hub entries have to choose the device receiving the telemetry
+        _LOGGER.error(
+            "Not exporting telemetry of %s, select the receiving device in the"
+            " options first",
+            entry.title,
+        )
+    elif export_entities and telemetry_device is not None:
+        window = entry.options.get(CONF_TELEMETRY_WINDOW, DEFAULT_TELEMETRY_WINDOW)
+        coordinator.telemetry_uploader = TelemetryUploader(
+            hass,
+            telemetry_device,
+            export_entities,
+            entry.options.get(CONF_TELEMETRY_FLUSH_SIZE, DEFAULT_TELEMETRY_FLUSH_SIZE),
+            timedelta(
+                seconds=entry.options.get(
+                    CONF_TELEMETRY_FLUSH_INTERVAL, DEFAULT_TELEMETRY_FLUSH_INTERVAL
+                )
+            ),
+            TELEMETRY_QUEUE_SIZE,
+            coordinator.gateway,
+            timedelta(seconds=window) if window else None,
+        )
+        coordinator.telemetry_uploader.async_start()
+
+    # Reload the entry when its options change
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
+
     # Register services
     async def handle_set_attribute(call: ServiceCall) -> None:
         """Handle the set_attribute service call."""
@@ -63,7 +340,11 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         coordinator: ThingsBoardDataUpdateCoordinator = hass.data[DOMAIN][
             config_entry_id
         ]
-        await coordinator.async_set_shared_attributes({attribute_key: value})
+        device_id = _resolve_device_id(hass, coordinator, call.data.get("device_id"))
+        if device_id is None:
+            return
+
+        await coordinator.async_set_shared_attributes({attribute_key: value}, device_id)
 
     async def handle_set_attributes(call: ServiceCall) -> None:
         """Handle the set_attributes service call."""
@@ -77,7 +358,91 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         coordinator: ThingsBoardDataUpdateCoordinator = hass.data[DOMAIN][
             config_entry_id
         ]
-        await coordinator.async_set_shared_attributes(attributes)
+        device_id = _resolve_device_id(hass, coordinator, call.data.get("device_id"))
+        if device_id is None:
+            return
+
+        await coordinator.async_set_shared_attributes(attributes, device_id)
+
+    async def handle_rpc_reply(call: ServiceCall) -> None:
+        """Handle the rpc_reply service call."""
+        config_entry_id = call.data["config_entry_id"]
+
+        if config_entry_id not in hass.data[DOMAIN]:
+            _LOGGER.error("Config entry %s not found", config_entry_id)
+            return
+
+        coordinator: ThingsBoardDataUpdateCoordinator = hass.data[DOMAIN][
+            config_entry_id
+        ]
+        if coordinator.rpc is None:
+            _LOGGER.error("RPC handling is disabled for %s", config_entry_id)
+            return
+
+        device_id = _resolve_device_id(hass, coordinator, call.data.get("device_id"))
+        if device_id is None:
+            return
+
+        await coordinator.rpc.async_reply(
+            coordinator.devices[device_id],
+            call.data["request_id"],
+            call.data["response"],
+        )
+
+    async def handle_set_attributes_bulk(call: ServiceCall) -> ServiceResponse:
+        """Handle the set_attributes_bulk service call."""
+        # Entries of the same host share its transport and connection pool
+        semaphore = asyncio.Semaphore(call.data["max_concurrency"])
+        results = await asyncio.gather(
+            *(
+                _async_write_target(hass, target, semaphore)
+                for target in call.data["targets"]
+            )
+        )
+
+        failed = sum(not result["success"] for result in results)
+        if failed:
+            _LOGGER.warning(
+                "%s of %s bulk attribute write(s) failed", failed, len(results)
+            )
+        return {"results": list(results)}
+
+    async def handle_backfill_statistics(call: ServiceCall) -> None:
+        """Handle the backfill_statistics service call."""
+        config_entry_id = call.data["config_entry_id"]
+
+        if config_entry_id not in hass.data[DOMAIN]:
+            _LOGGER.error("Config entry %s not found", config_entry_id)
+            return
+
+        coordinator: ThingsBoardDataUpdateCoordinator = hass.data[DOMAIN][
+            config_entry_id
+        ]
+        if coordinator.backfill is None:
+            _LOGGER.error(
+                "Backfilling requires tenant credentials for %s", config_entry_id
+            )
+            return
+        if "recorder" not in hass.config.components:
+            _LOGGER.error("Backfilling requires the recorder")
+            return
+
+        # Only complete hours are imported
+        now = dt_util.utcnow()
+        start = hour_start(call.data["start"])
+        end = hour_start(min(dt_util.as_utc(call.data.get("end", now)), now))
+        if start >= end:
+            _LOGGER.error("The backfill range has to span at least one full hour")
+            return
+
+        for key in call.data["keys"]:
+            coordinator.backfill.async_add_job(
+                call.data["thingsboard_device_id"],
+                key,
+                start,
+                end,
+                call.data.get("unit_of_measurement"),
+            )
 
     # Register services only once for the domain
     if not hass.services.has_service(DOMAIN, SERVICE_SET_ATTRIBUTE):
@@ -96,18 +461,59 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             schema=SERVICE_SET_ATTRIBUTES_SCHEMA,
         )
 
+    if not hass.services.has_service(DOMAIN, SERVICE_RPC_REPLY):
+        hass.services.async_register(
+            DOMAIN,
+            SERVICE_RPC_REPLY,
+            handle_rpc_reply,
+            schema=SERVICE_RPC_REPLY_SCHEMA,
+        )
+
+    if not hass.services.has_service(DOMAIN, SERVICE_SET_ATTRIBUTES_BULK):
+        hass.services.async_register(
+            DOMAIN,
+            SERVICE_SET_ATTRIBUTES_BULK,
+            handle_set_attributes_bulk,
+            schema=SERVICE_SET_ATTRIBUTES_BULK_SCHEMA,
+            supports_response=SupportsResponse.OPTIONAL,
+        )
+
+    if not hass.services.has_service(DOMAIN, SERVICE_BACKFILL_STATISTICS):
+        hass.services.async_register(
+            DOMAIN,
+            SERVICE_BACKFILL_STATISTICS,
+            handle_backfill_statistics,
+            schema=SERVICE_BACKFILL_STATISTICS_SCHEMA,
+        )
+
     return True
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     if unload_ok := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
-        hass.data[DOMAIN].pop(entry.entry_id)
+        coordinator: ThingsBoardDataUpdateCoordinator = hass.data[DOMAIN].pop(
+            entry.entry_id
+        )
+        for entities in coordinator.entities.values():
+            entities.clear()
+        # Before the background tasks of the entry, including the MQTT
+        # connections, are cancelled
+        await coordinator.async_close()
 
     return unload_ok
 
 
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the snapshot, backfill progress and spool of a deleted entry."""
+    await snapshot_store(hass, entry.entry_id).async_remove()
+    await backfill_store(hass, entry.entry_id).async_remove()
+
+    path = spool_path(hass, entry.entry_id)
+    if await hass.async_add_executor_job(os.path.exists, path):
+        await hass.async_add_executor_job(os.remove, path)
+
+
 async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """Reload config entry."""
-    await async_unload_entry(hass, entry)
-    await async_setup_entry(hass, entry)
+    await hass.config_entries.async_reload(entry.entry_id)
@@ -0,0 +1,292 @@
+"""Backfill of ThingsBoard timeseries into Home Assistant statistics."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+from dataclasses import asdict, dataclass
+from datetime import datetime
+import logging
+import math
+from typing import TYPE_CHECKING, Any
+
+import aiohttp
+
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import async_add_external_statistics
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.update_coordinator import UpdateFailed
+from homeassistant.util import dt as dt_util, slugify
+
+from .const import (
+    BACKFILL_CONCURRENCY,
+    BACKFILL_PAGE_SIZE,
+    BACKFILL_SAVE_DELAY,
+    BACKFILL_STORAGE_VERSION,
+    BACKFILL_WINDOW,
+    DOMAIN,
+)
+from .rest import RestApiError, TenantClient
+
+try:
+    from homeassistant.components.recorder.models import StatisticMeanType
+except ImportError:  # Home Assistant before 2025.4
+    StatisticMeanType = None
+
+if TYPE_CHECKING:
+    from .coordinator import ThingsBoardDataUpdateCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+HOUR_MS = 3600 * 1000
+
+
+def backfill_store(hass: HomeAssistant, entry_id: str) -> Store[dict[str, Any]]:
+    """Return the store of the backfill progress of a config entry."""
+    return Store(hass, BACKFILL_STORAGE_VERSION, f"{DOMAIN}.{entry_id}.backfill")
+
+
+def hour_start(value: datetime) -> int:
+    """Return the start of the hour of a time in ms, naive times are local."""
+    ts = int(dt_util.as_utc(value).timestamp() * 1000)
+    return ts - ts % HOUR_MS
+
+
+def _format_ms(ts: int) -> str:
+    """Format a timestamp in ms for log messages."""
+    return dt_util.utc_from_timestamp(ts / 1000).isoformat()
+
+
+class HourlyAggregate:
+    """Mean, minimum and maximum of the values of each hour."""
+
+    __slots__ = ("_hours",)
+
+    def __init__(self) -> None:
+        """Initialize the aggregate."""
+        # Start of the hour in ms: [count, sum, min, max]
+        self._hours: dict[int, list[float]] = {}
+
+    def add(self, ts: int, value: float) -> None:
+        """Add a value measured at a timestamp in ms."""
+        hour = ts - ts % HOUR_MS
+        if (bucket := self._hours.get(hour)) is None:
+            self._hours[hour] = [1, value, value, value]
+            return
+
+        bucket[0] += 1
+        bucket[1] += value
+        if value < bucket[2]:
+            bucket[2] = value
+        elif value > bucket[3]:
+            bucket[3] = value
+
+    def statistics(self) -> list[StatisticData]:
+        """Return the statistics of all hours, oldest first."""
+        return [
+            StatisticData(
+                start=dt_util.utc_from_timestamp(hour / 1000),
+                mean=total / count,
+                min=low,
+                max=high,
+            )
+            for hour, (count, total, low, high) in sorted(self._hours.items())
+        ]
+
+
+@dataclass(slots=True)
+class BackfillJob:
+    """Backfill of one timeseries key, with its progress."""
+
+    # ThingsBoard device ID (UUID)
+    device: str
+    key: str
+    # Hour-aligned time range [start, end) in ms
+    start: int
+    end: int
+    # Statistics are imported up to this time (ms)
+    done: int
+    unit_of_measurement: str | None = None
+
+    @property
+    def job_id(self) -> str:
+        """Return the ID of the job, repeated requests continue the same job."""
+        return f"{self.device}:{self.key}:{self.start}"
+
+    @property
+    def statistic_id(self) -> str:
+        """Return the ID of the external statistic, e.g. "thingsboard:<device>_temp"."""
+        return f"{DOMAIN}:{slugify(self.device)}_{slugify(self.key)}"
+
+
+class StatisticsBackfill:
+    """Import ThingsBoard timeseries as hourly external statistics.
+
+    Every key is fetched in windows of whole hours, page by page, and each
+    window is aggregated and imported before the next one is fetched, so
+    memory stays bounded by one page. Only a few keys are backfilled at a
+    time. The progress is saved after every window, so interrupted jobs
+    continue where they stopped, also after a restart.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        coordinator: ThingsBoardDataUpdateCoordinator,
+        client: TenantClient,
+    ) -> None:
+        """Initialize the backfill."""
+        self.hass = hass
+        self.coordinator = coordinator
+        self.client = client
+
+        self.jobs: dict[str, BackfillJob] = {}
+        self._store = backfill_store(hass, coordinator.entry.entry_id)
+        self._running: set[str] = set()
+        self._semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+
+        # Counters
+        self.fetched_points = 0
+        self.imported_hours = 0
+
+    async def async_load(self) -> None:
+        """Load the jobs that did not finish."""
+        stored = await self._store.async_load() or {}
+        for data in stored.get("jobs", []):
+            job = BackfillJob(**data)
+            self.jobs[job.job_id] = job
+
+    @callback
+    def async_resume(self) -> None:
+        """Continue all unfinished jobs."""
+        for job in list(self.jobs.values()):
+            self._async_start(job)
+
+    @callback
+    def async_add_job(
+        self,
+        device: str,
+        key: str,
+        start: int,
+        end: int,
+        unit_of_measurement: str | None = None,
+    ) -> None:
+        """Backfill a key, continuing an earlier job with the same start."""
+        job = BackfillJob(device, key, start, end, start, unit_of_measurement)
+        if (existing := self.jobs.get(job.job_id)) is not None:
+            existing.end = max(existing.end, end)
+            job = existing
+        else:
+            self.jobs[job.job_id] = job
+
+        self._async_save()
+        self._async_start(job)
+
+    @callback
+    def _async_start(self, job: BackfillJob) -> None:
+        """Run a job in the background, unless it is running already."""
+        if job.job_id in self._running:
+            return
+
+        self._running.add(job.job_id)
+        self.coordinator.entry.async_create_background_task(
+            self.hass, self._async_run(job), f"{DOMAIN}_backfill_{job.job_id}"
+        )
+
+    async def _async_run(self, job: BackfillJob) -> None:
+        """Run a job, keeping it for later if ThingsBoard fails."""
+        try:
+            async with self._semaphore:
+                await self._async_backfill(job)
+        except (
+            aiohttp.ClientError,
+            TimeoutError,
+            ValueError,
+            RestApiError,
+            UpdateFailed,
+        ) as err:
+            _LOGGER.warning(
+                "Backfill of %s paused at %s, it continues after a restart"
+                " or when requested again: %s",
+                job.key,
+                _format_ms(job.done),
+                err,
+            )
+            return
+        finally:
+            self._running.discard(job.job_id)
+
+        del self.jobs[job.job_id]
+        self._async_save()
+        _LOGGER.info(
+            "Backfilled %s from %s to %s",
+            job.key,
+            _format_ms(job.start),
+            _format_ms(job.end),
+        )
+
+    async def _async_backfill(self, job: BackfillJob) -> None:
+        """Import the statistics of a job window by window."""
+        metadata = StatisticMetaData(
+            has_sum=False,
+            name=f"{job.key} ({job.device})",
+            source=DOMAIN,
+            statistic_id=job.statistic_id,
+            unit_of_measurement=job.unit_of_measurement,
+        )
+        if StatisticMeanType is None:
+            metadata["has_mean"] = True
+        else:
+            metadata["mean_type"] = StatisticMeanType.ARITHMETIC
+        if "unit_class" in StatisticMetaData.__annotations__:
+            # No unit conversion for imported ThingsBoard values
+            metadata["unit_class"] = None
+        window = int(BACKFILL_WINDOW.total_seconds() * 1000)
+
+        # The end moves if the job is requested again while it runs
+        while job.done < job.end:
+            end = min(job.done + window, job.end)
+            aggregate = HourlyAggregate()
+            async for points in self._async_pages(job, job.done, end):
+                for point in points:
+                    try:
+                        value = float(point["value"])
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    if math.isfinite(value):
+                        aggregate.add(int(point["ts"]), value)
+
+            if statistics := aggregate.statistics():
+                async_add_external_statistics(self.hass, metadata, statistics)
+                self.imported_hours += len(statistics)
+
+            job.done = end
+            self._async_save()
+
+    async def _async_pages(
+        self, job: BackfillJob, start: int, end: int
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        """Yield the points of a key in [start, end), one page at a time."""
+        while start < end:
+            points = await self.client.async_get_timeseries(
+                job.device, job.key, start, end, BACKFILL_PAGE_SIZE
+            )
+            self.fetched_points += len(points)
+            # The end of a ThingsBoard query is inclusive, points at the end
+            # belong to the next window
+            yield [point for point in points if int(point["ts"]) < end]
+
+            if len(points) < BACKFILL_PAGE_SIZE:
+                return
+            start = int(points[-1]["ts"]) + 1
+
+    @callback
+    def _async_save(self) -> None:
+        """Save the progress, coalescing frequent saves."""
+        self._store.async_delay_save(self._data, BACKFILL_SAVE_DELAY)
+
+    @callback
+    def _data(self) -> dict[str, Any]:
+        """Return the progress to persist."""
+        return {"jobs": [asdict(job) for job in self.jobs.values()]}
@@ -2,49 +2,241 @@
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import logging
 from typing import Any
 
 import aiohttp
+from aiohttp import hdrs
+import aiomqtt
 import voluptuous as vol
 
 from homeassistant import config_entries
-from homeassistant.const import CONF_HOST
-from homeassistant.core import HomeAssistant
+from homeassistant.const import CONF_HOST, CONF_NAME, CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import FlowResult
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.selector import (
+    EntitySelector,
+    EntitySelectorConfig,
+    ObjectSelector,
+    SelectOptionDict,
+    SelectSelector,
+    SelectSelectorConfig,
+    SelectSelectorMode,
+    TextSelector,
+    TextSelectorConfig,
+    TextSelectorType,
+)
 
-from .const import CONF_ACCESS_TOKEN, DOMAIN
+from .const import (
+    CONF_ACCESS_TOKEN,
+    CONF_ACCESS_TOKENS,
+    CONF_DEVICES,
+    CONF_DIAGNOSTIC_SENSORS,
+    CONF_EXPORT_ENTITIES,
+    CONF_GATEWAY,
+    CONF_LONG_POLL,
+    CONF_LONG_POLL_TIMEOUT,
+    CONF_MAX_CONCURRENCY,
+    CONF_MAX_RESPONSE_SIZE,
+    CONF_MAX_SCAN_INTERVAL,
+    CONF_MIN_SCAN_INTERVAL,
+    CONF_MQTT_PORT,
+    CONF_MQTT_TLS,
+    CONF_OFFLINE_SPOOL,
+    CONF_PATH_SELECTORS,
+    CONF_RPC,
+    CONF_RPC_SERVICES,
+    CONF_RPC_TIMEOUT,
+    CONF_RPC_WORKERS,
+    CONF_TELEMETRY_DEVICE,
+    CONF_TELEMETRY_FLUSH_INTERVAL,
+    CONF_TELEMETRY_FLUSH_SIZE,
+    CONF_TELEMETRY_WINDOW,
+    CONF_TRACKED_KEYS,
+    CONF_TRANSPORT,
+    CONF_WRITE_DELAY,
+    CONF_WRITE_FILTERS,
+    DEFAULT_DIAGNOSTIC_SENSORS,
+    DEFAULT_GATEWAY,
+    DEFAULT_LONG_POLL,
+    DEFAULT_LONG_POLL_TIMEOUT,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_RESPONSE_SIZE,
+    DEFAULT_MAX_SCAN_INTERVAL,
+    DEFAULT_MIN_SCAN_INTERVAL,
+    DEFAULT_MQTT_PORT,
+    DEFAULT_MQTT_TLS,
+    DEFAULT_OFFLINE_SPOOL,
+    DEFAULT_RPC,
+    DEFAULT_RPC_TIMEOUT,
+    DEFAULT_RPC_WORKERS,
+    DEFAULT_TELEMETRY_FLUSH_INTERVAL,
+    DEFAULT_TELEMETRY_FLUSH_SIZE,
+    DEFAULT_TELEMETRY_WINDOW,
+    DEFAULT_WRITE_DELAY,
+    DOMAIN,
+    TRANSPORT_HTTP,
+    TRANSPORT_MQTT,
+    TRANSPORT_READ_TIMEOUT,
+)
+from .device import hub_device_id
+from .filters import parse_write_filters
+from .mqtt import async_check_mqtt_token
+from .paths import PathSelector
+from .rest import RestApiError, TenantAuthFailed, TenantClient
+from .transport import HostTransport, async_get_transport
 
 _LOGGER = logging.getLogger(__name__)
 
+TRANSPORT_SCHEMA = {
+    vol.Optional(CONF_TRANSPORT, default=TRANSPORT_HTTP): SelectSelector(
+        SelectSelectorConfig(
+            options=[TRANSPORT_HTTP, TRANSPORT_MQTT],
+            mode=SelectSelectorMode.LIST,
+            translation_key=CONF_TRANSPORT,
+        )
+    ),
+    vol.Optional(CONF_MQTT_PORT, default=DEFAULT_MQTT_PORT): vol.All(
+        vol.Coerce(int), vol.Range(min=1, max=65535)
+    ),
+    vol.Optional(CONF_MQTT_TLS, default=DEFAULT_MQTT_TLS): bool,
+}
+
+# Optional credentials of a tenant user for the REST API
+TENANT_SCHEMA = {
+    vol.Optional(CONF_USERNAME): str,
+    vol.Optional(CONF_PASSWORD): TextSelector(
+        TextSelectorConfig(type=TextSelectorType.PASSWORD)
+    ),
+}
+
 STEP_USER_DATA_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_HOST): str,
         vol.Required(CONF_ACCESS_TOKEN): str,
+        **TRANSPORT_SCHEMA,
+        vol.Optional(CONF_GATEWAY, default=DEFAULT_GATEWAY): bool,
+        **TENANT_SCHEMA,
     }
 )
 
+STEP_HUB_DATA_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_HOST): str,
+        vol.Required(CONF_ACCESS_TOKENS): TextSelector(
+            TextSelectorConfig(multiline=True)
+        ),
+        **TRANSPORT_SCHEMA,
+        **TENANT_SCHEMA,
+    }
+)
+
+
+def _normalize_host(host: str) -> str:
+    """Strip trailing slashes and ensure the host has a protocol."""
+    host = host.rstrip("/")
+    if not host.startswith(("http://", "https://")):
+        host = f"https://{host}"
+    return host
+
+
+def parse_devices(value: str) -> list[dict[str, str]]:
+    """Parse one device per line, either as "token" or as "name=token"."""
+    devices = []
+    for line in value.splitlines():
+        if not (line := line.strip()):
+            continue
+        name, _, token = line.rpartition("=")
+        device = {CONF_ACCESS_TOKEN: token.strip()}
+        if name.strip():
+            device[CONF_NAME] = name.strip()
+        devices.append(device)
+    return devices
+
+
+def _valid_selectors(selectors: list[str]) -> bool:
+    """Return True if all path selectors can be compiled."""
+    try:
+        for selector in selectors:
+            PathSelector.compile(selector)
+    except ValueError:
+        return False
+    return True
+
+
+def _valid_write_filters(config: Any) -> bool:
+    """Return True if the write filters are valid."""
+    try:
+        parse_write_filters(config)
+    except vol.Invalid:
+        return False
+    return True
+
 
 async def validate_input(hass: HomeAssistant, data: dict[str, Any]) -> dict[str, Any]:
     """Validate the user input allows us to connect.
 
     Data has the keys from STEP_USER_DATA_SCHEMA with values provided by the user.
     """
-    host = data[CONF_HOST].rstrip("/")
-    token = data[CONF_ACCESS_TOKEN]
+    host = _normalize_host(data[CONF_HOST])
 
-    # Ensure host has protocol
-    if not host.startswith(("http://", "https://")):
-        host = f"https://{host}"
+    transport = async_get_transport(hass, host)
+    try:
+        await _async_check_token(transport, data[CONF_ACCESS_TOKEN], data)
+        await _async_check_tenant(hass, transport, data)
+    finally:
+        await transport.async_release()
 
-    url = f"{host}/api/v1/{token}/attributes"
+    return {"title": f"ThingsBoard ({host})", "host": host}
 
-    session = async_get_clientsession(hass)
+
+async def validate_hub_input(
+    hass: HomeAssistant, data: dict[str, Any]
+) -> dict[str, Any]:
+    """Validate that every device token of a hub allows us to connect.
+
+    Data has the keys from STEP_HUB_DATA_SCHEMA with values provided by the user.
+    """
+    host = _normalize_host(data[CONF_HOST])
+    devices = parse_devices(data[CONF_ACCESS_TOKENS])
+    if not devices:
+        raise InvalidAuth
+
+    semaphore = asyncio.Semaphore(DEFAULT_MAX_CONCURRENCY)
+    transport = async_get_transport(hass, host)
+
+    async def check(device: dict[str, str]) -> None:
+        async with semaphore:
+            await _async_check_token(transport, device[CONF_ACCESS_TOKEN], data)
+
+    try:
+        await asyncio.gather(*(check(device) for device in devices))
+        await _async_check_tenant(hass, transport, data)
+    finally:
+        await transport.async_release()
+
+    return {
+        "title": f"ThingsBoard Hub ({host})",
+        "host": host,
+        "devices": devices,
+    }
+
+
+async def _async_check_token(
+    transport: HostTransport, token: str, data: dict[str, Any]
+) -> None:
+    """Check that a device access token can read its attributes."""
+    if data.get(CONF_TRANSPORT, TRANSPORT_HTTP) == TRANSPORT_MQTT:
+        await _async_check_mqtt_token(transport.host, token, data)
+        return
+
+    url = f"{transport.host}/api/v1/{token}/attributes"
 
     try:
-        async with session.get(
-            url, timeout=aiohttp.ClientTimeout(total=10)
+        async with transport.request(
+            hdrs.METH_GET, url, TRANSPORT_READ_TIMEOUT
         ) as response:
             if response.status == 401:
                 raise InvalidAuth
@@ -53,35 +245,92 @@ async def validate_input(hass: HomeAssistant, data: dict[str, Any]) -> dict[str,
             elif response.status >= 400:
                 raise CannotConnect
 
-            # Successfully connected
-            return {"title": f"ThingsBoard ({host})", "host": host}
-
     except aiohttp.ClientError as err:
         _LOGGER.error("Error connecting to ThingsBoard: %s", err)
         raise CannotConnect from err
+    except (CannotConnect, InvalidAuth):
+        raise
     except Exception as err:
         _LOGGER.exception("Unexpected exception: %s", err)
         raise CannotConnect from err
 
 
+async def _async_check_tenant(
+    hass: HomeAssistant, transport: HostTransport, data: dict[str, Any]
+) -> None:
+    """Check the tenant credentials, if any were given."""
+    if not (data.get(CONF_USERNAME) or data.get(CONF_PASSWORD)):
+        return
+
+    client = TenantClient(
+        hass, transport, data.get(CONF_USERNAME, ""), data.get(CONF_PASSWORD, "")
+    )
+    try:
+        await client.async_login()
+    except TenantAuthFailed as err:
+        raise InvalidTenantAuth from err
+    except (aiohttp.ClientError, TimeoutError, RestApiError) as err:
+        _LOGGER.error("Error logging in to ThingsBoard: %s", err)
+        raise CannotConnect from err
+
+
+async def _async_check_mqtt_token(host: str, token: str, data: dict[str, Any]) -> None:
+    """Check that a device access token can connect to the MQTT broker."""
+    try:
+        authorized = await async_check_mqtt_token(
+            host,
+            data.get(CONF_MQTT_PORT, DEFAULT_MQTT_PORT),
+            data.get(CONF_MQTT_TLS, DEFAULT_MQTT_TLS),
+            token,
+        )
+    except aiomqtt.MqttError as err:
+        _LOGGER.error("Error connecting to ThingsBoard MQTT: %s", err)
+        raise CannotConnect from err
+
+    if not authorized:
+        raise InvalidAuth
+
+
 class ThingsBoardConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for ThingsBoard."""
 
     VERSION = 1
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(
+        config_entry: config_entries.ConfigEntry,
+    ) -> ThingsBoardOptionsFlow:
+        """Get the options flow for this handler."""
+        return ThingsBoardOptionsFlow(config_entry)
+
     async def async_step_user(
         self, user_input: dict[str, Any] | None = None
     ) -> FlowResult:
         """Handle the initial step."""
+        return self.async_show_menu(step_id="user", menu_options=["device", "hub"])
+
+    async def async_step_device(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Handle the setup of a single device."""
         errors: dict[str, str] = {}
 
-        if user_input is not None:
+        if user_input is not None and (
+            user_input.get(CONF_GATEWAY)
+            and user_input.get(CONF_TRANSPORT) != TRANSPORT_MQTT
+        ):
+            # The gateway API is only available over MQTT
+            errors["base"] = "gateway_requires_mqtt"
+        elif user_input is not None:
             try:
                 info = await validate_input(self.hass, user_input)
             except CannotConnect:
                 errors["base"] = "cannot_connect"
             except InvalidAuth:
                 errors["base"] = "invalid_auth"
+            except InvalidTenantAuth:
+                errors["base"] = "invalid_tenant_auth"
             except Exception:  # pylint: disable=broad-except
                 _LOGGER.exception("Unexpected exception")
                 errors["base"] = "unknown"
@@ -98,7 +347,250 @@ class ThingsBoardConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 return self.async_create_entry(title=info["title"], data=user_input)
 
         return self.async_show_form(
-            step_id="user", data_schema=STEP_USER_DATA_SCHEMA, errors=errors
+            step_id="device", data_schema=STEP_USER_DATA_SCHEMA, errors=errors
+        )
+
+    async def async_step_hub(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Handle the setup of a hub managing many device tokens."""
+        errors: dict[str, str] = {}
+
+        if user_input is not None:
+            try:
+                info = await validate_hub_input(self.hass, user_input)
+            except CannotConnect:
+                errors["base"] = "cannot_connect"
+            except InvalidAuth:
+                errors["base"] = "invalid_auth"
+            except InvalidTenantAuth:
+                errors["base"] = "invalid_tenant_auth"
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Unexpected exception")
+                errors["base"] = "unknown"
+            else:
+                tokens = sorted(device[CONF_ACCESS_TOKEN] for device in info["devices"])
+                digest = hashlib.sha256("\n".join(tokens).encode()).hexdigest()
+
+                # Set unique ID to prevent duplicate entries
+                await self.async_set_unique_id(f"{info['host']}_hub_{digest[:12]}")
+                self._abort_if_unique_id_configured()
+
+                return self.async_create_entry(
+                    title=info["title"],
+                    data={
+                        CONF_HOST: info["host"],
+                        CONF_DEVICES: info["devices"],
+                        **{
+                            key: user_input[key]
+                            for key in (
+                                CONF_TRANSPORT,
+                                CONF_MQTT_PORT,
+                                CONF_MQTT_TLS,
+                                CONF_USERNAME,
+                                CONF_PASSWORD,
+                            )
+                            if key in user_input
+                        },
+                    },
+                )
+
+        return self.async_show_form(
+            step_id="hub", data_schema=STEP_HUB_DATA_SCHEMA, errors=errors
+        )
+
+
+class ThingsBoardOptionsFlow(config_entries.OptionsFlow):
+    """Handle ThingsBoard options."""
+
+    def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
+        """Initialize options flow."""
+        self._entry = config_entry
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Manage the options."""
+        errors: dict[str, str] = {}
+        if user_input is not None:
+            if user_input.get(
+                CONF_MIN_SCAN_INTERVAL, DEFAULT_MIN_SCAN_INTERVAL
+            ) > user_input.get(CONF_MAX_SCAN_INTERVAL, DEFAULT_MAX_SCAN_INTERVAL):
+                errors[CONF_MIN_SCAN_INTERVAL] = "invalid_scan_interval"
+            elif not _valid_selectors(user_input.get(CONF_PATH_SELECTORS, [])):
+                errors[CONF_PATH_SELECTORS] = "invalid_path_selector"
+            elif not _valid_write_filters(user_input.get(CONF_WRITE_FILTERS, {})):
+                errors[CONF_WRITE_FILTERS] = "invalid_write_filters"
+            elif (
+                user_input.get(CONF_EXPORT_ENTITIES)
+                and len(self._entry.data.get(CONF_DEVICES, [])) > 1
+                and not user_input.get(CONF_TELEMETRY_DEVICE)
+            ):
+                errors[CONF_TELEMETRY_DEVICE] = "telemetry_device_required"
+            else:
+                return self.async_create_entry(title="", data=user_input)
+
+        options = self._entry.options
+        is_hub = CONF_DEVICES in self._entry.data
+        data_schema = vol.Schema(
+            {
+                vol.Optional(
+                    CONF_LONG_POLL,
+                    default=options.get(
+                        CONF_LONG_POLL, DEFAULT_LONG_POLL and not is_hub
+                    ),
+                ): bool,
+                vol.Optional(
+                    CONF_LONG_POLL_TIMEOUT,
+                    default=options.get(
+                        CONF_LONG_POLL_TIMEOUT, DEFAULT_LONG_POLL_TIMEOUT
+                    ),
+                ): vol.All(vol.Coerce(int), vol.Range(min=5, max=600)),
+                vol.Optional(
+                    CONF_MIN_SCAN_INTERVAL,
+                    default=options.get(
+                        CONF_MIN_SCAN_INTERVAL, DEFAULT_MIN_SCAN_INTERVAL
+                    ),
+                ): vol.All(vol.Coerce(int), vol.Range(min=10, max=86400)),
+                vol.Optional(
+                    CONF_MAX_SCAN_INTERVAL,
+                    default=options.get(
+                        CONF_MAX_SCAN_INTERVAL, DEFAULT_MAX_SCAN_INTERVAL
+                    ),
+                ): vol.All(vol.Coerce(int), vol.Range(min=10, max=86400)),
+                vol.Optional(
+                    CONF_WRITE_DELAY,
+                    default=options.get(CONF_WRITE_DELAY, DEFAULT_WRITE_DELAY),
+                ): vol.All(vol.Coerce(float), vol.Range(min=0, max=10)),
+                vol.Optional(
+                    CONF_EXPORT_ENTITIES,
+                    default=options.get(CONF_EXPORT_ENTITIES, []),
+                ): EntitySelector(EntitySelectorConfig(multiple=True)),
+                vol.Optional(
+                    CONF_TELEMETRY_FLUSH_SIZE,
+                    default=options.get(
+                        CONF_TELEMETRY_FLUSH_SIZE, DEFAULT_TELEMETRY_FLUSH_SIZE
+                    ),
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=1000)),
+                vol.Optional(
+                    CONF_TELEMETRY_FLUSH_INTERVAL,
+                    default=options.get(
+                        CONF_TELEMETRY_FLUSH_INTERVAL,
+                        DEFAULT_TELEMETRY_FLUSH_INTERVAL,
+                    ),
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=3600)),
+                vol.Optional(
+                    CONF_TELEMETRY_WINDOW,
+                    default=options.get(
+                        CONF_TELEMETRY_WINDOW, DEFAULT_TELEMETRY_WINDOW
+                    ),
+                ): vol.All(vol.Coerce(int), vol.Range(min=0, max=86400)),
+                vol.Optional(
+                    CONF_MAX_RESPONSE_SIZE,
+                    default=options.get(
+                        CONF_MAX_RESPONSE_SIZE, DEFAULT_MAX_RESPONSE_SIZE
+                    ),
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=256)),
+                vol.Optional(
+                    CONF_OFFLINE_SPOOL,
+                    default=options.get(CONF_OFFLINE_SPOOL, DEFAULT_OFFLINE_SPOOL),
+                ): bool,
+                vol.Optional(
+                    CONF_RPC, default=options.get(CONF_RPC, DEFAULT_RPC)
+                ): bool,
+                vol.Optional(
+                    CONF_RPC_SERVICES,
+                    default=options.get(CONF_RPC_SERVICES, []),
+                ): SelectSelector(
+                    SelectSelectorConfig(
+                        options=self._services(), multiple=True, custom_value=True
+                    )
+                ),
+                vol.Optional(
+                    CONF_RPC_TIMEOUT,
+                    default=options.get(CONF_RPC_TIMEOUT, DEFAULT_RPC_TIMEOUT),
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=300)),
+                vol.Optional(
+                    CONF_RPC_WORKERS,
+                    default=options.get(CONF_RPC_WORKERS, DEFAULT_RPC_WORKERS),
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=32)),
+                vol.Optional(
+                    CONF_DIAGNOSTIC_SENSORS,
+                    default=options.get(
+                        CONF_DIAGNOSTIC_SENSORS, DEFAULT_DIAGNOSTIC_SENSORS
+                    ),
+                ): bool,
+                vol.Optional(
+                    CONF_TRACKED_KEYS,
+                    default=options.get(CONF_TRACKED_KEYS, []),
+                ): SelectSelector(
+                    SelectSelectorConfig(
+                        options=self._known_keys(), multiple=True, custom_value=True
+                    )
+                ),
+                vol.Optional(
+                    CONF_PATH_SELECTORS,
+                    default=options.get(CONF_PATH_SELECTORS, []),
+                ): SelectSelector(
+                    SelectSelectorConfig(options=[], multiple=True, custom_value=True)
+                ),
+                vol.Optional(
+                    CONF_WRITE_FILTERS,
+                    default=options.get(CONF_WRITE_FILTERS, {}),
+                ): ObjectSelector(),
+            }
+        )
+        if is_hub:
+            data_schema = data_schema.extend(
+                {
+                    vol.Optional(
+                        CONF_MAX_CONCURRENCY,
+                        default=options.get(
+                            CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY
+                        ),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=1, max=64)),
+                    vol.Optional(
+                        CONF_TELEMETRY_DEVICE,
+                        description={
+                            "suggested_value": options.get(CONF_TELEMETRY_DEVICE)
+                        },
+                    ): SelectSelector(
+                        SelectSelectorConfig(
+                            options=self._hub_devices(),
+                            mode=SelectSelectorMode.DROPDOWN,
+                        )
+                    ),
+                }
+            )
+
+        return self.async_show_form(
+            step_id="init", data_schema=data_schema, errors=errors
+        )
+
+    def _hub_devices(self) -> list[SelectOptionDict]:
+        """Return the devices of a hub entry that can receive telemetry."""
+        return [
+            SelectOptionDict(
+                value=hub_device_id(self._entry.entry_id, device[CONF_ACCESS_TOKEN]),
+                label=device.get(CONF_NAME) or f"ThingsBoard Device {index}",
+            )
+            for index, device in enumerate(self._entry.data[CONF_DEVICES], start=1)
+        ]
+
+    def _known_keys(self) -> list[str]:
+        """Return the attribute keys discovered so far, plus the tracked ones."""
+        keys = set(self._entry.options.get(CONF_TRACKED_KEYS, []))
+        if coordinator := self.hass.data.get(DOMAIN, {}).get(self._entry.entry_id):
+            keys.update(key for _, key in coordinator.device_keys())
+        return sorted(keys)
+
+    def _services(self) -> list[str]:
+        """Return the services ThingsBoard may call as RPC methods."""
+        return sorted(
+            f"{domain}.{service}"
+            for domain, services in self.hass.services.async_services().items()
+            if domain != DOMAIN
+            for service in services
         )
 
 
@@ -108,3 +600,7 @@ class CannotConnect(Exception):
 
 class InvalidAuth(Exception):
     """Error to indicate there is invalid auth."""
+
+
+class InvalidTenantAuth(Exception):
+    """Error to indicate the tenant credentials are invalid."""
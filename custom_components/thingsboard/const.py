@@ -7,10 +7,129 @@ DOMAIN = "thingsboard"
 # Configuration
 CONF_HOST = "host"
 CONF_ACCESS_TOKEN = "access_token"
+CONF_ACCESS_TOKENS = "access_tokens"
+CONF_DEVICES = "devices"
+CONF_TRANSPORT = "transport"
+CONF_MQTT_PORT = "mqtt_port"
+CONF_MQTT_TLS = "mqtt_tls"
+CONF_GATEWAY = "gateway"
+
+# Transports
+TRANSPORT_HTTP = "http"
+TRANSPORT_MQTT = "mqtt"
+
+# Options
+CONF_LONG_POLL = "long_poll"
+CONF_LONG_POLL_TIMEOUT = "long_poll_timeout"
+CONF_WRITE_DELAY = "write_delay"
+CONF_MAX_CONCURRENCY = "max_concurrency"
+CONF_EXPORT_ENTITIES = "export_entities"
+CONF_TELEMETRY_FLUSH_SIZE = "telemetry_flush_size"
+CONF_TELEMETRY_FLUSH_INTERVAL = "telemetry_flush_interval"
+CONF_TELEMETRY_WINDOW = "telemetry_window"
+CONF_TELEMETRY_DEVICE = "telemetry_device"
+CONF_OFFLINE_SPOOL = "offline_spool"
+CONF_TRACKED_KEYS = "tracked_keys"
+CONF_PATH_SELECTORS = "path_selectors"
+CONF_WRITE_FILTERS = "write_filters"
+CONF_MIN_SCAN_INTERVAL = "min_scan_interval"
+CONF_MAX_SCAN_INTERVAL = "max_scan_interval"
+CONF_RPC = "rpc"
+CONF_RPC_SERVICES = "rpc_services"
+CONF_RPC_TIMEOUT = "rpc_timeout"
+CONF_RPC_WORKERS = "rpc_workers"
+CONF_DIAGNOSTIC_SENSORS = "diagnostic_sensors"
+CONF_MAX_RESPONSE_SIZE = "max_response_size"
 
 # Defaults
 DEFAULT_SCAN_INTERVAL = timedelta(hours=1)
+DEFAULT_MIN_SCAN_INTERVAL = 60  # seconds
+DEFAULT_MAX_SCAN_INTERVAL = int(DEFAULT_SCAN_INTERVAL.total_seconds())
 DEFAULT_NAME = "ThingsBoard"
+DEFAULT_MQTT_PORT = 1883
+DEFAULT_MQTT_TLS = False
+DEFAULT_GATEWAY = False
+DEFAULT_LONG_POLL = True
+DEFAULT_LONG_POLL_TIMEOUT = 60  # seconds
+DEFAULT_WRITE_DELAY = 0.5  # seconds
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_TELEMETRY_FLUSH_SIZE = 100
+DEFAULT_TELEMETRY_FLUSH_INTERVAL = 10  # seconds
+DEFAULT_TELEMETRY_WINDOW = 0  # seconds, 0 sends every sample
+
+DEFAULT_OFFLINE_SPOOL = True
+DEFAULT_RPC = False
+DEFAULT_RPC_TIMEOUT = 10  # seconds
+DEFAULT_RPC_WORKERS = 4
+DEFAULT_DIAGNOSTIC_SENSORS = False
+DEFAULT_MAX_RESPONSE_SIZE = 16  # MiB
+DEFAULT_BULK_CONCURRENCY = 16
+
+# Larger JSON documents are decoded in the executor (bytes)
+EXECUTOR_DECODE_SIZE = 64 * 1024
+# Chunk size of reading response bodies (bytes)
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+# Maximum number of telemetry samples buffered per entry
+TELEMETRY_QUEUE_SIZE = 10000
+
+# Maximum number of RPC service calls waiting for a worker per entry
+RPC_QUEUE_SIZE = 100
+
+# Offline spool limits
+SPOOL_MAX_ROWS = 100000
+SPOOL_MAX_AGE = timedelta(days=7)
+SPOOL_REPLAY_BATCH_SIZE = 500
+# Most telemetry points and serialized bytes sent in one replay request
+SPOOL_REPLAY_MAX_POINTS = 1000
+SPOOL_REPLAY_MAX_BYTES = 512 * 1024
+
+# Interval of full attribute fetches that discover new keys while only
+# keys with enabled entities are requested otherwise
+FULL_DISCOVERY_INTERVAL = timedelta(hours=6)
+
+# Longest key selection that is sent instead of fetching all attributes
+MAX_KEY_SELECTION_LENGTH = 4000
+
+# Persisted attribute snapshot served until the first refresh after startup
+SNAPSHOT_STORAGE_VERSION = 1
+SNAPSHOT_SAVE_DELAY = 60  # seconds
+
+# Minimum spacing of staggered hub device polls
+MIN_POLL_SPACING = timedelta(seconds=10)
+
+# Delay of the full fetch that follows attribute writes (seconds)
+WRITE_RESYNC_DELAY = 30
+
+# Per-host HTTP transport shared by the entries of a ThingsBoard server
+DATA_TRANSPORTS = f"{DOMAIN}_transports"
+TRANSPORT_CONNECTION_LIMIT = 100
+# Long-polls hold a connection each, in a pool of their own (0 = unbounded)
+TRANSPORT_LONG_POLL_CONNECTION_LIMIT = 0
+TRANSPORT_KEEPALIVE_TIMEOUT = 30  # seconds
+TRANSPORT_DNS_CACHE_TTL = 300  # seconds
+TRANSPORT_CONNECT_TIMEOUT = 10  # seconds
+TRANSPORT_READ_TIMEOUT = 30  # seconds
+TRANSPORT_WRITE_TIMEOUT = 10  # seconds
+
+# Consecutive failures that open the circuit breaker of a host, and the
+# time it stays open before requests are tried again (seconds)
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 60
+
+# Historical telemetry backfill into external statistics
+BACKFILL_STORAGE_VERSION = 1
+BACKFILL_SAVE_DELAY = 10  # seconds
+# Time range fetched and imported at once
+BACKFILL_WINDOW = timedelta(days=1)
+# Points requested per timeseries page
+BACKFILL_PAGE_SIZE = 10000
+# Keys backfilled at the same time per entry
+BACKFILL_CONCURRENCY = 2
+
+# Long-poll reconnect backoff (seconds)
+LONG_POLL_BACKOFF_MIN = 1
+LONG_POLL_BACKOFF_MAX = 300
 
 # API Endpoints
 API_TELEMETRY = "/api/v1/{token}/telemetry"
@@ -18,6 +137,32 @@ API_ATTRIBUTES = "/api/v1/{token}/attributes"
 API_ATTRIBUTES_REQUEST = (
     "/api/v1/{token}/attributes?clientKeys={client_keys}&sharedKeys={shared_keys}"
 )
+API_ATTRIBUTES_UPDATES = "/api/v1/{token}/attributes/updates?timeout={timeout}"
+API_RPC = "/api/v1/{token}/rpc?timeout={timeout}"
+API_RPC_REPLY = "/api/v1/{token}/rpc/{request_id}"
+
+# REST API endpoints, which require tenant credentials
+API_LOGIN = "/api/auth/login"
+API_TIMESERIES = "/api/plugins/telemetry/DEVICE/{device}/values/timeseries"
+
+# MQTT topics
+MQTT_TOPIC_TELEMETRY = "v1/devices/me/telemetry"
+MQTT_TOPIC_ATTRIBUTES = "v1/devices/me/attributes"
+MQTT_TOPIC_ATTRIBUTES_REQUEST = "v1/devices/me/attributes/request/{request_id}"
+MQTT_TOPIC_ATTRIBUTES_RESPONSE = "v1/devices/me/attributes/response/+"
+MQTT_TOPIC_RPC_REQUEST = "v1/devices/me/rpc/request/+"
+MQTT_TOPIC_RPC_RESPONSE = "v1/devices/me/rpc/response/{request_id}"
+MQTT_TOPIC_GATEWAY_CONNECT = "v1/gateway/connect"
+MQTT_TOPIC_GATEWAY_DISCONNECT = "v1/gateway/disconnect"
+MQTT_TOPIC_GATEWAY_TELEMETRY = "v1/gateway/telemetry"
+MQTT_TOPIC_GATEWAY_ATTRIBUTES = "v1/gateway/attributes"
+
+# Device profile of devices connected through the gateway
+GATEWAY_DEVICE_TYPE = "default"
+
+# Events
+EVENT_RPC_REQUEST = f"{DOMAIN}_rpc_request"
+EVENT_GATEWAY_ATTRIBUTES = f"{DOMAIN}_gateway_attributes"
 
 # Attributes
 ATTR_LAST_UPDATE = "last_update"
@@ -2,122 +2,803 @@
 
 from __future__ import annotations
 
+import asyncio
+from collections.abc import Collection, Iterator, Mapping
+from dataclasses import dataclass
+from datetime import timedelta
 import logging
-from typing import Any
+import math
+import sys
+import time
+from typing import TYPE_CHECKING, Any
 
 import aiohttp
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import CONF_HOST
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.const import CONF_HOST, CONF_NAME, Platform
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 
-from .const import CONF_ACCESS_TOKEN, DEFAULT_SCAN_INTERVAL, DOMAIN
+from .const import (
+    CONF_ACCESS_TOKEN,
+    CONF_DEVICES,
+    CONF_LONG_POLL_TIMEOUT,
+    CONF_MAX_CONCURRENCY,
+    CONF_MAX_RESPONSE_SIZE,
+    CONF_MAX_SCAN_INTERVAL,
+    CONF_MIN_SCAN_INTERVAL,
+    CONF_MQTT_PORT,
+    CONF_MQTT_TLS,
+    CONF_PATH_SELECTORS,
+    CONF_TELEMETRY_DEVICE,
+    CONF_TRACKED_KEYS,
+    CONF_TRANSPORT,
+    CONF_WRITE_FILTERS,
+    DEFAULT_LONG_POLL_TIMEOUT,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_RESPONSE_SIZE,
+    DEFAULT_MAX_SCAN_INTERVAL,
+    DEFAULT_MIN_SCAN_INTERVAL,
+    DEFAULT_MQTT_PORT,
+    DEFAULT_MQTT_TLS,
+    DOMAIN,
+    FULL_DISCOVERY_INTERVAL,
+    LONG_POLL_BACKOFF_MAX,
+    LONG_POLL_BACKOFF_MIN,
+    MAX_KEY_SELECTION_LENGTH,
+    MIN_POLL_SPACING,
+    SNAPSHOT_SAVE_DELAY,
+    SNAPSHOT_STORAGE_VERSION,
+    TRANSPORT_HTTP,
+    TRANSPORT_MQTT,
+)
+from .device import HostUnavailable, ServerBusy, ThingsBoardDevice, hub_device_id
+from .filters import WriteFilter, parse_write_filters
+from .keys import DeviceKey, KeyTable
+from .mqtt import MqttConnection
+from .paths import PathSelector, compile_selectors
+from .scheduler import PollScheduler, jitter
+from .schema import SchemaCache
+from .stats import EntryStats
+from .transport import async_get_transport
+
+if TYPE_CHECKING:
+    from .backfill import StatisticsBackfill
+    from .gateway import Gateway
+    from .rpc import RpcDispatcher
+    from .spool import OfflineSpool
+    from .telemetry import TelemetryUploader
 
 _LOGGER = logging.getLogger(__name__)
 
 
+def snapshot_store(hass: HomeAssistant, entry_id: str) -> Store[dict[str, Any]]:
+    """Return the store of the attribute snapshot of a config entry."""
+    return Store(hass, SNAPSHOT_STORAGE_VERSION, f"{DOMAIN}.{entry_id}.snapshot")
+
+
+@dataclass(frozen=True, slots=True)
+class AttributeDelta:
+    """Attribute keys that differ between two coordinator snapshots."""
+
+    added: frozenset[DeviceKey] = frozenset()
+    changed: frozenset[DeviceKey] = frozenset()
+    removed: frozenset[DeviceKey] = frozenset()
+
+    @property
+    def touched(self) -> frozenset[DeviceKey]:
+        """Return all keys whose value was added, changed or removed."""
+        return self.added | self.changed | self.removed
+
+    def __or__(self, other: AttributeDelta) -> AttributeDelta:
+        """Combine the deltas of several devices."""
+        return AttributeDelta(
+            added=self.added | other.added,
+            changed=self.changed | other.changed,
+            removed=self.removed | other.removed,
+        )
+
+    @classmethod
+    def apply(
+        cls,
+        device_id: str,
+        current: dict[str, Any],
+        new: Mapping[str, Any],
+        fetched: Collection[str] | None = None,
+    ) -> AttributeDelta:
+        """Update the attributes of a device in place and return the delta.
+
+        Keys missing from the new attributes are removed, only among the
+        fetched keys if just those were requested.
+        """
+        added = []
+        changed = []
+        for key, value in new.items():
+            if key not in current:
+                added.append(key)
+            elif current[key] != value:
+                changed.append(key)
+            else:
+                continue
+            current[key] = value
+
+        removed = [
+            key
+            for key in (current if fetched is None else fetched)
+            if key not in new and key in current
+        ]
+        for key in removed:
+            del current[key]
+
+        return cls(
+            added=frozenset((device_id, key) for key in added),
+            changed=frozenset((device_id, key) for key in changed),
+            removed=frozenset((device_id, key) for key in removed),
+        )
+
+    @classmethod
+    def all_changed(
+        cls, device_id: str, data: Mapping[str, Any] | None
+    ) -> AttributeDelta:
+        """Mark every key of a device as changed, e.g. on availability changes."""
+        return cls(changed=frozenset((device_id, key) for key in data or ()))
+
+
 class ThingsBoardDataUpdateCoordinator(DataUpdateCoordinator):
-    """Class to manage fetching ThingsBoard data."""
+    """Class to manage fetching ThingsBoard data.
+
+    The data maps each device ID to the flattened attributes of that device.
+    A regular entry holds a single device, a hub entry holds many devices
+    whose polls are spread evenly across the poll cycle. The length of the
+    cycle adapts to how often the attributes change.
+    """
 
     def __init__(self, hass: HomeAssistant, entry: ConfigEntry) -> None:
         """Initialize the coordinator."""
         self.host = entry.data[CONF_HOST]
-        self.token = entry.data[CONF_ACCESS_TOKEN]
-        self.session = async_get_clientsession(hass)
+        # Connection pool and circuit breaker shared with entries of the host
+        self.transport = async_get_transport(hass, self.host)
         self.entry = entry
+        self.long_poll_timeout: int = entry.options.get(
+            CONF_LONG_POLL_TIMEOUT, DEFAULT_LONG_POLL_TIMEOUT
+        )
+        # Larger responses are rejected instead of buffered (bytes)
+        self.max_response_size: int = (
+            entry.options.get(CONF_MAX_RESPONSE_SIZE, DEFAULT_MAX_RESPONSE_SIZE)
+            * 1024
+            * 1024
+        )
+
+        # Shared attribute keys of all devices of this entry
+        self.keys = KeyTable()
+        # Inferred type, precision, unit and bounds of each attribute
+        self.schema = SchemaCache(self.keys)
+
+        # Entities of this entry per platform, indexed by device and attribute
+        # key or path selector
+        self.entities: dict[Platform, dict[DeviceKey, Entity]] = {
+            Platform.SENSOR: {},
+            Platform.NUMBER: {},
+        }
+
+        # Keys to create entities for, all keys if empty
+        self.tracked_keys = frozenset(entry.options.get(CONF_TRACKED_KEYS, []))
+        # Selectors of nested values shown as separate sensors, per attribute key
+        self.path_selectors: dict[str, tuple[PathSelector, ...]] = compile_selectors(
+            entry.options.get(CONF_PATH_SELECTORS, [])
+        )
+        # Throttling, deadband and rounding of sensor states, per attribute key
+        self.write_filters: dict[str, WriteFilter] = parse_write_filters(
+            entry.options.get(CONF_WRITE_FILTERS, {})
+        )
+        # Keys with enabled entities per device, rebuilt after registry changes
+        self._enabled_keys: dict[str, frozenset[str]] | None = None
+        entry.async_on_unload(
+            hass.bus.async_listen(
+                er.EVENT_ENTITY_REGISTRY_UPDATED, self._async_registry_updated
+            )
+        )
+
+        # Last known attributes, served until the first refresh after startup
+        self._store = snapshot_store(hass, entry.entry_id)
+
+        # Delta of the last update and per-key listener dispatch
+        self.last_delta = AttributeDelta()
+        self._key_listeners: dict[DeviceKey, dict[CALLBACK_TYPE, None]] = {}
+        self._broadcast_listeners: dict[CALLBACK_TYPE, None] = {}
+        self._dispatched_success: bool | None = None
+        # Device fetches that returned an unchanged document
+        self.skipped_refreshes = 0
+        # Request and update counters for diagnostics
+        self.stats = EntryStats()
+        # Set once the entry was torn down
+        self._closed = False
+
+        # Uploader of exported Home Assistant states, if configured
+        self.telemetry_uploader: TelemetryUploader | None = None
+        # Disk spool for writes while ThingsBoard is unreachable, if enabled
+        self.spool: OfflineSpool | None = None
+        # Handler of server-side RPC requests, if enabled
+        self.rpc: RpcDispatcher | None = None
+        # Publisher of Home Assistant devices in gateway mode
+        self.gateway: Gateway | None = None
+        # Importer of historical telemetry, if tenant credentials are set
+        self.backfill: StatisticsBackfill | None = None
+
+        # Devices of this entry. A regular entry keeps the entry ID as device
+        # ID so unique IDs of existing entities stay the same.
+        self.devices: dict[str, ThingsBoardDevice] = {}
+        if CONF_DEVICES in entry.data:
+            for index, device in enumerate(entry.data[CONF_DEVICES], start=1):
+                token = device[CONF_ACCESS_TOKEN]
+                name = device.get(CONF_NAME) or f"ThingsBoard Device {index}"
+                device_id = hub_device_id(entry.entry_id, token)
+                self.devices[device_id] = ThingsBoardDevice(
+                    self, device_id, token, name, name
+                )
+        else:
+            self.devices[entry.entry_id] = ThingsBoardDevice(
+                self,
+                entry.entry_id,
+                entry.data[CONF_ACCESS_TOKEN],
+                "ThingsBoard Device",
+                "ThingsBoard",
+            )
 
-        super().__init__(
-            hass,
-            _LOGGER,
-            name=DOMAIN,
-            update_interval=DEFAULT_SCAN_INTERVAL,
+        # Keep a persistent connection per device token over MQTT
+        if self.uses_mqtt:
+            for device in self.devices.values():
+                device.mqtt = MqttConnection(
+                    device,
+                    self.host,
+                    entry.data.get(CONF_MQTT_PORT, DEFAULT_MQTT_PORT),
+                    entry.data.get(CONF_MQTT_TLS, DEFAULT_MQTT_TLS),
+                )
+
+        self._poll_order = list(self.devices.values())
+        self._poll_batch = len(self._poll_order)
+        self._poll_index = 0
+        self._polled_all = False
+        self._fetch_semaphore = asyncio.Semaphore(
+            entry.options.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY)
+        )
+        self.scheduler = PollScheduler(
+            timedelta(
+                seconds=entry.options.get(
+                    CONF_MIN_SCAN_INTERVAL, DEFAULT_MIN_SCAN_INTERVAL
+                )
+            ),
+            timedelta(
+                seconds=entry.options.get(
+                    CONF_MAX_SCAN_INTERVAL, DEFAULT_MAX_SCAN_INTERVAL
+                )
+            ),
         )
 
-    async def _async_update_data(self) -> dict[str, Any]:
+        super().__init__(hass, _LOGGER, name=DOMAIN)
+        self._set_poll_cycle(self.scheduler.interval)
+
+    @property
+    def is_hub(self) -> bool:
+        """Return True if this entry manages several device tokens."""
+        return CONF_DEVICES in self.entry.data
+
+    @property
+    def telemetry_device(self) -> ThingsBoardDevice | None:
+        """Return the device receiving exported telemetry.
+
+        Hub entries with several devices only send to the configured one.
+        """
+        if len(self.devices) == 1:
+            return next(iter(self.devices.values()))
+        return self.devices.get(self.entry.options.get(CONF_TELEMETRY_DEVICE, ""))
+
+    @property
+    def uses_mqtt(self) -> bool:
+        """Return True if this entry talks to ThingsBoard over MQTT."""
+        return self.entry.data.get(CONF_TRANSPORT, TRANSPORT_HTTP) == TRANSPORT_MQTT
+
+    def device_keys(self) -> Iterator[DeviceKey]:
+        """Return the (device ID, attribute key) pairs of all known attributes."""
+        for device_id, attributes in (self.data or {}).items():
+            for key in attributes:
+                yield self.keys.device_key(device_id, key)
+
+    async def async_shutdown(self) -> None:
+        """Send pending writes, cancel scheduled refreshes and save the data."""
+        for device in self.devices.values():
+            await device.async_shutdown()
+        await super().async_shutdown()
+        if self.data is not None:
+            await self._store.async_save(self._snapshot())
+
+    async def async_close(self) -> None:
+        """Tear the entry down, one step after the other.
+
+        Pending writes and the last telemetry are sent, or spooled, before
+        the gateway devices are disconnected, the spool is closed and the
+        transport of the host is released. Only the first call has an
+        effect.
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        await self.async_shutdown()
+        if self.telemetry_uploader is not None:
+            await self.telemetry_uploader.async_stop()
+        if self.gateway is not None:
+            await self.gateway.async_disconnect()
+        if self.spool is not None:
+            await self.spool.async_close()
+        await self.transport.async_release()
+
+    async def async_restore_snapshot(self) -> bool:
+        """Serve the attributes saved by the last run until the next refresh.
+
+        Returns False if there is no snapshot of this entry.
+        """
+        if not (stored := await self._store.async_load()):
+            return False
+
+        # Share the keys with later refreshes, which intern them as well
+        data = {
+            device_id: {sys.intern(key): value for key, value in attributes.items()}
+            for device_id, attributes in stored.get("devices", {}).items()
+            if device_id in self.devices
+        }
+        if not data:
+            return False
+
+        _LOGGER.debug("Restored attributes of %s device(s)", len(data))
+        self.last_delta = AttributeDelta()
+        self.data = data
+        return True
+
+    @callback
+    def _snapshot(self) -> dict[str, Any]:
+        """Return the data to persist."""
+        return {"devices": self.data or {}}
+
+    @callback
+    def async_add_listener(
+        self, update_callback: CALLBACK_TYPE, context: Any = None
+    ) -> CALLBACK_TYPE:
+        """Listen for data updates.
+
+        Listeners registered with a (device ID, attribute key) context are only
+        called when that key changed. All other listeners are called on every
+        update that changed any key.
+        """
+        remove_listener = super().async_add_listener(update_callback, context)
+
+        if isinstance(context, tuple):
+            listeners = self._key_listeners.setdefault(context, {})
+        else:
+            listeners = self._broadcast_listeners
+        listeners[update_callback] = None
+
+        @callback
+        def remove_key_listener() -> None:
+            """Remove update listener."""
+            remove_listener()
+            listeners.pop(update_callback, None)
+            if isinstance(context, tuple) and not listeners:
+                self._key_listeners.pop(context, None)
+
+        return remove_key_listener
+
+    @callback
+    def async_update_listeners(self) -> None:
+        """Update listeners affected by the last delta."""
+        self.stats.keys_changed += len(self.last_delta.touched)
+
+        if self.last_update_success != self._dispatched_success:
+            # Availability changed, so every entity has to write its state
+            self._dispatched_success = self.last_update_success
+            super().async_update_listeners()
+            return
+
+        if not self.last_delta.touched:
+            # Nothing changed, not even a key for entity discovery
+            return
+
+        for update_callback in list(self._broadcast_listeners):
+            update_callback()
+
+        # Attributes described by changed companions are updated as well
+        for key in self.schema.invalidate(self.last_delta.touched):
+            for update_callback in list(self._key_listeners.get(key, ())):
+                update_callback()
+
+        # Persist the changed data, coalescing frequent updates
+        self._store.async_delay_save(self._snapshot, SNAPSHOT_SAVE_DELAY)
+
+    @callback
+    def _async_publish(
+        self, data: dict[str, dict[str, Any]], delta: AttributeDelta
+    ) -> None:
+        """Publish data that changed outside of a scheduled refresh.
+
+        Unlike async_set_updated_data this keeps the poll schedule intact.
+        """
+        self.last_delta = delta
+        self.data = data
+        self.async_update_listeners()
+
+    def _set_poll_cycle(self, cycle: timedelta) -> None:
+        """Spread device polls evenly across a poll cycle."""
+        slots = max(1, min(len(self._poll_order), int(cycle / MIN_POLL_SPACING)))
+        self._poll_batch = math.ceil(len(self._poll_order) / slots)
+        self.update_interval = cycle / slots
+
+    def _due_devices(self) -> list[ThingsBoardDevice]:
+        """Return the devices to poll in this refresh."""
+        if not self._polled_all:
+            # Fetch everything on the first refresh to set up all entities
+            # or to replace a restored snapshot
+            self._polled_all = True
+            return self._poll_order
+
+        # Wrap around, so every device is polled equally often
+        count = len(self._poll_order)
+        start = self._poll_index
+        self._poll_index = (start + self._poll_batch) % count
+        return [
+            self._poll_order[(start + offset) % count]
+            for offset in range(min(self._poll_batch, count))
+        ]
+
+    def is_tracked(self, key: str) -> bool:
+        """Return True if entities should be created for an attribute key."""
+        return not self.tracked_keys or key in self.tracked_keys
+
+    @callback
+    def _async_registry_updated(self, event: Event) -> None:
+        """Rebuild the enabled keys after entities were enabled or disabled."""
+        self._enabled_keys = None
+
+    def _get_enabled_keys(self) -> dict[str, frozenset[str]]:
+        """Return the keys with at least one enabled entity per device."""
+        if self._enabled_keys is None:
+            registry = er.async_get(self.hass)
+            enabled = {
+                registry_entry.unique_id
+                for registry_entry in er.async_entries_for_config_entry(
+                    registry, self.entry.entry_id
+                )
+                if not registry_entry.disabled_by
+            }
+            keys: dict[str, set[str]] = {}
+            for platform_entities in self.entities.values():
+                for entity in platform_entities.values():
+                    if entity.unique_id in enabled:
+                        # The attribute the entity listens to, which is the
+                        # parent attribute of path sensors
+                        device_id, key = entity.coordinator_context
+                        keys.setdefault(device_id, set()).add(key)
+            self._enabled_keys = {
+                device_id: frozenset(device_keys)
+                for device_id, device_keys in keys.items()
+            }
+        return self._enabled_keys
+
+    def _keys_to_fetch(self, device: ThingsBoardDevice) -> frozenset[str] | None:
+        """Return the keys to request from a device, or None for all keys.
+
+        Only keys with enabled entities are requested. The full document is
+        still fetched periodically to discover new keys.
+        """
+        known = (self.data or {}).get(device.device_id)
+        if (
+            known is None
+            or device.last_discovery is None
+            or time.monotonic() - device.last_discovery
+            > FULL_DISCOVERY_INTERVAL.total_seconds()
+        ):
+            return None
+
+        keys = self._get_enabled_keys().get(device.device_id, frozenset())
+        if keys >= known.keys() or (
+            sum(len(key) + 1 for key in keys) > MAX_KEY_SELECTION_LENGTH
+        ):
+            # Selecting would not save anything or not fit into the URL
+            return None
+        return keys
+
+    async def _async_fetch_device(
+        self, device: ThingsBoardDevice
+    ) -> tuple[dict[str, Any] | None, frozenset[str] | None]:
+        """Fetch a device, returning None if it failed.
+
+        Also returns the keys that were requested, None for all keys.
+        """
+        keys = self._keys_to_fetch(device)
+        previous = (self.data or {}).get(device.device_id, {})
+        if keys is not None and not keys:
+            # Every entity of this device is disabled
+            return previous, keys
+
+        async with self._fetch_semaphore:
+            try:
+                attributes = await device.async_fetch_attributes(keys)
+            except UpdateFailed as err:
+                if device.available:
+                    _LOGGER.warning("Device %s is unavailable: %s", device.name, err)
+                device.last_error = str(err)
+                device.retry_after = (
+                    err.retry_after if isinstance(err, ServerBusy) else None
+                )
+                device.host_error = isinstance(err, (HostUnavailable, ServerBusy))
+                return None, keys
+
+        if not device.available:
+            _LOGGER.info("Device %s is available again", device.name)
+        device.last_error = None
+
+        if keys is None:
+            device.last_discovery = time.monotonic()
+
+        if attributes is None:
+            # Same document as last time, skip flattening and dispatch
+            self.skipped_refreshes += 1
+            attributes = previous
+
+        if self.spool is not None:
+            # ThingsBoard is reachable again
+            self.spool.async_schedule_replay()
+        return attributes, keys
+
+    def _apply_device_result(
+        self,
+        data: dict[str, dict[str, Any]],
+        device: ThingsBoardDevice,
+        attributes: dict[str, Any] | None,
+        fetched: frozenset[str] | None = None,
+    ) -> AttributeDelta:
+        """Store the result of a device fetch and return its delta.
+
+        The attributes of a known device are updated in place.
+        """
+        device_id = device.device_id
+        was_available = device.available
+        device.available = attributes is not None
+        current = data.get(device_id)
+
+        if attributes is None:
+            # Keep the last known values, the entities report unavailable
+            if was_available:
+                return AttributeDelta.all_changed(device_id, current)
+            return AttributeDelta()
+
+        if attributes is current:
+            # The document did not change
+            if not was_available:
+                return AttributeDelta.all_changed(device_id, attributes)
+            return AttributeDelta()
+
+        if current is None:
+            data[device_id] = attributes
+            delta = AttributeDelta(
+                added=frozenset((device_id, key) for key in attributes)
+            )
+        else:
+            delta = AttributeDelta.apply(device_id, current, attributes, fetched)
+        if not was_available:
+            delta |= AttributeDelta.all_changed(device_id, data[device_id])
+        return delta
+
+    async def _async_update_data(self) -> dict[str, dict[str, Any]]:
         """Fetch data from ThingsBoard.
 
-        This method fetches both client-side and shared attributes.
-        The attributes are used to discover entities dynamically.
+        This method fetches both client-side and shared attributes of the
+        devices that are due. The attributes are used to discover entities
+        dynamically.
         """
-        try:
-            # Fetch all attributes (both client and shared)
-            url = f"{self.host}/api/v1/{self.token}/attributes"
+        # Never dispatch a stale delta if this update fails
+        self.last_delta = AttributeDelta()
 
-            async with self.session.get(
-                url, timeout=aiohttp.ClientTimeout(total=30)
-            ) as response:
-                if response.status == 401:
-                    raise UpdateFailed("Invalid access token")
-                elif response.status != 200:
-                    raise UpdateFailed(f"Error fetching data: HTTP {response.status}")
+        due = self._due_devices()
+        results = await asyncio.gather(
+            *(self._async_fetch_device(device) for device in due)
+        )
 
-                data = await response.json()
+        data = dict(self.data or {})
+        delta = AttributeDelta()
+        for device, (attributes, fetched) in zip(due, results, strict=True):
+            delta |= self._apply_device_result(data, device, attributes, fetched)
 
-                # ThingsBoard returns attributes in the format:
-                # {
-                #   "client": {...},
-                #   "shared": {...}
-                # }
+        if any(attributes is not None for attributes, _ in results):
+            self._set_poll_cycle(
+                self.scheduler.record_success(
+                    bool(delta.touched), len(due) / len(self._poll_order)
+                )
+            )
+        elif any(device.host_error for device in due):
+            # Retry the whole entry later, honouring the server's request
+            retry_after = max((device.retry_after or 0 for device in due), default=0)
+            self.update_interval = self.scheduler.record_failure(retry_after)
+            _LOGGER.debug(
+                "Polling %s failed %s time(s), retrying in %s",
+                self.entry.title,
+                self.scheduler.failures,
+                self.update_interval,
+            )
+        else:
+            # Failures of single tokens (e.g. HTTP 401) keep the poll slots,
+            # so the other devices of a hub are polled on time
+            self._set_poll_cycle(self.scheduler.interval)
 
-                # Flatten the structure for easier access
-                flattened_data = {}
+        # A single bad token only marks its own device unavailable
+        if not any(device.available for device in self.devices.values()):
+            raise UpdateFailed(due[0].last_error)
+
+        self.last_delta = delta
+
+        _LOGGER.debug(
+            "Fetched ThingsBoard data of %s device(s), %s key(s) changed,"
+            " %s unchanged document(s) skipped so far",
+            len(due),
+            len(delta.touched),
+            self.skipped_refreshes,
+        )
 
-                if "client" in data:
-                    for key, value in data["client"].items():
-                        flattened_data[f"client_{key}"] = value
+        return data
 
-                if "shared" in data:
-                    for key, value in data["shared"].items():
-                        flattened_data[f"shared_{key}"] = value
+    @callback
+    def async_host_unavailable(self) -> None:
+        """Mark all devices unavailable once their host stopped responding.
 
-                # Also try to fetch latest telemetry if available
-                # Note: The standard HTTP API doesn't provide a way to fetch
-                # latest telemetry directly. This would require the REST API
-                # with proper authentication. For now, we focus on attributes.
+        They become available again with the next successful fetch.
+        """
+        if self.data is None:
+            return
 
-                _LOGGER.debug("Fetched ThingsBoard data: %s", flattened_data)
+        data = dict(self.data)
+        delta = AttributeDelta()
+        for device in self.devices.values():
+            device.last_error = f"{self.host} is not responding"
+            delta |= self._apply_device_result(data, device, None)
+        self._async_publish(data, delta)
 
-                return flattened_data
+    async def async_refresh_device(self, device_id: str) -> None:
+        """Fetch the full attribute document of a single device."""
+        device = self.devices[device_id]
+        attributes, fetched = await self._async_fetch_device(device)
 
-        except aiohttp.ClientError as err:
-            raise UpdateFailed(f"Error communicating with API: {err}") from err
-        except Exception as err:
-            raise UpdateFailed(f"Unexpected error: {err}") from err
+        data = dict(self.data or {})
+        delta = self._apply_device_result(data, device, attributes, fetched)
+        self._async_publish(data, delta)
 
-    async def async_set_shared_attributes(self, attributes: dict[str, Any]) -> bool:
+    async def async_set_shared_attributes(
+        self,
+        attributes: dict[str, Any],
+        device_id: str | None = None,
+        immediate: bool = False,
+    ) -> bool:
         """Set shared attributes on ThingsBoard device.
 
+        The values are applied to the coordinator data right away and sent
+        together with other writes made within the write delay.
+
         Args:
             attributes: Dictionary of attributes to set (e.g., {"temperature": 22.5})
+            device_id: Device to write to, defaults to the device of a regular entry
+            immediate: Send without waiting for the write delay
 
         Returns:
             True if successful, False otherwise
         """
-        try:
-            url = f"{self.host}/api/v1/{self.token}/attributes"
-
-            async with self.session.post(
-                url,
-                json=attributes,
-                timeout=aiohttp.ClientTimeout(total=10),
-            ) as response:
-                if response.status == 401:
-                    _LOGGER.error("Invalid access token when setting attributes")
-                    return False
-                elif response.status not in (200, 201):
-                    _LOGGER.error("Error setting attributes: HTTP %s", response.status)
-                    return False
-
-                _LOGGER.info("Successfully set attributes: %s", attributes)
-                # Trigger an immediate refresh to update the entities
-                await self.async_request_refresh()
-                return True
-
-        except aiohttp.ClientError as err:
-            _LOGGER.error("Error communicating with API: %s", err)
-            return False
-        except Exception as err:
-            _LOGGER.exception("Unexpected error setting attributes: %s", err)
+        if device_id is None:
+            device_id = self.entry.entry_id
+        if (device := self.devices.get(device_id)) is None:
+            _LOGGER.error("Device %s not found", device_id)
             return False
+
+        self.async_merge_shared_attributes(device_id, attributes)
+        return await device.write_queue.async_write(attributes, immediate)
+
+    @callback
+    def async_connect_mqtt(self) -> None:
+        """Open the MQTT connections, which also push attribute updates.
+
+        The tasks are bound to the config entry and are cancelled on unload.
+        """
+        for device in self.devices.values():
+            if device.mqtt is not None:
+                self.entry.async_create_background_task(
+                    self.hass,
+                    device.mqtt.async_run(),
+                    f"{DOMAIN}_mqtt_{device.device_id}",
+                )
+
+    @callback
+    def async_start_subscription(self) -> None:
+        """Start the shared attribute long-poll subscriptions.
+
+        The tasks are bound to the config entry and are cancelled on unload.
+        While they run, the periodic full fetch only serves as a resync.
+        """
+        for device in self.devices.values():
+            self.entry.async_create_background_task(
+                self.hass,
+                self._async_subscription_loop(device),
+                f"{DOMAIN}_subscription_{device.device_id}",
+            )
+
+    async def _async_subscription_loop(self, device: ThingsBoardDevice) -> None:
+        """Long-poll shared attribute updates and merge them into the data."""
+        backoff = LONG_POLL_BACKOFF_MIN
+        resync = False
+
+        while True:
+            try:
+                updates = await device.async_long_poll(self.long_poll_timeout)
+            except (
+                aiohttp.ClientError,
+                TimeoutError,
+                ValueError,
+                UpdateFailed,
+            ) as err:
+                delay = jitter(backoff)
+                if isinstance(err, ServerBusy) and err.retry_after:
+                    delay = max(delay, err.retry_after)
+                _LOGGER.debug(
+                    "Attribute subscription of %s failed, retrying in %.1f s: %s",
+                    device.name,
+                    delay,
+                    err,
+                )
+                await asyncio.sleep(delay)
+                backoff = min(backoff * 2, LONG_POLL_BACKOFF_MAX)
+                resync = True
+                continue
+
+            backoff = LONG_POLL_BACKOFF_MIN
+
+            if resync:
+                # Updates may have been missed while disconnected
+                resync = False
+                await self.async_refresh_device(device.device_id)
+
+            if updates:
+                self.async_merge_shared_attributes(device.device_id, updates)
+
+    @callback
+    def async_merge_shared_attributes(
+        self, device_id: str, updates: dict[str, Any]
+    ) -> None:
+        """Merge a pushed shared attribute update into the coordinator data.
+
+        ThingsBoard reports removed attributes as {"deleted": ["key", ...]}.
+        """
+        data = dict(self.data or {})
+        attributes = data.setdefault(device_id, {})
+        # The next fetch has to be decoded, even if its document is unchanged
+        self.devices[device_id].fingerprint = None
+
+        deleted = updates.get("deleted")
+        if isinstance(deleted, list):
+            removed = [
+                key
+                for key in (self.keys.flat("shared", name) for name in deleted)
+                if key in attributes
+            ]
+            for key in removed:
+                del attributes[key]
+            delta = AttributeDelta(
+                removed=frozenset((device_id, key) for key in removed)
+            )
+        else:
+            merged = {
+                self.keys.flat("shared", key): value for key, value in updates.items()
+            }
+            # Only the pushed keys are known, keep all others
+            delta = AttributeDelta.apply(device_id, attributes, merged, merged)
+
+        _LOGGER.debug("Received shared attribute update: %s", list(updates))
+
+        self._async_publish(data, delta)
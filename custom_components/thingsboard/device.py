@@ -0,0 +1,473 @@
+"""ThingsBoard device access through the device HTTP API."""
+
+from __future__ import annotations
+
+from collections.abc import Collection
+import hashlib
+import logging
+import time
+from typing import TYPE_CHECKING, Any
+from urllib.parse import quote
+
+import aiohttp
+from aiohttp import hdrs
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.debounce import Debouncer
+from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.helpers.update_coordinator import UpdateFailed
+from homeassistant.util.json import json_loads
+
+from .const import (
+    API_ATTRIBUTES,
+    API_ATTRIBUTES_REQUEST,
+    API_ATTRIBUTES_UPDATES,
+    API_RPC,
+    API_RPC_REPLY,
+    API_TELEMETRY,
+    CONF_WRITE_DELAY,
+    DEFAULT_WRITE_DELAY,
+    DOMAIN,
+    EXECUTOR_DECODE_SIZE,
+    MQTT_TOPIC_ATTRIBUTES,
+    MQTT_TOPIC_RPC_RESPONSE,
+    MQTT_TOPIC_TELEMETRY,
+    RESPONSE_CHUNK_SIZE,
+    TRANSPORT_READ_TIMEOUT,
+    TRANSPORT_WRITE_TIMEOUT,
+    WRITE_RESYNC_DELAY,
+)
+from .scheduler import parse_retry_after
+from .spool import KIND_ATTRIBUTES
+from .transport import CircuitOpen
+from .write_queue import AttributeWriteQueue
+
+if TYPE_CHECKING:
+    from .coordinator import ThingsBoardDataUpdateCoordinator
+    from .mqtt import MqttConnection
+
+_LOGGER = logging.getLogger(__name__)
+
+# MQTT topics of the device API endpoints that send data
+_MQTT_TOPICS = {
+    API_ATTRIBUTES: MQTT_TOPIC_ATTRIBUTES,
+    API_TELEMETRY: MQTT_TOPIC_TELEMETRY,
+    API_RPC_REPLY: MQTT_TOPIC_RPC_RESPONSE,
+}
+
+
+class DeviceUnreachable(Exception):
+    """Error to indicate ThingsBoard could not be reached."""
+
+
+class ServerBusy(UpdateFailed):
+    """Error to indicate ThingsBoard is overloaded or rate limiting."""
+
+    def __init__(self, message: str, retry_after: float | None = None) -> None:
+        """Initialize the error with the delay requested by the server."""
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class HostUnavailable(UpdateFailed):
+    """Error to indicate the host could not be reached at all."""
+
+
+class ResponseTooLarge(UpdateFailed):
+    """Error to indicate a response exceeds the maximum response size."""
+
+
+async def async_decode_json(hass: HomeAssistant, payload: bytes | str) -> Any:
+    """Decode a JSON document, in the executor if it is large.
+
+    Uses the orjson based decoder of Home Assistant, so multi-megabyte
+    documents do not block the event loop. Raises ValueError if the
+    document is invalid.
+    """
+    if len(payload) > EXECUTOR_DECODE_SIZE:
+        return await hass.async_add_executor_job(json_loads, payload)
+    return json_loads(payload)
+
+
+def check_busy(response: aiohttp.ClientResponse) -> None:
+    """Raise ServerBusy on HTTP 429 and server errors."""
+    if response.status == 429 or response.status >= 500:
+        raise ServerBusy(
+            f"ThingsBoard is busy: HTTP {response.status}",
+            parse_retry_after(response.headers.get("Retry-After")),
+        )
+
+
+def _join_keys(keys: Collection[str], prefix: str) -> str:
+    """Join the attribute names of one scope for a key selection request."""
+    return ",".join(
+        quote(key[len(prefix) :], safe="") for key in keys if key.startswith(prefix)
+    )
+
+
+def hub_device_id(entry_id: str, token: str) -> str:
+    """Return a stable device ID for a hub device without exposing its token."""
+    return f"{entry_id}_{hashlib.sha256(token.encode()).hexdigest()[:12]}"
+
+
+class ThingsBoardDevice:
+    """A ThingsBoard device reached through its access token."""
+
+    def __init__(
+        self,
+        coordinator: ThingsBoardDataUpdateCoordinator,
+        device_id: str,
+        token: str,
+        name: str,
+        entity_name_prefix: str,
+    ) -> None:
+        """Initialize the device."""
+        self.coordinator = coordinator
+        self.device_id = device_id
+        self.token = token
+        self.name = name
+        self.entity_name_prefix = entity_name_prefix
+        self.available = True
+        self.last_error: str | None = None
+        # Delay requested by the server with the last failure (seconds)
+        self.retry_after: float | None = None
+        # The last failure was one of the host, not of this device's token
+        self.host_error = False
+        # Monotonic time of the last fetch of the full attribute document
+        self.last_discovery: float | None = None
+        # URL, ETag and digest of the last attribute document, to skip
+        # decoding it again while it does not change
+        self.fingerprint: tuple[str, str | None, bytes] | None = None
+        # Persistent connection if the entry uses the MQTT transport
+        self.mqtt: MqttConnection | None = None
+
+        # Shared by all entities of this device
+        self.device_info = DeviceInfo(
+            identifiers={(DOMAIN, device_id)},
+            name=name,
+            manufacturer="ThingsBoard",
+            model="HTTP API Device",
+            configuration_url=coordinator.host,
+        )
+
+        # Coalesce attribute writes and defer the follow-up full fetch
+        self.write_queue = AttributeWriteQueue(
+            coordinator.hass,
+            coordinator.entry.options.get(CONF_WRITE_DELAY, DEFAULT_WRITE_DELAY),
+            self._async_post_shared_attributes,
+        )
+        self.resync_debouncer = Debouncer(
+            coordinator.hass,
+            _LOGGER,
+            cooldown=WRITE_RESYNC_DELAY,
+            immediate=False,
+            function=self.async_resync,
+        )
+
+    def _url(self, path: str, **kwargs: Any) -> str:
+        """Return the URL of a device API endpoint."""
+        return f"{self.coordinator.host}{path.format(token=self.token, **kwargs)}"
+
+    async def async_resync(self) -> None:
+        """Fetch the full attribute document of this device."""
+        await self.coordinator.async_refresh_device(self.device_id)
+
+    async def async_fetch_attributes(
+        self, keys: Collection[str] | None = None
+    ) -> dict[str, Any] | None:
+        """Fetch both client-side and shared attributes.
+
+        If keys are given, only those flattened keys (e.g. "shared_mode") are
+        requested. Returns None if the document did not change since the last
+        fetch. Raises UpdateFailed if the attributes cannot be fetched, or
+        ServerBusy if ThingsBoard asked to retry later.
+        """
+        stats = self.coordinator.stats
+        start = time.monotonic()
+
+        if self.mqtt is not None:
+            data = await self.mqtt.async_request_attributes(keys, timeout=30)
+            stats.request_duration.record(time.monotonic() - start)
+            return self.coordinator.keys.flatten(data)
+
+        if keys is None:
+            url = self._url(API_ATTRIBUTES)
+        else:
+            url = self._url(
+                API_ATTRIBUTES_REQUEST,
+                client_keys=_join_keys(keys, "client_"),
+                shared_keys=_join_keys(keys, "shared_"),
+            )
+
+        # Only compare with a previous response to the same request
+        fingerprint = (
+            self.fingerprint
+            if self.fingerprint and self.fingerprint[0] == url
+            else None
+        )
+        headers = {}
+        if fingerprint is not None and fingerprint[1] is not None:
+            headers[hdrs.IF_NONE_MATCH] = fingerprint[1]
+
+        try:
+            async with self.coordinator.transport.request(
+                hdrs.METH_GET, url, TRANSPORT_READ_TIMEOUT, headers=headers
+            ) as response:
+                if response.status not in (200, 304):
+                    stats.record_error(response.status)
+                if response.status == 304 and fingerprint is not None:
+                    stats.request_duration.record(time.monotonic() - start)
+                    return None
+                if response.status == 401:
+                    raise UpdateFailed("Invalid access token")
+                check_busy(response)
+                if response.status != 200:
+                    raise UpdateFailed(f"Error fetching data: HTTP {response.status}")
+
+                body = await self._async_read_body(response)
+                etag = response.headers.get(hdrs.ETAG)
+
+            stats.request_duration.record(time.monotonic() - start)
+            stats.response_bytes.record(len(body))
+
+            digest = hashlib.blake2b(body, digest_size=16).digest()
+            if fingerprint is not None and fingerprint[2] == digest:
+                return None
+
+            start = time.monotonic()
+            data = await async_decode_json(self.coordinator.hass, body)
+
+        except CircuitOpen as err:
+            # Failed fast without a request, the host is already known down
+            stats.record_error("circuit_open")
+            raise HostUnavailable(str(err)) from err
+        except aiohttp.ClientError as err:
+            stats.record_error("connection")
+            raise HostUnavailable(f"Error communicating with API: {err}") from err
+        except TimeoutError as err:
+            stats.record_error("timeout")
+            raise HostUnavailable("Timeout fetching attributes") from err
+        except UpdateFailed:
+            raise
+        except Exception as err:
+            raise UpdateFailed(f"Unexpected error: {err}") from err
+
+        self.fingerprint = (url, etag, digest)
+
+        # Also try to fetch latest telemetry if available
+        # Note: The standard HTTP API doesn't provide a way to fetch
+        # latest telemetry directly. This would require the REST API
+        # with proper authentication. For now, we focus on attributes.
+
+        attributes = self.coordinator.keys.flatten(data)
+        stats.decode_duration.record(time.monotonic() - start)
+        return attributes
+
+    async def async_long_poll(self, timeout: int) -> dict[str, Any] | None:
+        """Wait for the next shared attribute update.
+
+        Returns None if the server closed the request without an update.
+        """
+        url = self._url(API_ATTRIBUTES_UPDATES, timeout=timeout * 1000)
+
+        async with self.coordinator.transport.request(
+            hdrs.METH_GET, url, timeout + 10, long_poll=True
+        ) as response:
+            if response.status == 408:
+                return None
+            if response.status == 401:
+                raise UpdateFailed("Invalid access token")
+            check_busy(response)
+            if response.status != 200:
+                raise UpdateFailed(f"Error subscribing: HTTP {response.status}")
+
+            if not (body := await self._async_read_body(response)):
+                return None
+
+        return await async_decode_json(self.coordinator.hass, body)
+
+    async def async_poll_rpc(self, timeout: int) -> dict[str, Any] | None:
+        """Wait for the next server-side RPC request.
+
+        Returns None if the server closed the request without an RPC.
+        """
+        url = self._url(API_RPC, timeout=timeout * 1000)
+
+        async with self.coordinator.transport.request(
+            hdrs.METH_GET, url, timeout + 10, long_poll=True
+        ) as response:
+            if response.status == 408:
+                return None
+            if response.status == 401:
+                raise UpdateFailed("Invalid access token")
+            check_busy(response)
+            if response.status != 200:
+                raise UpdateFailed(f"Error polling RPC: HTTP {response.status}")
+
+            if not (body := await self._async_read_body(response)):
+                return None
+
+        return await async_decode_json(self.coordinator.hass, body)
+
+    async def _async_read_body(self, response: aiohttp.ClientResponse) -> bytes:
+        """Read a response body, aborting once it exceeds the maximum size.
+
+        Raises ResponseTooLarge instead of buffering an oversized document.
+        """
+        limit = self.coordinator.max_response_size
+        size = response.content_length or 0
+        chunks = []
+
+        if size <= limit:
+            size = 0
+            async for chunk in response.content.iter_chunked(RESPONSE_CHUNK_SIZE):
+                size += len(chunk)
+                if size > limit:
+                    break
+                chunks.append(chunk)
+
+        if size > limit:
+            self.coordinator.stats.record_error("too_large")
+            raise ResponseTooLarge(
+                f"Response of {self.name} exceeds the maximum size of"
+                f" {limit // (1024 * 1024)} MiB"
+            )
+        return b"".join(chunks)
+
+    async def async_reply_rpc(self, request_id: int, response: Any) -> bool:
+        """Send the response of a server-side RPC request.
+
+        Raises DeviceUnreachable if ThingsBoard cannot be reached.
+        """
+        return await self._async_post(
+            API_RPC_REPLY, response, "RPC response", request_id=request_id
+        )
+
+    async def _async_post_shared_attributes(self, attributes: dict[str, Any]) -> bool:
+        """Send attributes to ThingsBoard, spooling them while it is unreachable."""
+        try:
+            success = await self.async_post_attributes(attributes)
+        except DeviceUnreachable as err:
+            if (spool := self.coordinator.spool) is not None:
+                _LOGGER.warning(
+                    "ThingsBoard is unreachable, spooling attributes of %s: %s",
+                    self.name,
+                    err,
+                )
+                await spool.async_add_attributes(self.device_id, attributes)
+                return True
+
+            _LOGGER.error("Error communicating with API: %s", err)
+            success = False
+
+        if success:
+            if (spool := self.coordinator.spool) is not None:
+                # Older spooled values must not overwrite the new ones
+                await spool.async_discard_attributes(self.device_id, list(attributes))
+            # Pick up server-side effects of the write with one deferred fetch
+            await self.resync_debouncer.async_call()
+        else:
+            # Revert the optimistic values
+            await self.async_resync()
+
+        return success
+
+    async def async_post_attributes(self, attributes: dict[str, Any]) -> bool:
+        """Post attributes to the ThingsBoard device API.
+
+        Raises DeviceUnreachable if ThingsBoard cannot be reached.
+        """
+        if not await self._async_post(API_ATTRIBUTES, attributes, "attributes"):
+            return False
+
+        _LOGGER.debug("Successfully set attributes: %s", list(attributes))
+        return True
+
+    async def async_post_telemetry(self, points: list[dict[str, Any]]) -> bool:
+        """Post timestamped telemetry points to the ThingsBoard device API.
+
+        Raises DeviceUnreachable if ThingsBoard cannot be reached.
+        """
+        return await self._async_post(API_TELEMETRY, points, "telemetry")
+
+    async def async_send_spooled(self, kind: str, payload: Any) -> bool:
+        """Send spooled writes, returning False if they have to be retried.
+
+        Writes rejected by ThingsBoard are dropped, as retrying cannot help.
+        """
+        try:
+            if kind == KIND_ATTRIBUTES:
+                success = await self.async_post_attributes(payload)
+            else:
+                success = await self.async_post_telemetry(payload)
+        except DeviceUnreachable:
+            return False
+
+        if not success:
+            _LOGGER.error("Dropping spooled %s rejected by ThingsBoard", kind)
+        elif kind == KIND_ATTRIBUTES:
+            await self.resync_debouncer.async_call()
+        return True
+
+    async def _async_post(
+        self, path: str, payload: Any, what: str, **kwargs: Any
+    ) -> bool:
+        """Post a JSON payload to a device API endpoint.
+
+        Returns False if ThingsBoard rejected the payload and raises
+        DeviceUnreachable on connection errors and server errors. Over MQTT
+        the payload is published on the matching topic instead.
+        """
+        if self.mqtt is not None:
+            await self.mqtt.async_publish(_MQTT_TOPICS[path].format(**kwargs), payload)
+            self._async_reachable()
+            return True
+
+        stats = self.coordinator.stats
+        start = time.monotonic()
+        try:
+            async with self.coordinator.transport.request(
+                hdrs.METH_POST,
+                self._url(path, **kwargs),
+                TRANSPORT_WRITE_TIMEOUT,
+                json=payload,
+            ) as response:
+                stats.request_duration.record(time.monotonic() - start)
+                if response.status not in (200, 201):
+                    stats.record_error(response.status)
+                if response.status == 401:
+                    _LOGGER.error("Invalid access token when sending %s", what)
+                    return False
+                elif response.status >= 500:
+                    raise DeviceUnreachable(f"HTTP {response.status}")
+                elif response.status not in (200, 201):
+                    _LOGGER.error("Error sending %s: HTTP %s", what, response.status)
+                    return False
+
+        except CircuitOpen as err:
+            stats.record_error("circuit_open")
+            raise DeviceUnreachable(str(err)) from err
+        except (aiohttp.ClientError, TimeoutError) as err:
+            stats.record_error(
+                "timeout" if isinstance(err, TimeoutError) else "connection"
+            )
+            raise DeviceUnreachable(str(err) or type(err).__name__) from err
+        except DeviceUnreachable:
+            raise
+        except Exception:
+            _LOGGER.exception("Unexpected error sending %s", what)
+            return False
+
+        self._async_reachable()
+        return True
+
+    @callback
+    def _async_reachable(self) -> None:
+        """Replay spooled writes now that ThingsBoard is reachable again."""
+        if self.coordinator.spool is not None:
+            self.coordinator.spool.async_schedule_replay()
+
+    async def async_shutdown(self) -> None:
+        """Send pending writes and cancel the deferred resync."""
+        await self.write_queue.async_flush()
+        self.resync_debouncer.async_cancel()
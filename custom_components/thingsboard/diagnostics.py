@@ -0,0 +1,89 @@
+"""Diagnostics support for ThingsBoard."""
+
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+
+from .const import CONF_ACCESS_TOKEN, CONF_ACCESS_TOKENS, DOMAIN
+from .coordinator import ThingsBoardDataUpdateCoordinator
+
+TO_REDACT = {CONF_ACCESS_TOKEN, CONF_ACCESS_TOKENS, CONF_USERNAME, CONF_PASSWORD}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator: ThingsBoardDataUpdateCoordinator = hass.data[DOMAIN][entry.entry_id]
+
+    diagnostics: dict[str, Any] = {
+        "entry": {
+            "data": async_redact_data(dict(entry.data), TO_REDACT),
+            "options": dict(entry.options),
+        },
+        "coordinator": {
+            "last_update_success": coordinator.last_update_success,
+            "update_interval": str(coordinator.update_interval),
+            "poll_failures": coordinator.scheduler.failures,
+            "skipped_refreshes": coordinator.skipped_refreshes,
+            "entities": {
+                platform: len(entities)
+                for platform, entities in coordinator.entities.items()
+            },
+        },
+        "stats": coordinator.stats.as_dict(),
+        "transport": coordinator.transport.as_dict(),
+        "devices": [
+            {
+                "name": device.name,
+                "available": device.available,
+                "last_error": device.last_error,
+                "keys": len((coordinator.data or {}).get(device.device_id, {})),
+                "write_queue_depth": device.write_queue.depth,
+                "mqtt_connected": (
+                    device.mqtt.connected if device.mqtt is not None else None
+                ),
+            }
+            for device in coordinator.devices.values()
+        ],
+    }
+
+    if (uploader := coordinator.telemetry_uploader) is not None:
+        diagnostics["telemetry"] = {
+            "depth": uploader.depth,
+            "sent": uploader.sent,
+            "window": (uploader.window.total_seconds() if uploader.window else None),
+            "aggregated": uploader.aggregated,
+            "dropped": uploader.dropped,
+            "failed_requests": uploader.failed_requests,
+        }
+    if (spool := coordinator.spool) is not None:
+        diagnostics["spool"] = {
+            "pending": spool.pending,
+            "evicted": spool.evicted,
+            "replayed": spool.replayed,
+        }
+    if (rpc := coordinator.rpc) is not None:
+        diagnostics["rpc"] = {
+            "handled": rpc.handled,
+            "rejected": rpc.rejected,
+            "timeouts": rpc.timeouts,
+        }
+    if (backfill := coordinator.backfill) is not None:
+        diagnostics["backfill"] = {
+            "pending_jobs": len(backfill.jobs),
+            "fetched_points": backfill.fetched_points,
+            "imported_hours": backfill.imported_hours,
+        }
+    if (gateway := coordinator.gateway) is not None:
+        diagnostics["gateway"] = {
+            "connected_devices": sorted(gateway.connected),
+            "sessions": gateway.mqtt.sessions,
+        }
+
+    return diagnostics
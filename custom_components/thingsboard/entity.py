@@ -0,0 +1,96 @@
+"""Base entity for the ThingsBoard integration."""
+
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.const import Platform
+from homeassistant.core import callback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+
+from .coordinator import DeviceKey, ThingsBoardDataUpdateCoordinator
+from .device import ThingsBoardDevice
+from .schema import EMPTY_SCHEMA, KeySchema
+
+
+class ThingsBoardEntity(CoordinatorEntity[ThingsBoardDataUpdateCoordinator]):
+    """An entity backed by a single attribute of a ThingsBoard device."""
+
+    _platform: Platform
+
+    def __init__(
+        self,
+        coordinator: ThingsBoardDataUpdateCoordinator,
+        device: ThingsBoardDevice,
+        attribute_key: str,
+    ) -> None:
+        """Initialize the entity."""
+        # Only get notified when this attribute changed
+        super().__init__(
+            coordinator,
+            context=coordinator.keys.device_key(device.device_id, attribute_key),
+        )
+
+        self._device = device
+        self._attribute_key = attribute_key
+
+        # Static attributes, the device info is shared by its entities
+        self._attr_device_info = device.device_info
+        self._attr_extra_state_attributes = {"attribute_key": attribute_key}
+        # Schema of the value, refreshed with every state write. Known before
+        # the entity is added, so the registry stores the inferred precision
+        self._schema: KeySchema = EMPTY_SCHEMA
+        self._async_update_schema()
+
+    async def async_added_to_hass(self) -> None:
+        """Refresh the schema before the first state write."""
+        self._async_update_schema()
+        await super().async_added_to_hass()
+
+    async def async_will_remove_from_hass(self) -> None:
+        """Remove the entity from the entity index."""
+        await super().async_will_remove_from_hass()
+        self.coordinator.entities[self._platform].pop(self.index_key, None)
+
+    @property
+    def index_key(self) -> DeviceKey:
+        """Return the key of the entity in the entity index."""
+        return self.coordinator_context
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write the state and count the write."""
+        self.coordinator.stats.state_writes += 1
+        self._async_update_schema()
+        super()._handle_coordinator_update()
+
+    @callback
+    def _async_update_schema(self) -> None:
+        """Look up the schema of the current value in the schema cache.
+
+        The cached schema is kept as long as the kind of the value is the same.
+        """
+        self._schema = self.coordinator.schema.get(
+            self.index_key,
+            self._value,
+            (self.coordinator.data or {}).get(self._device.device_id),
+        )
+
+    @property
+    def _value(self) -> Any:
+        """Return the current attribute value."""
+        if self.coordinator.data:
+            return self.coordinator.data.get(self._device.device_id, {}).get(
+                self._attribute_key
+            )
+        return None
+
+    @property
+    def available(self) -> bool:
+        """Return if entity is available."""
+        return (
+            self.coordinator.last_update_success
+            and self._device.available
+            and self._attribute_key
+            in self.coordinator.data.get(self._device.device_id, {})
+        )
@@ -0,0 +1,83 @@
+"""Filters limiting how often attribute sensors write their state."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any
+
+import voluptuous as vol
+
+# Filter applied to numeric attributes without a filter of their own
+DEFAULT_FILTER_KEY = "default"
+
+WRITE_FILTER_SCHEMA = vol.Schema(
+    {
+        vol.Optional("min_interval", default=0): vol.All(
+            vol.Coerce(float), vol.Range(min=0)
+        ),
+        vol.Optional("deadband", default=0): vol.All(
+            vol.Coerce(float), vol.Range(min=0)
+        ),
+        vol.Optional("deadband_percent", default=0): vol.All(
+            vol.Coerce(float), vol.Range(min=0)
+        ),
+        vol.Optional("precision"): vol.All(vol.Coerce(int), vol.Range(min=0, max=10)),
+    }
+)
+
+
+def is_number(value: Any) -> bool:
+    """Return True for int and float values, but not for booleans."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+@dataclass(frozen=True, slots=True)
+class WriteFilter:
+    """Throttling, deadband and rounding of the state of one attribute.
+
+    Deadbands and rounding only apply to numeric values. Other values are
+    written on every change, at most once per minimum interval.
+    """
+
+    # Minimum time between state writes (seconds)
+    min_interval: float = 0
+    # Smallest absolute change that is written
+    deadband: float = 0
+    # Smallest change relative to the last written value (percent)
+    deadband_percent: float = 0
+    # Decimal places numeric values are rounded to
+    precision: int | None = None
+
+    def round(self, value: Any) -> Any:
+        """Return the value rounded to the precision, if it is numeric."""
+        if self.precision is not None and is_number(value):
+            return round(value, self.precision)
+        return value
+
+    def significant(self, last: Any, value: Any) -> bool:
+        """Return True if the change from the last written value is written."""
+        last, value = self.round(last), self.round(value)
+        if not (is_number(last) and is_number(value)):
+            return last != value
+
+        change = abs(value - last)
+        return (
+            change > 0
+            and change >= self.deadband
+            and change >= abs(last) * self.deadband_percent / 100
+        )
+
+
+# Filter of numeric attributes if no "default" filter is configured: skip
+# changes below 0.1 % and write at most once per second
+BUILTIN_NUMERIC_FILTER = WriteFilter(min_interval=1, deadband_percent=0.1)
+
+
+def parse_write_filters(config: dict[str, Any]) -> dict[str, WriteFilter]:
+    """Validate the filters per attribute key, raising vol.Invalid if invalid."""
+    if not isinstance(config, dict):
+        raise vol.Invalid("Write filters must map attribute keys to settings")
+    return {
+        key: WriteFilter(**WRITE_FILTER_SCHEMA(settings or {}))
+        for key, settings in config.items()
+    }
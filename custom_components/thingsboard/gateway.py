@@ -0,0 +1,193 @@
+"""Publishing of Home Assistant devices through the ThingsBoard gateway API."""
+
+from __future__ import annotations
+
+from collections.abc import Mapping
+import logging
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers import device_registry as dr, entity_registry as er
+
+from .const import (
+    CONF_EXPORT_ENTITIES,
+    EVENT_GATEWAY_ATTRIBUTES,
+    GATEWAY_DEVICE_TYPE,
+    MQTT_TOPIC_GATEWAY_CONNECT,
+    MQTT_TOPIC_GATEWAY_DISCONNECT,
+    MQTT_TOPIC_GATEWAY_TELEMETRY,
+)
+from .device import DeviceUnreachable
+from .telemetry import TelemetrySample, build_payload
+
+if TYPE_CHECKING:
+    from .coordinator import ThingsBoardDataUpdateCoordinator
+    from .mqtt import MqttConnection
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _event_data(event: Event | Mapping[str, Any]) -> Mapping[str, Any]:
+    """Return the data of an event passed to an event filter.
+
+    Home Assistant passes the event data since 2024.4, the event before.
+    """
+    return event.data if isinstance(event, Event) else event
+
+
+class Gateway:
+    """Mirror Home Assistant devices into ThingsBoard over one gateway token.
+
+    Exported entities are grouped by their Home Assistant device. Every
+    flush publishes the samples of all devices as one gateway telemetry
+    message, after announcing devices that are not connected yet. Shared
+    attribute updates ThingsBoard sends for a gateway device are fired as
+    events for the matching Home Assistant device.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        coordinator: ThingsBoardDataUpdateCoordinator,
+        mqtt: MqttConnection,
+    ) -> None:
+        """Initialize the gateway."""
+        self.hass = hass
+        self.coordinator = coordinator
+        self.mqtt = mqtt
+
+        # Gateway devices announced on the current MQTT session
+        self.connected: set[str] = set()
+        self._session = mqtt.sessions
+        self.entity_ids: set[str] = set(
+            coordinator.entry.options.get(CONF_EXPORT_ENTITIES, [])
+        )
+        # Gateway device name of each exported entity and the reverse lookup
+        self._names: dict[str, str] = {}
+        self._device_ids: dict[str, str | None] = {}
+
+    @callback
+    def async_start(self) -> None:
+        """Receive attribute updates and follow registry changes."""
+        self.mqtt.gateway_handler = self.async_handle_attributes
+        entry = self.coordinator.entry
+        entry.async_on_unload(
+            self.hass.bus.async_listen(
+                dr.EVENT_DEVICE_REGISTRY_UPDATED,
+                self._async_registry_updated,
+                event_filter=self._async_filter_device_event,
+            )
+        )
+        entry.async_on_unload(
+            self.hass.bus.async_listen(
+                er.EVENT_ENTITY_REGISTRY_UPDATED,
+                self._async_registry_updated,
+                event_filter=self._async_filter_entity_event,
+            )
+        )
+
+    @callback
+    def _async_filter_device_event(self, event: Event | Mapping[str, Any]) -> bool:
+        """Return True if a device of an exported entity changed."""
+        event_data = _event_data(event)
+        return event_data.get("device_id") in self._device_ids.values()
+
+    @callback
+    def _async_filter_entity_event(self, event: Event | Mapping[str, Any]) -> bool:
+        """Return True if an exported entity changed."""
+        event_data = _event_data(event)
+        return (
+            event_data.get("entity_id") in self.entity_ids
+            or event_data.get("old_entity_id") in self.entity_ids
+        )
+
+    @callback
+    def _async_registry_updated(self, event: Event) -> None:
+        """Resolve device names again after exported entities changed."""
+        self._names.clear()
+        self._device_ids.clear()
+
+    def device_name(self, entity_id: str) -> str:
+        """Return the gateway device of an exported entity.
+
+        Entities without a Home Assistant device become a device of their own.
+        """
+        if (name := self._names.get(entity_id)) is not None:
+            return name
+
+        device_id = None
+        name = entity_id
+        if (entity := er.async_get(self.hass).async_get(entity_id)) is not None and (
+            device := dr.async_get(self.hass).async_get(entity.device_id or "")
+        ) is not None:
+            device_id = device.id
+            name = device.name_by_user or device.name or device.id
+
+        self._names[entity_id] = name
+        self._device_ids[name] = device_id
+        return name
+
+    async def async_publish_telemetry(self, samples: list[TelemetrySample]) -> bool:
+        """Publish the samples of all devices in one message.
+
+        Raises DeviceUnreachable if the MQTT connection is down.
+        """
+        if self._session != self.mqtt.sessions:
+            # The broker forgot the devices of the previous session
+            self._session = self.mqtt.sessions
+            self.connected.clear()
+
+        by_device: dict[str, list[TelemetrySample]] = {}
+        for sample in samples:
+            by_device.setdefault(self.device_name(sample[1]), []).append(sample)
+
+        for name in by_device.keys() - self.connected:
+            await self.mqtt.async_publish(
+                MQTT_TOPIC_GATEWAY_CONNECT,
+                {"device": name, "type": GATEWAY_DEVICE_TYPE},
+            )
+            self.connected.add(name)
+            _LOGGER.debug("Connected gateway device %s", name)
+
+        await self.mqtt.async_publish(
+            MQTT_TOPIC_GATEWAY_TELEMETRY,
+            {name: build_payload(group) for name, group in by_device.items()},
+        )
+        return True
+
+    async def async_disconnect(self) -> None:
+        """Announce that all connected devices went offline."""
+        while self.connected:
+            name = self.connected.pop()
+            try:
+                await self.mqtt.async_publish(
+                    MQTT_TOPIC_GATEWAY_DISCONNECT, {"device": name}
+                )
+            except DeviceUnreachable:
+                self.connected.clear()
+                return
+
+    @callback
+    def async_handle_attributes(self, data: Any) -> None:
+        """Fire an event for a shared attribute update of a gateway device.
+
+        ThingsBoard sends {"device": "<name>", "data": {...}}.
+        """
+        if not isinstance(data, dict) or "device" not in data:
+            return
+
+        name = data["device"]
+        if name not in self._device_ids:
+            # Not resolved since the last restart or registry change
+            for entity_id in self.entity_ids:
+                self.device_name(entity_id)
+
+        self.hass.bus.async_fire(
+            EVENT_GATEWAY_ATTRIBUTES,
+            {
+                "config_entry_id": self.coordinator.entry.entry_id,
+                "device": name,
+                "device_id": self._device_ids.get(name),
+                "attributes": data.get("data", {}),
+            },
+        )
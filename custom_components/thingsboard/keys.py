@@ -0,0 +1,56 @@
+"""Interned attribute keys of a ThingsBoard entry."""
+
+from __future__ import annotations
+
+from collections.abc import Mapping
+import sys
+from typing import Any
+
+# Attribute keys are qualified by the device they belong to
+DeviceKey = tuple[str, str]
+
+# Attribute scopes of a ThingsBoard attribute document
+SCOPES = ("client", "shared")
+
+
+class KeyTable:
+    """Hand out one shared object per attribute key.
+
+    Every refresh and pushed update resolves its keys through the table, so
+    the coordinator data, the entity index and the key listeners share a
+    single copy of each key instead of formatting new strings each time.
+    """
+
+    __slots__ = ("_device_keys", "_flat")
+
+    def __init__(self) -> None:
+        """Initialize the table."""
+        self._flat: dict[str, dict[str, str]] = {scope: {} for scope in SCOPES}
+        self._device_keys: dict[DeviceKey, DeviceKey] = {}
+
+    def flat(self, scope: str, key: str) -> str:
+        """Return the flattened key of an attribute, e.g. "shared_mode"."""
+        keys = self._flat[scope]
+        if (flat := keys.get(key)) is None:
+            flat = keys[key] = sys.intern(f"{scope}_{key}")
+        return flat
+
+    def flatten(self, data: Mapping[str, Any]) -> dict[str, Any]:
+        """Flatten an attribute document into "client_"/"shared_" prefixed keys.
+
+        ThingsBoard returns attributes as {"client": {...}, "shared": {...}}.
+        """
+        flattened: dict[str, Any] = {}
+        for scope in SCOPES:
+            if scope in data:
+                keys = self._flat[scope]
+                for key, value in data[scope].items():
+                    if (flat := keys.get(key)) is None:
+                        flat = self.flat(scope, key)
+                    flattened[flat] = value
+        return flattened
+
+    def device_key(self, device_id: str, key: str) -> DeviceKey:
+        """Return the shared (device ID, attribute key) pair."""
+        device_key = (device_id, key)
+        return self._device_keys.setdefault(device_key, device_key)
@@ -0,0 +1,261 @@
+"""ThingsBoard device access through the device MQTT API."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable, Collection
+import itertools
+import json
+import logging
+from typing import TYPE_CHECKING, Any
+from urllib.parse import urlparse
+
+import aiomqtt
+
+from homeassistant.helpers.update_coordinator import UpdateFailed
+from homeassistant.util.ssl import client_context
+
+from .const import (
+    DOMAIN,
+    LONG_POLL_BACKOFF_MAX,
+    LONG_POLL_BACKOFF_MIN,
+    MQTT_TOPIC_ATTRIBUTES,
+    MQTT_TOPIC_ATTRIBUTES_REQUEST,
+    MQTT_TOPIC_ATTRIBUTES_RESPONSE,
+    MQTT_TOPIC_GATEWAY_ATTRIBUTES,
+    MQTT_TOPIC_RPC_REQUEST,
+)
+from .device import DeviceUnreachable, async_decode_json
+from .rpc import RpcRequest
+from .scheduler import jitter
+
+if TYPE_CHECKING:
+    from .device import ThingsBoardDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+# MQTT v3.1.1 CONNACK codes of rejected credentials
+_NOT_AUTHORIZED = (4, 5)
+
+
+def mqtt_hostname(host: str) -> str:
+    """Return the MQTT broker hostname of a ThingsBoard host URL."""
+    return urlparse(host).hostname or host
+
+
+def _scope_keys(keys: Collection[str], prefix: str) -> str:
+    """Join the attribute names of one scope for an attribute request."""
+    return ",".join(key[len(prefix) :] for key in keys if key.startswith(prefix))
+
+
+def _create_client(host: str, port: int, tls: bool, token: str) -> aiomqtt.Client:
+    """Create a client authenticating with a device access token."""
+    return aiomqtt.Client(
+        mqtt_hostname(host),
+        port=port,
+        username=token,
+        tls_context=client_context() if tls else None,
+        timeout=10,
+    )
+
+
+async def async_check_mqtt_token(host: str, port: int, tls: bool, token: str) -> bool:
+    """Check that a device access token can connect.
+
+    Returns False if the broker rejected the token and raises
+    aiomqtt.MqttError if it cannot be reached.
+    """
+    try:
+        async with _create_client(host, port, tls, token):
+            return True
+    except aiomqtt.MqttCodeError as err:
+        if err.rc in _NOT_AUTHORIZED:
+            return False
+        raise
+
+
+class MqttConnection:
+    """Persistent MQTT connection of a device access token.
+
+    Shared attribute updates are pushed into the coordinator. Attribute
+    requests and writes use the same connection.
+    """
+
+    def __init__(
+        self, device: ThingsBoardDevice, host: str, port: int, tls: bool
+    ) -> None:
+        """Initialize the connection."""
+        self.device = device
+        self.host = host
+        self.port = port
+        self.tls = tls
+
+        self._client: aiomqtt.Client | None = None
+        self._connected = asyncio.Event()
+        self._request_ids = itertools.count(1)
+        self._requests: dict[str, asyncio.Future[dict[str, Any]]] = {}
+        # Receives server-side RPC requests if RPC handling is enabled
+        self.rpc_handler: Callable[[RpcRequest], None] | None = None
+        # Receives attribute updates of gateway devices in gateway mode
+        self.gateway_handler: Callable[[Any], None] | None = None
+        # Number of sessions so far, the broker forgets gateway devices
+        # of earlier ones
+        self.sessions = 0
+
+    @property
+    def connected(self) -> bool:
+        """Return True if the connection is up."""
+        return self._connected.is_set()
+
+    async def async_run(self) -> None:
+        """Keep the connection up, reconnecting with backoff.
+
+        This runs as a background task of the config entry until it is unloaded.
+        """
+        hass = self.device.coordinator.hass
+        backoff = LONG_POLL_BACKOFF_MIN
+        resync = False
+
+        while True:
+            try:
+                async with _create_client(
+                    self.host, self.port, self.tls, self.device.token
+                ) as client:
+                    await client.subscribe(MQTT_TOPIC_ATTRIBUTES, qos=1)
+                    await client.subscribe(MQTT_TOPIC_ATTRIBUTES_RESPONSE, qos=1)
+                    if self.rpc_handler is not None:
+                        await client.subscribe(MQTT_TOPIC_RPC_REQUEST, qos=1)
+                    if self.gateway_handler is not None:
+                        await client.subscribe(MQTT_TOPIC_GATEWAY_ATTRIBUTES, qos=1)
+                    self._client = client
+                    self.sessions += 1
+                    self._connected.set()
+                    backoff = LONG_POLL_BACKOFF_MIN
+                    _LOGGER.debug("MQTT connection of %s is up", self.device.name)
+
+                    if resync:
+                        # Updates may have been missed while disconnected
+                        self.device.coordinator.entry.async_create_background_task(
+                            hass,
+                            self.device.async_resync(),
+                            f"{DOMAIN}_mqtt_resync_{self.device.device_id}",
+                        )
+
+                    async for message in client.messages:
+                        try:
+                            await self._async_handle_message(
+                                str(message.topic), message.payload
+                            )
+                        except Exception:
+                            # A bad message must not end the connection
+                            _LOGGER.exception(
+                                "Error handling MQTT message on %s", message.topic
+                            )
+
+            except aiomqtt.MqttError as err:
+                _LOGGER.debug("MQTT connection of %s failed: %s", self.device.name, err)
+            finally:
+                self._client = None
+                self._connected.clear()
+                for future in self._requests.values():
+                    if not future.done():
+                        future.set_exception(DeviceUnreachable("Connection lost"))
+
+            resync = True
+            delay = jitter(backoff)
+            _LOGGER.debug("Reconnecting %s in %.1f s", self.device.name, delay)
+            await asyncio.sleep(delay)
+            backoff = min(backoff * 2, LONG_POLL_BACKOFF_MAX)
+
+    async def _async_handle_message(self, topic: str, payload: Any) -> None:
+        """Dispatch a message received on a subscribed topic."""
+        if len(payload) > self.device.coordinator.max_response_size:
+            self.device.coordinator.stats.record_error("too_large")
+            _LOGGER.warning("Dropping oversized MQTT payload on %s", topic)
+            return
+
+        try:
+            data = await async_decode_json(self.device.coordinator.hass, payload)
+        except ValueError:
+            _LOGGER.warning("Invalid MQTT payload on %s", topic)
+            return
+
+        if topic == MQTT_TOPIC_ATTRIBUTES:
+            if not isinstance(data, dict):
+                _LOGGER.warning("Invalid attribute update on %s", topic)
+                return
+            self.device.coordinator.async_merge_shared_attributes(
+                self.device.device_id, data
+            )
+            return
+
+        if topic == MQTT_TOPIC_GATEWAY_ATTRIBUTES:
+            if self.gateway_handler is not None:
+                self.gateway_handler(data)
+            return
+
+        prefix, _, request_id = topic.rpartition("/")
+        if prefix == MQTT_TOPIC_RPC_REQUEST.rpartition("/")[0]:
+            if not request_id.isdecimal() or not isinstance(data, dict):
+                _LOGGER.warning("Invalid RPC request on %s", topic)
+                return
+            if self.rpc_handler is not None:
+                self.rpc_handler(
+                    RpcRequest(
+                        self.device,
+                        int(request_id),
+                        data.get("method", ""),
+                        data.get("params"),
+                    )
+                )
+            return
+
+        if (future := self._requests.get(request_id)) and not future.done():
+            future.set_result(data)
+
+    async def async_request_attributes(
+        self, keys: Collection[str] | None, timeout: float
+    ) -> dict[str, Any]:
+        """Request the attribute document, or only the given flattened keys.
+
+        Raises UpdateFailed if there is no response within the timeout.
+        """
+        payload = {}
+        if keys is not None:
+            payload = {
+                "clientKeys": _scope_keys(keys, "client_"),
+                "sharedKeys": _scope_keys(keys, "shared_"),
+            }
+
+        request_id = str(next(self._request_ids))
+        future = self._requests[request_id] = asyncio.get_running_loop().create_future()
+        try:
+            async with asyncio.timeout(timeout):
+                await self._connected.wait()
+                if (client := self._client) is None:
+                    raise DeviceUnreachable("Not connected")
+                await client.publish(
+                    MQTT_TOPIC_ATTRIBUTES_REQUEST.format(request_id=request_id),
+                    json.dumps(payload),
+                    qos=1,
+                )
+                return await future
+        except TimeoutError as err:
+            raise UpdateFailed("Timeout requesting attributes over MQTT") from err
+        except (aiomqtt.MqttError, DeviceUnreachable) as err:
+            raise UpdateFailed(f"Error requesting attributes over MQTT: {err}") from err
+        finally:
+            del self._requests[request_id]
+
+    async def async_publish(self, topic: str, payload: Any) -> None:
+        """Publish a JSON payload.
+
+        Raises DeviceUnreachable if the connection is down.
+        """
+        if self._client is None:
+            raise DeviceUnreachable("Not connected")
+
+        try:
+            await self._client.publish(topic, json.dumps(payload), qos=1)
+        except aiomqtt.MqttError as err:
+            raise DeviceUnreachable(str(err)) from err
@@ -2,18 +2,20 @@
 
 from __future__ import annotations
 
+from collections.abc import Iterable
 import logging
-from typing import Any
 
 from homeassistant.components.number import NumberEntity, NumberMode
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant, callback
-from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
-from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 from .const import DOMAIN
-from .coordinator import ThingsBoardDataUpdateCoordinator
+from .coordinator import DeviceKey, ThingsBoardDataUpdateCoordinator
+from .device import ThingsBoardDevice
+from .entity import ThingsBoardEntity
+from .schema import KIND_NUMBER, value_kind
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -27,120 +29,113 @@ async def async_setup_entry(
     coordinator: ThingsBoardDataUpdateCoordinator = hass.data[DOMAIN][entry.entry_id]
 
     @callback
-    def async_add_numbers() -> None:
+    def async_add_numbers(keys: Iterable[DeviceKey]) -> None:
         """Add number entities for writable numeric attributes."""
         entities = []
+        known = coordinator.entities[Platform.NUMBER]
 
         if coordinator.data:
-            for key, value in coordinator.data.items():
-                # Only create numbers for shared attributes (controllable)
-                # and only if they are numeric
-                if key.startswith("shared_") and isinstance(value, (int, float)):
-                    entity_id = f"number.thingsboard_{key}"
-
-                    # Check if entity already exists
-                    if entity_id not in [
-                        entity.entity_id
-                        for entity in hass.data[DOMAIN].get("number_entities", [])
-                    ]:
-                        entities.append(
-                            ThingsBoardNumber(
-                                coordinator=coordinator,
-                                entry=entry,
-                                attribute_key=key,
-                            )
-                        )
+            for device_key in keys:
+                device_id, key = device_key
+                value = coordinator.data.get(device_id, {}).get(key)
+                # Only create numbers for tracked shared attributes (controllable),
+                # only if they are numeric
+                # and only if they don't exist yet
+                if (
+                    key.startswith("shared_")
+                    and value_kind(value) == KIND_NUMBER
+                    and device_key not in known
+                    and coordinator.is_tracked(key)
+                ):
+                    entity = ThingsBoardNumber(
+                        coordinator=coordinator,
+                        device=coordinator.devices[device_id],
+                        attribute_key=key,
+                    )
+                    known[entity.index_key] = entity
+                    entities.append(entity)
 
         if entities:
-            # Store entities for tracking
-            if "number_entities" not in hass.data[DOMAIN]:
-                hass.data[DOMAIN]["number_entities"] = []
-            hass.data[DOMAIN]["number_entities"].extend(entities)
-
             async_add_entities(entities)
 
+    @callback
+    def async_add_new_numbers() -> None:
+        """Add number entities for attributes added or changed by the last update."""
+        # A changed value may have become numeric
+        delta = coordinator.last_delta
+        async_add_numbers(delta.added | delta.changed)
+
     # Initial setup
-    async_add_numbers()
+    async_add_numbers(coordinator.device_keys())
 
     # Listen for coordinator updates to add new entities
-    entry.async_on_unload(coordinator.async_add_listener(async_add_numbers))
+    entry.async_on_unload(coordinator.async_add_listener(async_add_new_numbers))
 
 
-class ThingsBoardNumber(CoordinatorEntity, NumberEntity):
+class ThingsBoardNumber(ThingsBoardEntity, NumberEntity):
     """Representation of a ThingsBoard Number entity."""
 
     _attr_mode = NumberMode.BOX
+    _platform = Platform.NUMBER
 
     def __init__(
         self,
         coordinator: ThingsBoardDataUpdateCoordinator,
-        entry: ConfigEntry,
+        device: ThingsBoardDevice,
         attribute_key: str,
     ) -> None:
         """Initialize the number entity."""
-        super().__init__(coordinator)
+        super().__init__(coordinator, device, attribute_key)
 
-        self._attribute_key = attribute_key
-        self._entry = entry
-
-        # Remove 'shared_' prefix for display
-        display_name = attribute_key.replace("shared_", "")
+        # Attribute name without the 'shared_' prefix, for display and writes
+        display_name = self._attribute_name = attribute_key.replace("shared_", "")
 
         # Create unique ID
-        self._attr_unique_id = f"{entry.entry_id}_{attribute_key}_number"
+        self._attr_unique_id = f"{device.device_id}_{attribute_key}_number"
 
         # Set name
-        self._attr_name = f"ThingsBoard {display_name.replace('_', ' ').title()}"
-
-        # Device info
-        self._attr_device_info = DeviceInfo(
-            identifiers={(DOMAIN, entry.entry_id)},
-            name="ThingsBoard Device",
-            manufacturer="ThingsBoard",
-            model="HTTP API Device",
-            configuration_url=coordinator.host,
+        self._attr_name = (
+            f"{device.entity_name_prefix} {display_name.replace('_', ' ').title()}"
         )
 
-        # Set reasonable defaults for min/max
-        self._attr_native_min_value = -1000000
-        self._attr_native_max_value = 1000000
-        self._attr_native_step = 0.1
-
     @property
     def native_value(self) -> float | None:
         """Return the current value."""
-        if self.coordinator.data:
-            value = self.coordinator.data.get(self._attribute_key)
-            if isinstance(value, (int, float)):
-                return float(value)
+        value = self._value
+        if self._schema.kind == KIND_NUMBER and value is not None:
+            return float(value)
         return None
 
+    @property
+    def native_min_value(self) -> float:
+        """Return the minimum given by the "<key>_min" attribute."""
+        return self._schema.min_value
+
+    @property
+    def native_max_value(self) -> float:
+        """Return the maximum given by the "<key>_max" attribute."""
+        return self._schema.max_value
+
+    @property
+    def native_step(self) -> float:
+        """Return the step given by "<key>_step" or the precision of the values."""
+        return self._schema.step
+
+    @property
+    def native_unit_of_measurement(self) -> str | None:
+        """Return the unit given by the "<key>_unit" attribute."""
+        return self._schema.unit
+
     async def async_set_native_value(self, value: float) -> None:
         """Set new value."""
-        # Extract the actual attribute name (without 'shared_' prefix)
-        attribute_name = self._attribute_key.replace("shared_", "")
+        attribute_name = self._attribute_name
 
         # Set the attribute on ThingsBoard
         success = await self.coordinator.async_set_shared_attributes(
-            {attribute_name: value}
+            {attribute_name: value}, self._device.device_id
         )
 
         if success:
             _LOGGER.debug("Successfully set %s to %s", attribute_name, value)
         else:
             _LOGGER.error("Failed to set %s to %s", attribute_name, value)
-
-    @property
-    def available(self) -> bool:
-        """Return if entity is available."""
-        return (
-            self.coordinator.last_update_success
-            and self._attribute_key in self.coordinator.data
-        )
-
-    @property
-    def extra_state_attributes(self) -> dict[str, Any]:
-        """Return extra attributes."""
-        return {
-            "attribute_key": self._attribute_key,
-        }
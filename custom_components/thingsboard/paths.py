@@ -0,0 +1,68 @@
+"""Path selectors extracting nested values of JSON attributes."""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+from dataclasses import dataclass
+import logging
+from typing import Any
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class PathSelector:
+    """A compiled selector like "shared_config.pid.kp".
+
+    The first segment is the flattened attribute key, the others select
+    object members or, if numeric, list items.
+    """
+
+    text: str
+    key: str
+    # Member name and list index of each segment
+    path: tuple[tuple[str, int | None], ...]
+
+    @classmethod
+    def compile(cls, text: str) -> PathSelector:
+        """Compile a selector, raising ValueError if it is malformed."""
+        key, *segments = text.strip().split(".")
+        if not key or not segments or not all(segments):
+            raise ValueError(f"Invalid path selector: {text}")
+        return cls(
+            text.strip(),
+            key,
+            tuple(
+                (segment, int(segment) if segment.isdigit() else None)
+                for segment in segments
+            ),
+        )
+
+    @property
+    def name(self) -> str:
+        """Return a display name, e.g. "Shared Config Pid Kp"."""
+        return self.text.replace(".", " ").replace("_", " ").title()
+
+    def extract(self, value: Any) -> Any:
+        """Return the selected value, or None if the path does not exist."""
+        for member, index in self.path:
+            if isinstance(value, dict):
+                value = value.get(member)
+            elif isinstance(value, list) and index is not None and index < len(value):
+                value = value[index]
+            else:
+                return None
+        return value
+
+
+def compile_selectors(texts: Iterable[str]) -> dict[str, tuple[PathSelector, ...]]:
+    """Compile selectors and group them by attribute key, skipping invalid ones."""
+    selectors: dict[str, list[PathSelector]] = {}
+    for text in texts:
+        try:
+            selector = PathSelector.compile(text)
+        except ValueError as err:
+            _LOGGER.warning("%s", err)
+            continue
+        selectors.setdefault(selector.key, []).append(selector)
+    return {key: tuple(group) for key, group in selectors.items()}
@@ -0,0 +1,129 @@
+"""ThingsBoard REST API access with tenant credentials."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+from aiohttp import hdrs
+
+from homeassistant.core import HomeAssistant
+
+from .const import API_LOGIN, API_TIMESERIES, TRANSPORT_READ_TIMEOUT
+from .device import check_busy, async_decode_json
+from .transport import HostTransport
+
+
+class RestApiError(Exception):
+    """Error to indicate a REST API request failed."""
+
+
+class TenantAuthFailed(RestApiError):
+    """Error to indicate the tenant credentials were rejected."""
+
+
+class TenantClient:
+    """REST API client logging in with the credentials of a tenant user.
+
+    Requests go through the transport of the host. The JWT is fetched with
+    the first request and renewed once a request is rejected with HTTP 401.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        transport: HostTransport,
+        username: str,
+        password: str,
+    ) -> None:
+        """Initialize the client."""
+        self.hass = hass
+        self.transport = transport
+        self.username = username
+        self.password = password
+
+        self._token: str | None = None
+        self._login_lock = asyncio.Lock()
+
+    async def async_login(self) -> str:
+        """Log in and return the JWT.
+
+        Raises TenantAuthFailed if the credentials are rejected.
+        """
+        async with self.transport.request(
+            hdrs.METH_POST,
+            f"{self.transport.host}{API_LOGIN}",
+            TRANSPORT_READ_TIMEOUT,
+            json={"username": self.username, "password": self.password},
+        ) as response:
+            if response.status == 401:
+                raise TenantAuthFailed("Invalid tenant credentials")
+            check_busy(response)
+            if response.status != 200:
+                raise RestApiError(f"Login failed: HTTP {response.status}")
+            data = await async_decode_json(self.hass, await response.read())
+
+        if not isinstance(data, dict) or not isinstance(data.get("token"), str):
+            raise RestApiError("Login response without token")
+        self._token = data["token"]
+        return self._token
+
+    async def _async_token(self, rejected: str | None = None) -> str:
+        """Return the JWT, logging in again if it was rejected."""
+        async with self._login_lock:
+            if self._token is None or self._token == rejected:
+                return await self.async_login()
+            return self._token
+
+    async def async_get(self, path: str, params: dict[str, Any]) -> Any:
+        """Fetch and decode a REST API resource.
+
+        Raises RestApiError if it cannot be fetched, ServerBusy if
+        ThingsBoard asked to retry later, and aiohttp.ClientError or
+        TimeoutError on connection errors.
+        """
+        token = await self._async_token()
+        if (body := await self._async_fetch(path, params, token)) is None:
+            # The token expired
+            token = await self._async_token(rejected=token)
+            if (body := await self._async_fetch(path, params, token)) is None:
+                raise TenantAuthFailed("Tenant credentials were rejected")
+        return await async_decode_json(self.hass, body)
+
+    async def _async_fetch(
+        self, path: str, params: dict[str, Any], token: str
+    ) -> bytes | None:
+        """Fetch a REST API resource, returning None if the token was rejected."""
+        async with self.transport.request(
+            hdrs.METH_GET,
+            f"{self.transport.host}{path}",
+            TRANSPORT_READ_TIMEOUT,
+            params=params,
+            headers={"X-Authorization": f"Bearer {token}"},
+        ) as response:
+            if response.status == 401:
+                return None
+            check_busy(response)
+            if response.status != 200:
+                raise RestApiError(f"Error fetching {path}: HTTP {response.status}")
+            return await response.read()
+
+    async def async_get_timeseries(
+        self, device: str, key: str, start: int, end: int, limit: int
+    ) -> list[dict[str, Any]]:
+        """Return the raw points of a key in [start, end), oldest first.
+
+        Timestamps are in milliseconds. At most limit points are returned.
+        """
+        data = await self.async_get(
+            API_TIMESERIES.format(device=device),
+            {
+                "keys": key,
+                "startTs": start,
+                "endTs": end,
+                "limit": limit,
+                "orderBy": "ASC",
+                "agg": "NONE",
+            },
+        )
+        return data.get(key, []) if isinstance(data, dict) else []
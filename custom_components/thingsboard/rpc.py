@@ -0,0 +1,304 @@
+"""Handling of server-side RPC requests sent to ThingsBoard devices."""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+import logging
+from typing import TYPE_CHECKING, Any
+
+import aiohttp
+import voluptuous as vol
+
+from homeassistant.core import (
+    CALLBACK_TYPE,
+    HomeAssistant,
+    SupportsResponse,
+    callback,
+)
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.update_coordinator import UpdateFailed
+
+from .const import (
+    DOMAIN,
+    EVENT_RPC_REQUEST,
+    LONG_POLL_BACKOFF_MAX,
+    LONG_POLL_BACKOFF_MIN,
+    RPC_QUEUE_SIZE,
+)
+from .device import DeviceUnreachable, ServerBusy, ThingsBoardDevice
+from .scheduler import jitter
+
+if TYPE_CHECKING:
+    from .coordinator import ThingsBoardDataUpdateCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class RpcRequest:
+    """A server-side RPC request to a device."""
+
+    device: ThingsBoardDevice
+    request_id: int
+    method: str
+    params: Any
+
+
+class RpcDispatcher:
+    """Turn RPC requests into Home Assistant service calls or events.
+
+    Methods named like an allowed service (e.g. "light.turn_on") call that
+    service with the RPC params as service data. They run on a bounded pool
+    of workers, each call limited by the timeout, and the result is sent back
+    as the RPC response. Any other method fires an event, which automations
+    can answer with the rpc_reply service within the timeout.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        coordinator: ThingsBoardDataUpdateCoordinator,
+        workers: int,
+        timeout: float,
+        services: list[str],
+    ) -> None:
+        """Initialize the dispatcher."""
+        self.hass = hass
+        self.coordinator = coordinator
+        self.workers = workers
+        self.timeout = timeout
+        self.services = frozenset(services)
+
+        self._queue: asyncio.Queue[RpcRequest] = asyncio.Queue(RPC_QUEUE_SIZE)
+        # Event requests waiting for a reply, with the callback expiring them
+        self._pending: dict[tuple[str, int], CALLBACK_TYPE] = {}
+
+        # Counters
+        self.handled = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+        # MQTT connections deliver requests on their own subscription
+        for device in coordinator.devices.values():
+            if device.mqtt is not None:
+                device.mqtt.rpc_handler = self.async_submit
+
+    @callback
+    def async_start(self) -> None:
+        """Start the workers and the RPC long-polls of HTTP devices.
+
+        The tasks are bound to the config entry and are cancelled on unload.
+        """
+        entry = self.coordinator.entry
+        for index in range(self.workers):
+            entry.async_create_background_task(
+                self.hass, self._async_worker(), f"{DOMAIN}_rpc_worker_{index}"
+            )
+        for device in self.coordinator.devices.values():
+            if device.mqtt is None:
+                entry.async_create_background_task(
+                    self.hass,
+                    self._async_poll_loop(device),
+                    f"{DOMAIN}_rpc_{device.device_id}",
+                )
+
+    @callback
+    def async_stop(self) -> None:
+        """Forget the event requests still waiting for a reply."""
+        while self._pending:
+            _, cancel = self._pending.popitem()
+            cancel()
+
+    @callback
+    def async_submit(self, request: RpcRequest) -> None:
+        """Dispatch a received RPC request."""
+        _LOGGER.debug(
+            "Received RPC %s (%s) for %s",
+            request.method,
+            request.request_id,
+            request.device.name,
+        )
+
+        if request.method not in self.services:
+            self._async_fire_event(request)
+            return
+
+        try:
+            self._queue.put_nowait(request)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            _LOGGER.warning(
+                "Dropping RPC %s for %s, too many pending requests",
+                request.method,
+                request.device.name,
+            )
+
+    @callback
+    def _async_fire_event(self, request: RpcRequest) -> None:
+        """Fire an event for a request and wait for its reply in the background."""
+        key = (request.device.device_id, request.request_id)
+
+        @callback
+        def _async_expire(_now: Any) -> None:
+            """Stop waiting for a reply."""
+            if self._pending.pop(key, None) is not None:
+                self.timeouts += 1
+
+        self._pending[key] = async_call_later(self.hass, self.timeout, _async_expire)
+
+        registry_device = dr.async_get(self.hass).async_get_device(
+            identifiers={(DOMAIN, request.device.device_id)}
+        )
+        self.hass.bus.async_fire(
+            EVENT_RPC_REQUEST,
+            {
+                "config_entry_id": self.coordinator.entry.entry_id,
+                "device_id": registry_device.id if registry_device else None,
+                "request_id": request.request_id,
+                "method": request.method,
+                "params": request.params,
+            },
+        )
+        self.handled += 1
+
+    async def async_reply(
+        self, device: ThingsBoardDevice, request_id: int, response: Any
+    ) -> bool:
+        """Send the reply of an automation to an event request.
+
+        Returns False if the request is unknown, expired or already answered.
+        """
+        if (cancel := self._pending.pop((device.device_id, request_id), None)) is None:
+            _LOGGER.error("RPC request %s is unknown or expired", request_id)
+            return False
+
+        cancel()
+        return await self._async_send_reply(device, request_id, response)
+
+    async def _async_worker(self) -> None:
+        """Handle service requests one at a time."""
+        while True:
+            request = await self._queue.get()
+            try:
+                await self._async_handle(request)
+            except Exception:
+                # Keep the worker alive for the next requests
+                _LOGGER.exception(
+                    "Could not reply to RPC %s for %s",
+                    request.method,
+                    request.device.name,
+                )
+            finally:
+                self._queue.task_done()
+
+    async def _async_handle(self, request: RpcRequest) -> None:
+        """Call the service of a request and send the response."""
+        try:
+            response = await self._async_call_service(request)
+            await self._async_send_reply(request.device, request.request_id, response)
+        except Exception as err:
+            _LOGGER.exception(
+                "Unexpected error handling RPC %s for %s",
+                request.method,
+                request.device.name,
+            )
+            await self._async_send_reply(
+                request.device,
+                request.request_id,
+                {"error": str(err) or type(err).__name__},
+            )
+
+    async def _async_call_service(self, request: RpcRequest) -> Any:
+        """Call the service of a request and return the RPC response."""
+        domain, _, service = request.method.partition(".")
+        params = request.params if isinstance(request.params, dict) else {}
+
+        try:
+            return_response = (
+                self.hass.services.supports_response(domain, service)
+                != SupportsResponse.NONE
+            )
+            async with asyncio.timeout(self.timeout):
+                response = await self.hass.services.async_call(
+                    domain,
+                    service,
+                    params,
+                    blocking=True,
+                    return_response=return_response,
+                )
+        except TimeoutError:
+            self.timeouts += 1
+            _LOGGER.warning(
+                "RPC %s for %s timed out", request.method, request.device.name
+            )
+            return {"error": "timeout"}
+        except (HomeAssistantError, vol.Invalid) as err:
+            _LOGGER.warning(
+                "RPC %s for %s failed: %s", request.method, request.device.name, err
+            )
+            return {"error": str(err)}
+
+        self.handled += 1
+        return response if return_response else {"success": True}
+
+    async def _async_send_reply(
+        self, device: ThingsBoardDevice, request_id: int, response: Any
+    ) -> bool:
+        """Post an RPC response, returning False if it could not be sent."""
+        try:
+            return await device.async_reply_rpc(request_id, response)
+        except DeviceUnreachable as err:
+            _LOGGER.warning(
+                "Could not reply to RPC %s of %s: %s", request_id, device.name, err
+            )
+            return False
+
+    async def _async_poll_loop(self, device: ThingsBoardDevice) -> None:
+        """Long-poll RPC requests of an HTTP device."""
+        backoff = LONG_POLL_BACKOFF_MIN
+
+        while True:
+            try:
+                request = await device.async_poll_rpc(
+                    self.coordinator.long_poll_timeout
+                )
+            except (
+                aiohttp.ClientError,
+                TimeoutError,
+                ValueError,
+                UpdateFailed,
+            ) as err:
+                delay = jitter(backoff)
+                if isinstance(err, ServerBusy) and err.retry_after:
+                    delay = max(delay, err.retry_after)
+                _LOGGER.debug(
+                    "RPC subscription of %s failed, retrying in %.1f s: %s",
+                    device.name,
+                    delay,
+                    err,
+                )
+                await asyncio.sleep(delay)
+                backoff = min(backoff * 2, LONG_POLL_BACKOFF_MAX)
+                continue
+
+            backoff = LONG_POLL_BACKOFF_MIN
+
+            if not request:
+                continue
+            try:
+                rpc_request = RpcRequest(
+                    device,
+                    int(request["id"]),
+                    str(request["method"]),
+                    request.get("params"),
+                )
+            except (AttributeError, KeyError, TypeError, ValueError):
+                # A malformed request must not end the subscription
+                _LOGGER.warning(
+                    "Ignoring malformed RPC request for %s: %s", device.name, request
+                )
+                continue
+            self.async_submit(rpc_request)
@@ -0,0 +1,82 @@
+"""Adaptive poll scheduling for ThingsBoard entries."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+import random
+
+from homeassistant.util import dt as dt_util
+
+# Interval factors applied after a full poll cycle
+_SHRINK_FACTOR = 0.5
+_GROW_FACTOR = 1.5
+
+
+def jitter(delay: float) -> float:
+    """Spread a retry delay randomly over its upper half."""
+    return random.uniform(delay / 2, delay)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Return the delay of a Retry-After header in seconds.
+
+    The header holds either a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at: datetime = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - dt_util.utcnow()).total_seconds())
+
+
+class PollScheduler:
+    """Choose the poll interval of an entry from its recent results.
+
+    The interval halves while polls keep finding changes and grows by half
+    while they do not, within the configured bounds. Failed polls back off
+    exponentially from the lower bound with jitter, so clients do not retry
+    in lockstep once a server recovers. A Retry-After delay is always
+    honoured, even beyond the upper bound.
+    """
+
+    def __init__(self, min_interval: timedelta, max_interval: timedelta) -> None:
+        """Initialize the scheduler."""
+        self.min_interval = min_interval.total_seconds()
+        self.max_interval = max(max_interval.total_seconds(), self.min_interval)
+        # Start fresh, quiet entries drift towards the upper bound
+        self._interval = self.min_interval
+        self.failures = 0
+
+    @property
+    def interval(self) -> timedelta:
+        """Return the interval of a full poll cycle."""
+        return timedelta(seconds=self._interval)
+
+    def record_success(self, changed: bool, weight: float = 1.0) -> timedelta:
+        """Adapt the interval to a successful poll.
+
+        The weight is the share of the entry's devices that were polled, so a
+        hub adapts once per full cycle rather than once per batch.
+        """
+        self.failures = 0
+        factor = _SHRINK_FACTOR if changed else _GROW_FACTOR
+        self._interval = min(
+            self.max_interval,
+            max(self.min_interval, self._interval * factor**weight),
+        )
+        return self.interval
+
+    def record_failure(self, retry_after: float | None = None) -> timedelta:
+        """Back off after a failed poll and return the delay until the retry."""
+        self.failures += 1
+        backoff = min(self.max_interval, self.min_interval * 2 ** (self.failures - 1))
+        return timedelta(seconds=max(jitter(backoff), retry_after or 0))
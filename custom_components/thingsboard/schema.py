@@ -0,0 +1,205 @@
+"""Inferred schema of the attributes of a ThingsBoard entry."""
+
+from __future__ import annotations
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any
+
+from homeassistant.components.sensor import SensorDeviceClass, SensorStateClass
+from homeassistant.const import (
+    UnitOfElectricCurrent,
+    UnitOfElectricPotential,
+    UnitOfPower,
+    UnitOfPressure,
+    UnitOfTemperature,
+)
+
+from .filters import is_number
+from .keys import SCOPES, DeviceKey, KeyTable
+
+# Kinds of attribute values
+KIND_NUMBER = "number"
+KIND_BOOL = "bool"
+KIND_STRING = "string"
+KIND_JSON = "json"
+
+# Companion attributes describing an attribute, e.g. "setpoint_max"
+SUFFIX_MIN = "min"
+SUFFIX_MAX = "max"
+SUFFIX_STEP = "step"
+SUFFIX_UNIT = "unit"
+COMPANION_SUFFIXES = frozenset((SUFFIX_MIN, SUFFIX_MAX, SUFFIX_STEP, SUFFIX_UNIT))
+
+# Bounds of number entities without companion attributes
+DEFAULT_MIN_VALUE = -1000000
+DEFAULT_MAX_VALUE = 1000000
+# Most decimal places inferred from a value
+MAX_PRECISION = 6
+
+# Device classes implied by the unit of an attribute
+_UNIT_DEVICE_CLASSES: dict[str, SensorDeviceClass] = {
+    UnitOfTemperature.CELSIUS: SensorDeviceClass.TEMPERATURE,
+    UnitOfTemperature.FAHRENHEIT: SensorDeviceClass.TEMPERATURE,
+    UnitOfPower.WATT: SensorDeviceClass.POWER,
+    UnitOfPower.KILO_WATT: SensorDeviceClass.POWER,
+    UnitOfElectricPotential.VOLT: SensorDeviceClass.VOLTAGE,
+    UnitOfElectricCurrent.AMPERE: SensorDeviceClass.CURRENT,
+    UnitOfPressure.HPA: SensorDeviceClass.PRESSURE,
+}
+
+
+def value_kind(value: Any) -> str | None:
+    """Return the kind of an attribute value, None if it is missing."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return KIND_BOOL
+    if is_number(value):
+        return KIND_NUMBER
+    if isinstance(value, str):
+        return KIND_STRING
+    return KIND_JSON
+
+
+def decimals(value: float) -> int:
+    """Return the decimal places of a number, e.g. 2 for 21.25."""
+    if isinstance(value, int):
+        return 0
+    text = repr(value)
+    if "e" in text:
+        return MAX_PRECISION
+    return min(len(text.partition(".")[2]), MAX_PRECISION)
+
+
+@dataclass(frozen=True, slots=True)
+class KeySchema:
+    """Type and presentation of an attribute, inferred from its values."""
+
+    kind: str | None
+    # Decimal places of numeric values
+    precision: int | None = None
+    unit: str | None = None
+    device_class: SensorDeviceClass | None = None
+    # Range and step of number entities
+    min_value: float = DEFAULT_MIN_VALUE
+    max_value: float = DEFAULT_MAX_VALUE
+    step: float = 0.1
+
+    @property
+    def state_class(self) -> SensorStateClass | None:
+        """Return the state class of sensors showing the attribute."""
+        return SensorStateClass.MEASUREMENT if self.kind == KIND_NUMBER else None
+
+
+# Schema of attributes without a value
+EMPTY_SCHEMA = KeySchema(None)
+
+
+class SchemaCache:
+    """Remember the schema of every attribute of an entry.
+
+    Entities read their state class, unit, precision and number bounds from
+    the cached schema. It is only inferred again when the kind of the value
+    changes, e.g. from number to string, when a number has more decimal
+    places than any value before, or when one of its companion attributes
+    ("<key>_min", "<key>_max", "<key>_step", "<key>_unit") changed.
+    """
+
+    __slots__ = ("_keys", "_schemas")
+
+    def __init__(self, keys: KeyTable) -> None:
+        """Initialize the cache."""
+        self._keys = keys
+        self._schemas: dict[DeviceKey, KeySchema] = {}
+
+    def get(
+        self,
+        device_key: DeviceKey,
+        value: Any,
+        attributes: Mapping[str, Any] | None = None,
+    ) -> KeySchema:
+        """Return the schema of an attribute with its current value.
+
+        Companion attributes are looked up in the attributes of the device.
+        """
+        if (kind := value_kind(value)) is None:
+            # A missing value does not change the kind
+            return self._schemas.get(device_key, EMPTY_SCHEMA)
+
+        schema = self._schemas.get(device_key)
+        if (
+            schema is None
+            or schema.kind != kind
+            or (
+                kind == KIND_NUMBER
+                and schema.precision is not None
+                and schema.precision < MAX_PRECISION
+                and decimals(value) > schema.precision
+            )
+        ):
+            schema = self._schemas[device_key] = self._infer(
+                device_key[1], kind, value, attributes or {}
+            )
+        return schema
+
+    def _infer(
+        self, key: str, kind: str, value: Any, attributes: Mapping[str, Any]
+    ) -> KeySchema:
+        """Infer the schema of an attribute from its value and companions."""
+        if kind != KIND_NUMBER:
+            return KeySchema(kind)
+
+        companions = self._companions(key, attributes)
+        precision = decimals(value)
+        unit = companions.get(SUFFIX_UNIT)
+        unit = unit if isinstance(unit, str) else None
+        return KeySchema(
+            kind,
+            precision,
+            unit,
+            _UNIT_DEVICE_CLASSES.get(unit) if unit else None,
+            _number(companions.get(SUFFIX_MIN), DEFAULT_MIN_VALUE),
+            _number(companions.get(SUFFIX_MAX), DEFAULT_MAX_VALUE),
+            _number(companions.get(SUFFIX_STEP), 10 ** -max(precision, 1)),
+        )
+
+    def _companions(self, key: str, attributes: Mapping[str, Any]) -> dict[str, Any]:
+        """Return the companion values of an attribute, by suffix.
+
+        A companion in the scope of the attribute wins over the other scope.
+        """
+        scope, _, name = key.partition("_")
+        companions: dict[str, Any] = {}
+        for companion_scope in sorted(SCOPES, key=lambda other: other != scope):
+            for suffix in COMPANION_SUFFIXES:
+                flat = self._keys.flat(companion_scope, f"{name}_{suffix}")
+                if flat in attributes:
+                    companions.setdefault(suffix, attributes[flat])
+        return companions
+
+    def invalidate(self, touched: frozenset[DeviceKey]) -> frozenset[DeviceKey]:
+        """Forget the schemas described by changed companion attributes.
+
+        Returns the changed keys together with the keys whose schema was
+        dropped, so their entities pick up the new schema.
+        """
+        described: set[DeviceKey] = set()
+        for device_id, key in touched:
+            base, _, suffix = key.rpartition("_")
+            if suffix not in COMPANION_SUFFIXES or "_" not in base:
+                continue
+            name = base.partition("_")[2]
+            for scope in SCOPES:
+                device_key = self._keys.device_key(
+                    device_id, self._keys.flat(scope, name)
+                )
+                if self._schemas.pop(device_key, None) is not None:
+                    described.add(device_key)
+
+        return touched | described if described else touched
+
+
+def _number(value: Any, default: float) -> float:
+    """Return a companion value if it is numeric, else the default."""
+    return float(value) if is_number(value) else default
@@ -2,24 +2,104 @@
 
 from __future__ import annotations
 
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 import logging
+import time
 from typing import Any
 
 from homeassistant.components.sensor import (
+    SensorDeviceClass,
     SensorEntity,
+    SensorEntityDescription,
     SensorStateClass,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant, callback
-from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.const import EntityCategory, Platform, UnitOfTime
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
-from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from homeassistant.helpers.event import async_call_later
 
-from .const import DOMAIN
-from .coordinator import ThingsBoardDataUpdateCoordinator
+from .const import CONF_DIAGNOSTIC_SENSORS, DEFAULT_DIAGNOSTIC_SENSORS, DOMAIN
+from .coordinator import DeviceKey, ThingsBoardDataUpdateCoordinator
+from .device import ThingsBoardDevice
+from .entity import ThingsBoardEntity
+from .filters import (
+    BUILTIN_NUMERIC_FILTER,
+    DEFAULT_FILTER_KEY,
+    WriteFilter,
+    is_number,
+)
+from .paths import PathSelector
 
 _LOGGER = logging.getLogger(__name__)
 
+# Refresh interval of the diagnostic sensors, which read runtime counters
+SCAN_INTERVAL = timedelta(seconds=60)
+
+
+@dataclass(frozen=True, kw_only=True)
+class ThingsBoardDiagnosticSensorDescription(SensorEntityDescription):
+    """Describe a sensor showing a runtime counter of a config entry."""
+
+    value_fn: Callable[[ThingsBoardDataUpdateCoordinator], Any]
+
+
+def _mean_latency(coordinator: ThingsBoardDataUpdateCoordinator) -> float | None:
+    """Return the mean request latency in milliseconds."""
+    mean = coordinator.stats.request_duration.mean
+    return round(mean * 1000, 1) if mean is not None else None
+
+
+DIAGNOSTIC_SENSORS: tuple[ThingsBoardDiagnosticSensorDescription, ...] = (
+    ThingsBoardDiagnosticSensorDescription(
+        key="request_latency",
+        name="Request latency",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=_mean_latency,
+    ),
+    ThingsBoardDiagnosticSensorDescription(
+        key="requests",
+        name="Requests",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda coordinator: coordinator.stats.request_duration.count,
+    ),
+    ThingsBoardDiagnosticSensorDescription(
+        key="request_errors",
+        name="Request errors",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda coordinator: coordinator.stats.errors.total(),
+    ),
+    ThingsBoardDiagnosticSensorDescription(
+        key="skipped_refreshes",
+        name="Skipped refreshes",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda coordinator: coordinator.skipped_refreshes,
+    ),
+    ThingsBoardDiagnosticSensorDescription(
+        key="keys_changed",
+        name="Changed attributes",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda coordinator: coordinator.stats.keys_changed,
+    ),
+    ThingsBoardDiagnosticSensorDescription(
+        key="state_writes",
+        name="State writes",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda coordinator: coordinator.stats.state_writes,
+    ),
+    ThingsBoardDiagnosticSensorDescription(
+        key="write_queue_depth",
+        name="Write queue depth",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda coordinator: sum(
+            device.write_queue.depth for device in coordinator.devices.values()
+        ),
+    ),
+)
+
 
 async def async_setup_entry(
     hass: HomeAssistant,
@@ -30,99 +110,270 @@ async def async_setup_entry(
     coordinator: ThingsBoardDataUpdateCoordinator = hass.data[DOMAIN][entry.entry_id]
 
     @callback
-    def async_add_sensors() -> None:
-        """Add sensors based on coordinator data."""
+    def async_add_sensors(keys: Iterable[DeviceKey]) -> None:
+        """Add sensors for the given device attribute keys."""
         entities = []
+        known = coordinator.entities[Platform.SENSOR]
 
         # Create a sensor for each attribute discovered
         if coordinator.data:
-            for key, value in coordinator.data.items():
-                # Skip if entity already exists
-                entity_id = f"sensor.thingsboard_{key}"
-                if entity_id not in [
-                    entity.entity_id for entity in hass.data[DOMAIN].get("entities", [])
-                ]:
-                    entities.append(
-                        ThingsBoardSensor(
+            for device_key in keys:
+                device_id, key = device_key
+                # Skip if entity already exists or the key is not tracked
+                if device_key not in known and coordinator.is_tracked(key):
+                    entity = ThingsBoardSensor(
+                        coordinator=coordinator,
+                        device=coordinator.devices[device_id],
+                        attribute_key=key,
+                    )
+                    known[entity.index_key] = entity
+                    entities.append(entity)
+
+                # Create a sensor for each nested value selected from it
+                for selector in coordinator.path_selectors.get(key, ()):
+                    path_key = coordinator.keys.device_key(device_id, selector.text)
+                    if path_key not in known:
+                        known[path_key] = ThingsBoardPathSensor(
                             coordinator=coordinator,
-                            entry=entry,
-                            attribute_key=key,
+                            device=coordinator.devices[device_id],
+                            selector=selector,
                         )
-                    )
+                        entities.append(known[path_key])
 
         if entities:
-            # Store entities for tracking
-            if "entities" not in hass.data[DOMAIN]:
-                hass.data[DOMAIN]["entities"] = []
-            hass.data[DOMAIN]["entities"].extend(entities)
-
             async_add_entities(entities)
 
+    @callback
+    def async_add_new_sensors() -> None:
+        """Add sensors for attributes added by the last update."""
+        async_add_sensors(coordinator.last_delta.added)
+
     # Initial setup
-    async_add_sensors()
+    async_add_sensors(coordinator.device_keys())
+
+    if entry.options.get(CONF_DIAGNOSTIC_SENSORS, DEFAULT_DIAGNOSTIC_SENSORS):
+        async_add_entities(
+            ThingsBoardDiagnosticSensor(coordinator, description)
+            for description in DIAGNOSTIC_SENSORS
+        )
 
     # Listen for coordinator updates to add new entities
-    entry.async_on_unload(coordinator.async_add_listener(async_add_sensors))
+    entry.async_on_unload(coordinator.async_add_listener(async_add_new_sensors))
+
 
+class ThingsBoardSensor(ThingsBoardEntity, SensorEntity):
+    """Representation of a ThingsBoard Sensor.
 
-class ThingsBoardSensor(CoordinatorEntity, SensorEntity):
-    """Representation of a ThingsBoard Sensor."""
+    State writes pass the write filter of the attribute, which holds back
+    writes within its minimum interval and changes within its deadband.
+    """
+
+    _platform = Platform.SENSOR
 
     def __init__(
         self,
         coordinator: ThingsBoardDataUpdateCoordinator,
-        entry: ConfigEntry,
+        device: ThingsBoardDevice,
         attribute_key: str,
     ) -> None:
         """Initialize the sensor."""
-        super().__init__(coordinator)
-
-        self._attribute_key = attribute_key
-        self._entry = entry
+        super().__init__(coordinator, device, attribute_key)
 
         # Create unique ID
-        self._attr_unique_id = f"{entry.entry_id}_{attribute_key}"
+        self._attr_unique_id = f"{device.device_id}_{attribute_key}"
 
         # Set name
-        self._attr_name = f"ThingsBoard {attribute_key.replace('_', ' ').title()}"
-
-        # Device info
-        self._attr_device_info = DeviceInfo(
-            identifiers={(DOMAIN, entry.entry_id)},
-            name="ThingsBoard Device",
-            manufacturer="ThingsBoard",
-            model="HTTP API Device",
-            configuration_url=coordinator.host,
+        self._attr_name = (
+            f"{device.entity_name_prefix} {attribute_key.replace('_', ' ').title()}"
         )
 
+        if attribute_key in coordinator.path_selectors:
+            # The whole document of a selected attribute is usually a large
+            # blob, keep it out of the state machine and recorder by default
+            self._attr_entity_registry_enabled_default = False
+
+        self._write_filter = coordinator.write_filters.get(attribute_key)
+        # Value, availability and time of the last state write
+        self._last_written: tuple[Any, bool, float] | None = None
+        # Delayed write of a change held back by the minimum interval
+        self._unsub_write: CALLBACK_TYPE | None = None
+
+    def _filter_for(self, value: Any) -> WriteFilter | None:
+        """Return the write filter of the attribute or the numeric default."""
+        if self._write_filter is not None:
+            return self._write_filter
+        if is_number(value):
+            return self.coordinator.write_filters.get(
+                DEFAULT_FILTER_KEY, BUILTIN_NUMERIC_FILTER
+            )
+        # Other values are written on every change
+        return None
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write the state if it passes the write filter."""
+        self._async_write_filtered()
+
+    @callback
+    def _async_write_filtered(self, _now: datetime | None = None) -> None:
+        """Write the state, unless the write filter holds it back."""
+        if _now is not None:
+            self._unsub_write = None
+
+        value = self._value
+        available = self.available
+        write_filter = self._filter_for(value)
+
+        if write_filter is not None and self._last_written is not None:
+            last_value, last_available, last_time = self._last_written
+            if available == last_available and (
+                not available or not write_filter.significant(last_value, value)
+            ):
+                return
+
+            remaining = last_time + write_filter.min_interval - time.monotonic()
+            if available == last_available and remaining > 0:
+                # Write the latest value once the interval has passed
+                if self._unsub_write is None:
+                    self._unsub_write = async_call_later(
+                        self.hass, remaining, self._async_write_filtered
+                    )
+                return
+
+        if self._unsub_write is not None:
+            self._unsub_write()
+            self._unsub_write = None
+        self._last_written = (value, available, time.monotonic())
+        super()._handle_coordinator_update()
+
+    async def async_added_to_hass(self) -> None:
+        """Remember the state written when the sensor was added."""
+        await super().async_added_to_hass()
+        self._last_written = (self._value, self.available, time.monotonic())
+
+    async def async_will_remove_from_hass(self) -> None:
+        """Cancel a delayed state write."""
+        if self._unsub_write is not None:
+            self._unsub_write()
+            self._unsub_write = None
+        await super().async_will_remove_from_hass()
+
     @property
     def native_value(self) -> Any:
-        """Return the state of the sensor."""
-        if self.coordinator.data:
-            return self.coordinator.data.get(self._attribute_key)
-        return None
+        """Return the state of the sensor, rounded by its write filter."""
+        value = self._value
+        if (write_filter := self._filter_for(value)) is not None:
+            return write_filter.round(value)
+        return value
 
     @property
-    def extra_state_attributes(self) -> dict[str, Any]:
-        """Return extra attributes."""
-        return {
-            "attribute_key": self._attribute_key,
+    def state_class(self) -> SensorStateClass | None:
+        """Return the state class of this sensor, numeric values are measurements."""
+        return self._schema.state_class
+
+    @property
+    def native_unit_of_measurement(self) -> str | None:
+        """Return the unit given by the "<key>_unit" attribute."""
+        return self._schema.unit
+
+    @property
+    def device_class(self) -> SensorDeviceClass | None:
+        """Return the device class implied by the unit."""
+        return self._schema.device_class
+
+    @property
+    def suggested_display_precision(self) -> int | None:
+        """Return the precision of the write filter or of the values."""
+        if self._write_filter is not None and self._write_filter.precision is not None:
+            return self._write_filter.precision
+        return self._schema.precision
+
+
+class ThingsBoardPathSensor(ThingsBoardSensor):
+    """Sensor showing a nested value of a JSON attribute.
+
+    The selector is only evaluated when the parent attribute changed, and
+    the state is only written when the selected value or the availability
+    changed.
+    """
+
+    def __init__(
+        self,
+        coordinator: ThingsBoardDataUpdateCoordinator,
+        device: ThingsBoardDevice,
+        selector: PathSelector,
+    ) -> None:
+        """Initialize the sensor."""
+        # Needed by the schema lookup of the base class
+        self._selector = selector
+        self._selected: Any = None
+        super().__init__(coordinator, device, selector.key)
+        self._write_filter = coordinator.write_filters.get(selector.text)
+        self._selected = selector.extract(super()._value)
+        self._async_update_schema()
+        # Selected value and availability of the last state write
+        self._written: tuple[Any, bool] | None = None
+
+        self._attr_unique_id = f"{device.device_id}_{selector.text}"
+        self._attr_name = f"{device.entity_name_prefix} {selector.name}"
+        self._attr_entity_registry_enabled_default = True
+        self._attr_extra_state_attributes = {
+            "attribute_key": selector.key,
+            "path": selector.text,
         }
 
     @property
-    def available(self) -> bool:
-        """Return if entity is available."""
-        return (
-            self.coordinator.last_update_success
-            and self._attribute_key in self.coordinator.data
+    def index_key(self) -> DeviceKey:
+        """Return the key of the entity in the entity index."""
+        return self.coordinator.keys.device_key(
+            self._device.device_id, self._selector.text
         )
 
     @property
-    def state_class(self) -> SensorStateClass | None:
-        """Return the state class of this sensor."""
-        # Try to determine if the value is numeric
-        if self.coordinator.data:
-            value = self.coordinator.data.get(self._attribute_key)
-            if isinstance(value, (int, float)):
-                return SensorStateClass.MEASUREMENT
-        return None
+    def _value(self) -> Any:
+        """Return the selected value."""
+        return self._selected
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Select the value and write the state if anything changed."""
+        self._selected = self._selector.extract(super()._value)
+        written = (self._selected, self.available)
+        if written == self._written:
+            return
+        self._written = written
+        super()._handle_coordinator_update()
+
+
+class ThingsBoardDiagnosticSensor(SensorEntity):
+    """Sensor showing a runtime counter of a config entry.
+
+    The counters change on every request, so the sensor polls them instead
+    of listening to the coordinator, which only notifies changed attributes.
+    """
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_should_poll = True
+    entity_description: ThingsBoardDiagnosticSensorDescription
+
+    def __init__(
+        self,
+        coordinator: ThingsBoardDataUpdateCoordinator,
+        description: ThingsBoardDiagnosticSensorDescription,
+    ) -> None:
+        """Initialize the sensor."""
+        self.coordinator = coordinator
+        self.entity_description = description
+
+        # Shown on the first device, the only one of a regular entry
+        device = next(iter(coordinator.devices.values()))
+        self._attr_device_info = device.device_info
+        self._attr_unique_id = (
+            f"{coordinator.entry.entry_id}_diagnostics_{description.key}"
+        )
+        self._attr_name = f"{device.entity_name_prefix} {description.name}"
+
+    @property
+    def native_value(self) -> Any:
+        """Return the current counter value."""
+        return self.entity_description.value_fn(self.coordinator)
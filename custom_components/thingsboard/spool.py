@@ -0,0 +1,344 @@
+"""Disk-backed spool for writes that could not reach ThingsBoard."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import timedelta
+import json
+import logging
+import sqlite3
+import time
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.core import HomeAssistant, callback
+
+from .const import DOMAIN, SPOOL_REPLAY_MAX_BYTES, SPOOL_REPLAY_MAX_POINTS
+
+if TYPE_CHECKING:
+    from .coordinator import ThingsBoardDataUpdateCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+KIND_ATTRIBUTES = "attributes"
+KIND_TELEMETRY = "telemetry"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spool (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS spool_attribute
+    ON spool (device_id, kind, key) WHERE key IS NOT NULL;
+"""
+
+# A spooled row: (id, device ID, kind, decoded payload, serialized size)
+SpoolRow = tuple[int, str, str, Any, int]
+
+
+def spool_path(hass: HomeAssistant, entry_id: str) -> str:
+    """Return the path of the spool database of a config entry."""
+    return hass.config.path(".storage", f"{DOMAIN}.{entry_id}.spool.db")
+
+
+class SpoolClosed(Exception):
+    """Error to indicate the spool was used after it was closed."""
+
+
+class OfflineSpool:
+    """Append-only spool of outgoing attribute writes and telemetry.
+
+    Attribute writes are stored one row per key, so a newer value of a key
+    replaces the spooled one. Telemetry batches are stored as they are.
+    Rows are replayed in order, in bulk, once ThingsBoard is reachable again.
+    All database access runs in the executor.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        coordinator: ThingsBoardDataUpdateCoordinator,
+        path: str,
+        max_rows: int,
+        max_age: timedelta,
+        replay_batch_size: int,
+    ) -> None:
+        """Initialize the spool."""
+        self.hass = hass
+        self.coordinator = coordinator
+        self.path = path
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.replay_batch_size = replay_batch_size
+
+        self._connection: sqlite3.Connection | None = None
+        self._closed = False
+        self._lock = asyncio.Lock()
+        self._replay_task: asyncio.Task[None] | None = None
+        # Attribute keys written live since the replay read its rows
+        self._superseded: set[tuple[str, str]] = set()
+
+        # Counters
+        self.pending = 0
+        self.evicted = 0
+        self.replayed = 0
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Open the database on first use and run a transaction.
+
+        Raises SpoolClosed once the spool was closed, instead of opening a
+        connection nobody closes.
+        """
+        if self._closed:
+            raise SpoolClosed(self.path)
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript(_SCHEMA)
+        with self._connection:
+            yield self._connection
+
+    async def async_setup(self) -> None:
+        """Open the spool and evict rows that expired while offline."""
+        async with self._lock:
+            self.pending = await self.hass.async_add_executor_job(self._load)
+        if self.pending:
+            _LOGGER.info("%s spooled write(s) waiting for ThingsBoard", self.pending)
+
+    async def async_close(self) -> None:
+        """Stop replaying and close the database."""
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+        async with self._lock:
+            self._closed = True
+            if self._connection is not None:
+                await self.hass.async_add_executor_job(self._connection.close)
+                self._connection = None
+
+    async def async_add_attributes(
+        self, device_id: str, attributes: dict[str, Any]
+    ) -> None:
+        """Spool attribute writes, replacing older values of the same keys."""
+        rows = [
+            (device_id, KIND_ATTRIBUTES, key, json.dumps(value))
+            for key, value in attributes.items()
+        ]
+        await self._async_add(rows)
+
+    async def async_discard_attributes(self, device_id: str, keys: list[str]) -> None:
+        """Drop spooled values of keys a newer live write has set.
+
+        Keeps the replay from overwriting the newer values with older ones.
+        """
+        if not self.pending or self._closed:
+            return
+
+        self._superseded.update((device_id, key) for key in keys)
+
+        async with self._lock:
+            self.pending -= await self.hass.async_add_executor_job(
+                self._discard, device_id, keys
+            )
+
+    async def async_add_telemetry(
+        self, device_id: str, points: list[dict[str, Any]]
+    ) -> None:
+        """Spool a batch of telemetry points."""
+        await self._async_add([(device_id, KIND_TELEMETRY, None, json.dumps(points))])
+
+    async def _async_add(self, rows: list[tuple[str, str, str | None, str]]) -> None:
+        """Append rows and enforce the size and age caps."""
+        async with self._lock:
+            if self._closed:
+                _LOGGER.warning(
+                    "Dropping %s write(s) that arrived after the spool was closed",
+                    len(rows),
+                )
+                return
+            self.pending = await self.hass.async_add_executor_job(
+                self._add, rows, self.pending
+            )
+
+    def _load(self) -> int:
+        """Count and evict the spooled rows in the executor."""
+        with self._transaction() as connection:
+            (pending,) = connection.execute("SELECT COUNT(*) FROM spool").fetchone()
+        return self._evict(pending)
+
+    def _add(self, rows: list[tuple[str, str, str | None, str]], pending: int) -> int:
+        """Append rows in the executor, returning the number of spooled rows."""
+        now = time.time()
+        with self._transaction() as connection:
+            # Replaced attribute rows do not add to the count
+            for device_id, kind, key, _ in rows:
+                if key is not None:
+                    pending -= connection.execute(
+                        "SELECT COUNT(*) FROM spool"
+                        " WHERE device_id = ? AND kind = ? AND key = ?",
+                        (device_id, kind, key),
+                    ).fetchone()[0]
+            connection.executemany(
+                "INSERT OR REPLACE INTO spool (device_id, kind, key, payload, created)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(*row, now) for row in rows],
+            )
+        return self._evict(pending + len(rows))
+
+    def _evict(self, pending: int) -> int:
+        """Drop expired rows and the oldest rows above the size cap.
+
+        Rows are created in order of their ID, so only the oldest row needs
+        to be checked before anything is deleted.
+        """
+        cutoff = time.time() - self.max_age.total_seconds()
+        evicted = 0
+        with self._transaction() as connection:
+            oldest = connection.execute(
+                "SELECT created FROM spool ORDER BY id LIMIT 1"
+            ).fetchone()
+            if oldest is not None and oldest[0] < cutoff:
+                evicted += connection.execute(
+                    "DELETE FROM spool WHERE created < ?", (cutoff,)
+                ).rowcount
+            if pending - evicted > self.max_rows:
+                evicted += connection.execute(
+                    "DELETE FROM spool WHERE id IN"
+                    " (SELECT id FROM spool ORDER BY id LIMIT ?)",
+                    (pending - evicted - self.max_rows,),
+                ).rowcount
+        pending -= evicted
+
+        if evicted:
+            self.evicted += evicted
+            _LOGGER.warning(
+                "Evicted %s spooled write(s) over the spool limits", evicted
+            )
+        return pending
+
+    def _read(self, limit: int) -> list[SpoolRow]:
+        """Read and decode the oldest rows in the executor."""
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT id, device_id, kind, key, payload FROM spool"
+                " ORDER BY id LIMIT ?",
+                (limit,),
+            ).fetchall()
+
+        return [
+            (
+                row_id,
+                device_id,
+                kind,
+                (
+                    (key, json.loads(payload))
+                    if kind == KIND_ATTRIBUTES
+                    else json.loads(payload)
+                ),
+                len(payload),
+            )
+            for row_id, device_id, kind, key, payload in rows
+        ]
+
+    def _delete(self, row_ids: list[int]) -> int:
+        """Delete replayed rows in the executor, returning their number."""
+        with self._transaction() as connection:
+            return connection.executemany(
+                "DELETE FROM spool WHERE id = ?", [(row_id,) for row_id in row_ids]
+            ).rowcount
+
+    def _discard(self, device_id: str, keys: list[str]) -> int:
+        """Delete spooled values of attribute keys, returning their number."""
+        with self._transaction() as connection:
+            return connection.executemany(
+                "DELETE FROM spool WHERE device_id = ? AND kind = ? AND key = ?",
+                [(device_id, KIND_ATTRIBUTES, key) for key in keys],
+            ).rowcount
+
+    @callback
+    def async_schedule_replay(self) -> None:
+        """Replay the spool in the background if there is anything to send."""
+        if not self.pending or (
+            self._replay_task is not None and not self._replay_task.done()
+        ):
+            return
+
+        self._replay_task = self.coordinator.entry.async_create_background_task(
+            self.hass, self._async_replay(), f"{DOMAIN}_spool_replay"
+        )
+
+    async def _async_replay(self) -> None:
+        """Send spooled rows in order, grouping runs of the same device and kind."""
+        while self.pending:
+            async with self._lock:
+                rows = await self.hass.async_add_executor_job(
+                    self._read, self.replay_batch_size
+                )
+                self._superseded.clear()
+            if not rows:
+                return
+
+            for group in _group_rows(rows):
+                _, device_id, kind, _, _ = group[0]
+                live = [
+                    row
+                    for row in group
+                    if kind != KIND_ATTRIBUTES
+                    or (device_id, row[3][0]) not in self._superseded
+                ]
+                if live and not await self._async_send(device_id, kind, live):
+                    # Still unreachable, try again after the next success
+                    return
+
+                async with self._lock:
+                    self.pending -= await self.hass.async_add_executor_job(
+                        self._delete, [row[0] for row in group]
+                    )
+                self.replayed += len(live)
+
+        _LOGGER.info("Replayed all spooled writes")
+
+    async def _async_send(
+        self, device_id: str, kind: str, group: list[SpoolRow]
+    ) -> bool:
+        """Send a group of rows, returning False if it has to be retried."""
+        if (device := self.coordinator.devices.get(device_id)) is None:
+            # The device was removed from the entry, drop its rows
+            return True
+
+        if kind == KIND_ATTRIBUTES:
+            payload: Any = dict(row[3] for row in group)
+        else:
+            payload = [point for row in group for point in row[3]]
+
+        return await device.async_send_spooled(kind, payload)
+
+
+def _group_rows(rows: list[SpoolRow]) -> list[list[SpoolRow]]:
+    """Split rows into consecutive runs of the same device and kind.
+
+    A run is also split once it would exceed the points or bytes of one
+    request, so a long outage does not end in a request ThingsBoard
+    rejects or that times out. A single oversized row is sent alone.
+    """
+    groups: list[list[SpoolRow]] = []
+    points = size = 0
+    for row in rows:
+        row_points = len(row[3]) if row[2] == KIND_TELEMETRY else 1
+        if (
+            groups
+            and groups[-1][0][1:3] == row[1:3]
+            and points + row_points <= SPOOL_REPLAY_MAX_POINTS
+            and size + row[4] <= SPOOL_REPLAY_MAX_BYTES
+        ):
+            groups[-1].append(row)
+            points += row_points
+            size += row[4]
+        else:
+            groups.append([row])
+            points, size = row_points, row[4]
+    return groups
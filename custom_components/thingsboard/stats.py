@@ -0,0 +1,81 @@
+"""Runtime counters and latency histograms of a ThingsBoard entry."""
+
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import Counter
+from typing import Any
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    """Count values in fixed buckets and keep their sum and extremes."""
+
+    __slots__ = ("bounds", "buckets", "count", "max", "min", "total")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        """Initialize the histogram."""
+        self.bounds = bounds
+        # The last bucket holds values above the largest bound
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min: float | None = None
+        self.max: float | None = None
+
+    def record(self, value: float) -> None:
+        """Add a value."""
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def mean(self) -> float | None:
+        """Return the mean of all values."""
+        return self.total / self.count if self.count else None
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the histogram for diagnostics."""
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "min": self.min,
+            "max": self.max,
+            "buckets": dict(zip(labels, self.buckets, strict=True)),
+        }
+
+
+class EntryStats:
+    """Counters of the requests and updates of a config entry."""
+
+    def __init__(self) -> None:
+        """Initialize the counters."""
+        self.request_duration = Histogram(SECONDS_BUCKETS)
+        self.response_bytes = Histogram(BYTES_BUCKETS)
+        self.decode_duration = Histogram(SECONDS_BUCKETS)
+        self.keys_changed = 0
+        self.state_writes = 0
+        # Failed requests by HTTP status, or by "connection", "timeout" and
+        # "circuit_open" for requests refused while the host is backed off
+        self.errors: Counter[str] = Counter()
+
+    def record_error(self, reason: int | str) -> None:
+        """Count a failed request."""
+        self.errors[str(reason)] += 1
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the counters for diagnostics."""
+        return {
+            "request_duration": self.request_duration.as_dict(),
+            "response_bytes": self.response_bytes.as_dict(),
+            "decode_duration": self.decode_duration.as_dict(),
+            "keys_changed": self.keys_changed,
+            "state_writes": self.state_writes,
+            "errors": dict(self.errors),
+        }
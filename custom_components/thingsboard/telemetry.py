@@ -0,0 +1,326 @@
+"""Batched upload of Home Assistant states as ThingsBoard telemetry."""
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta
+import logging
+import math
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.const import STATE_UNAVAILABLE, STATE_UNKNOWN
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, State, callback
+from homeassistant.helpers.event import (
+    EventStateChangedData,
+    async_track_point_in_utc_time,
+    async_track_state_change_event,
+    async_track_time_interval,
+)
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN
+from .device import DeviceUnreachable, ThingsBoardDevice
+from .filters import is_number
+
+if TYPE_CHECKING:
+    from .gateway import Gateway
+
+_LOGGER = logging.getLogger(__name__)
+
+# A single sample: (timestamp in ms, telemetry key, value). The value of an
+# aggregated window is a dict of all its telemetry keys.
+TelemetrySample = tuple[int, str, Any]
+
+
+def state_to_value(state: State) -> Any:
+    """Return the telemetry value of a state, numeric where possible."""
+    try:
+        return float(state.state)
+    except ValueError:
+        return state.state
+
+
+def build_payload(samples: list[TelemetrySample]) -> list[dict[str, Any]]:
+    """Group samples by timestamp into the ThingsBoard telemetry format.
+
+    The result looks like [{"ts": 1700000000000, "values": {"key": 1.0}}].
+    """
+    points: dict[int, dict[str, Any]] = {}
+    for ts, key, value in samples:
+        if isinstance(value, dict):
+            points.setdefault(ts, {}).update(value)
+        else:
+            points.setdefault(ts, {})[key] = value
+    return [{"ts": ts, "values": values} for ts, values in sorted(points.items())]
+
+
+class SeriesWindow:
+    """Running minimum, maximum, mean and last value of one series.
+
+    Values are folded in as they arrive, so a window takes the same memory
+    no matter how many samples it covers.
+    """
+
+    __slots__ = ("count", "high", "last", "low", "total")
+
+    def __init__(self) -> None:
+        """Initialize an empty window."""
+        # Numeric samples
+        self.count = 0
+        self.total = 0.0
+        self.low = math.inf
+        self.high = -math.inf
+        self.last: Any = None
+
+    def add(self, value: Any) -> None:
+        """Add a sample, only finite numbers count for the statistics."""
+        self.last = value
+        if not is_number(value) or not math.isfinite(value):
+            return
+
+        self.count += 1
+        self.total += value
+        self.low = min(self.low, value)
+        self.high = max(self.high, value)
+
+    def summary(self, key: str) -> dict[str, Any]:
+        """Return the telemetry of the window.
+
+        The key itself holds the last value, numeric series add
+        "<key>_min", "<key>_max", "<key>_mean" and "<key>_count".
+        """
+        values: dict[str, Any] = {key: self.last}
+        if self.count:
+            values[f"{key}_min"] = self.low
+            values[f"{key}_max"] = self.high
+            values[f"{key}_mean"] = self.total / self.count
+            values[f"{key}_count"] = self.count
+        return values
+
+
+class TelemetryUploader:
+    """Send state changes of selected entities to ThingsBoard in batches.
+
+    Samples are queued in a bounded buffer. A batch is sent once the flush
+    size is reached or the flush interval elapsed. When the buffer is full,
+    the oldest samples are dropped and counted.
+
+    With a window, the samples of every entity are aggregated over tumbling
+    windows aligned to the clock instead. At the end of each window one
+    point per entity is queued and all of them are sent in one batch.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        device: ThingsBoardDevice,
+        entity_ids: list[str],
+        flush_size: int,
+        flush_interval: timedelta,
+        max_queue_size: int,
+        gateway: Gateway | None = None,
+        window: timedelta | None = None,
+    ) -> None:
+        """Initialize the uploader."""
+        self.hass = hass
+        self.device = device
+        self.entity_ids = entity_ids
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        # Publishes the samples per Home Assistant device in gateway mode
+        self.gateway = gateway
+        # Length of the aggregation windows, None sends every sample
+        self.window = window
+
+        self._queue: deque[TelemetrySample] = deque()
+        self._lock = asyncio.Lock()
+        self._unsubs: list[CALLBACK_TYPE] = []
+        # Open windows by entity ID, started at the timestamp in ms
+        self._windows: dict[str, SeriesWindow] = {}
+        self._window_length = int(window.total_seconds() * 1000) if window else 0
+        self._window_start = 0
+        self._unsub_window: CALLBACK_TYPE | None = None
+        # Flush started once the queue reached the flush size
+        self._flush_task: asyncio.Task[None] | None = None
+        # Only the flush interval retries while uploads are failing
+        self._uploads_failing = False
+
+        # Counters
+        self.sent = 0
+        self.aggregated = 0
+        self.dropped = 0
+        self.failed_requests = 0
+
+    @property
+    def depth(self) -> int:
+        """Return the number of samples waiting to be sent."""
+        return len(self._queue)
+
+    @callback
+    def async_start(self) -> None:
+        """Start tracking the exported entities."""
+        self._unsubs.append(
+            async_track_state_change_event(
+                self.hass, self.entity_ids, self._async_state_changed
+            )
+        )
+        self._unsubs.append(
+            async_track_time_interval(
+                self.hass, self._async_flush_interval, self.flush_interval
+            )
+        )
+        if self.window is not None:
+            self._async_schedule_window(dt_util.utcnow())
+
+    async def async_stop(self) -> None:
+        """Stop tracking and send what is left in the queue."""
+        while self._unsubs:
+            self._unsubs.pop()()
+        if self._flush_task is not None:
+            await self._flush_task
+            self._flush_task = None
+        if self._unsub_window is not None:
+            self._unsub_window()
+            self._unsub_window = None
+            # Send the partial window as well
+            await self.async_flush(self._close_window())
+        else:
+            await self.async_flush()
+
+    @callback
+    def _async_schedule_window(self, now: datetime) -> None:
+        """Start the window containing now and schedule its end."""
+        ts = int(now.timestamp() * 1000)
+        self._window_start = ts - ts % self._window_length
+        self._unsub_window = async_track_point_in_utc_time(
+            self.hass,
+            self._async_window_ended,
+            dt_util.utc_from_timestamp(
+                (self._window_start + self._window_length) / 1000
+            ),
+        )
+
+    async def _async_window_ended(self, now: datetime) -> None:
+        """Queue the points of the ended window and send them in one batch."""
+        points = self._close_window()
+        self._async_schedule_window(now)
+        if not self._uploads_failing:
+            await self.async_flush(points)
+
+    def _close_window(self) -> int:
+        """Queue one point per aggregated entity, returning their number."""
+        windows, self._windows = self._windows, {}
+        for entity_id, window in windows.items():
+            self._append((self._window_start, entity_id, window.summary(entity_id)))
+        return len(windows)
+
+    @callback
+    def _async_state_changed(self, event: Event[EventStateChangedData]) -> None:
+        """Queue the new state of an exported entity."""
+        new_state = event.data["new_state"]
+        if new_state is None or new_state.state in (STATE_UNAVAILABLE, STATE_UNKNOWN):
+            return
+
+        value = state_to_value(new_state)
+        if self.window is not None:
+            if (window := self._windows.get(new_state.entity_id)) is None:
+                window = self._windows[new_state.entity_id] = SeriesWindow()
+            window.add(value)
+            self.aggregated += 1
+            return
+
+        self.async_enqueue(
+            int(new_state.last_updated.timestamp() * 1000),
+            new_state.entity_id,
+            value,
+        )
+
+    @callback
+    def async_enqueue(self, ts: int, key: str, value: Any) -> None:
+        """Queue a sample and send a batch once the flush size is reached."""
+        self._append((ts, key, value))
+
+        if (
+            len(self._queue) >= self.flush_size
+            and not self._uploads_failing
+            and not self._lock.locked()
+            and (self._flush_task is None or self._flush_task.done())
+        ):
+            self._flush_task = self.device.coordinator.entry.async_create_task(
+                self.hass, self.async_flush(), f"{DOMAIN}_telemetry_flush"
+            )
+
+    async def _async_flush_interval(self, _now: datetime) -> None:
+        """Flush the queue periodically."""
+        await self.async_flush()
+
+    def _append(self, sample: TelemetrySample) -> None:
+        """Queue a sample, dropping the oldest one if the queue is full."""
+        if len(self._queue) >= self.max_queue_size:
+            self._queue.popleft()
+            self.dropped += 1
+
+        self._queue.append(sample)
+
+    async def async_flush(self, batch_size: int = 0) -> None:
+        """Send queued samples in batches of at most the flush size.
+
+        A larger batch size sends that many samples in one request, so the
+        points of a window are not split.
+        """
+        batch_size = max(batch_size, self.flush_size)
+        async with self._lock:
+            while self._queue:
+                batch = [
+                    self._queue.popleft()
+                    for _ in range(min(batch_size, len(self._queue)))
+                ]
+
+                try:
+                    if self.gateway is not None:
+                        success = await self.gateway.async_publish_telemetry(batch)
+                    else:
+                        success = await self.device.async_post_telemetry(
+                            build_payload(batch)
+                        )
+                except DeviceUnreachable:
+                    self.failed_requests += 1
+                    # The spool replays through the device API, so gateway
+                    # samples stay queued instead
+                    spool = self.device.coordinator.spool
+                    if spool is not None and self.gateway is None:
+                        # Keep everything on disk until ThingsBoard is back
+                        batch.extend(self._queue)
+                        self._queue.clear()
+                        await spool.async_add_telemetry(
+                            self.device.device_id, build_payload(batch)
+                        )
+                        return
+
+                    self._uploads_failing = True
+                    self._requeue(batch)
+                    _LOGGER.debug(
+                        "Telemetry upload failed, %s sample(s) queued, %s dropped",
+                        len(self._queue),
+                        self.dropped,
+                    )
+                    return
+
+                self._uploads_failing = False
+                if success:
+                    self.sent += len(batch)
+                else:
+                    # Rejected by ThingsBoard, retrying cannot help
+                    self.failed_requests += 1
+                    self.dropped += len(batch)
+
+    def _requeue(self, batch: list[TelemetrySample]) -> None:
+        """Put a failed batch back in front of the queue, within its bound."""
+        free = self.max_queue_size - len(self._queue)
+        if free < len(batch):
+            self.dropped += len(batch) - free
+            batch = batch[len(batch) - free :] if free > 0 else []
+
+        self._queue.extendleft(reversed(batch))
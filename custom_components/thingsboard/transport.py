@@ -0,0 +1,283 @@
+"""Per-host HTTP transport shared by the entries of a ThingsBoard server."""
+
+from __future__ import annotations
+
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+import logging
+import time
+from typing import Any
+
+import aiohttp
+
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+from homeassistant.util.ssl import client_context
+
+from .const import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    DATA_TRANSPORTS,
+    TRANSPORT_CONNECT_TIMEOUT,
+    TRANSPORT_CONNECTION_LIMIT,
+    TRANSPORT_DNS_CACHE_TTL,
+    TRANSPORT_KEEPALIVE_TIMEOUT,
+    TRANSPORT_LONG_POLL_CONNECTION_LIMIT,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Circuit breaker states
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpen(aiohttp.ClientConnectionError):
+    """Error to indicate requests to a host fail fast after repeated failures."""
+
+
+class CircuitBreaker:
+    """Stop sending requests to a host after repeated failures.
+
+    Once the failure threshold is reached the circuit opens and requests
+    fail immediately. After the reset timeout a single probe request is let
+    through while all others are still rejected: its success closes the
+    circuit, its failure opens it anew.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float) -> None:
+        """Initialize the breaker."""
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        # Monotonic time the circuit opened, None while it is closed
+        self.opened_at: float | None = None
+        # A probe request of the half-open circuit is in flight
+        self.probing = False
+
+        # Counters
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """Return the state of the circuit."""
+        if self.opened_at is None:
+            return STATE_CLOSED
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return STATE_OPEN
+        return STATE_HALF_OPEN
+
+    def allow(self) -> bool:
+        """Return True if a request may be sent.
+
+        In the half-open state only the first request is allowed, as the
+        probe. It has to be ended with end_probe.
+        """
+        state = self.state
+        if state == STATE_OPEN or (state == STATE_HALF_OPEN and self.probing):
+            self.rejected += 1
+            return False
+        if state == STATE_HALF_OPEN:
+            self.probing = True
+        return True
+
+    def end_probe(self) -> None:
+        """Let the next request probe the host if the circuit is still half open."""
+        self.probing = False
+
+    def record_success(self) -> bool:
+        """Reset the failures, returning True if the circuit closed."""
+        closed = self.opened_at is not None
+        self.probing = False
+        self.failures = 0
+        self.opened_at = None
+        return closed
+
+    def record_failure(self) -> bool:
+        """Count a failure, returning True if the circuit opened."""
+        self.probing = False
+        self.failures += 1
+        if self.opened_at is None and self.failures < self.threshold:
+            return False
+
+        tripped = self.opened_at is None
+        self.opened_at = time.monotonic()
+        if tripped:
+            self.trips += 1
+        return tripped
+
+
+class HostTransport:
+    """Connection pool, timeouts and circuit breaker of one ThingsBoard host.
+
+    All entries of a server share one transport. A host that hangs only
+    ties up its own bounded pool instead of the session Home Assistant
+    shares with every integration, and fails fast once its circuit opened.
+    Long-polls wait in a second pool, so open subscriptions never keep
+    regular requests waiting for a connection.
+    """
+
+    def __init__(self, hass: HomeAssistant, host: str) -> None:
+        """Initialize the transport."""
+        self.hass = hass
+        self.host = host
+        self.breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+        # Entries using the transport
+        self.refs = 0
+
+        self._session: aiohttp.ClientSession | None = None
+        self._long_poll_session: aiohttp.ClientSession | None = None
+        self._unsub_close: CALLBACK_TYPE | None = None
+        self._open_listeners: dict[CALLBACK_TYPE, None] = {}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Return the session, creating it with the first request."""
+        if self._session is None:
+            self._session = self._create_session(TRANSPORT_CONNECTION_LIMIT)
+        return self._session
+
+    @property
+    def long_poll_session(self) -> aiohttp.ClientSession:
+        """Return the session of long-polls, creating it with the first one."""
+        if self._long_poll_session is None:
+            self._long_poll_session = self._create_session(
+                TRANSPORT_LONG_POLL_CONNECTION_LIMIT
+            )
+        return self._long_poll_session
+
+    def _create_session(self, limit: int) -> aiohttp.ClientSession:
+        """Create a session with a connection pool of its own."""
+        if self._unsub_close is None:
+            self._unsub_close = self.hass.bus.async_listen_once(
+                EVENT_HOMEASSISTANT_CLOSE, self._async_close_session
+            )
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=limit,
+                keepalive_timeout=TRANSPORT_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=TRANSPORT_DNS_CACHE_TTL,
+                ssl=client_context(),
+            )
+        )
+
+    @asynccontextmanager
+    async def request(
+        self,
+        method: str,
+        url: str,
+        read_timeout: float,
+        long_poll: bool = False,
+        **kwargs: Any,
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """Send a request through the pool of the host.
+
+        Long-polls use the pool of long-polls. Raises CircuitOpen without
+        sending anything while the circuit is open. Connection errors,
+        timeouts and server errors count as failures of the host.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpen(f"{self.host} is not responding, retrying later")
+        probe = self.breaker.probing
+
+        timeout = aiohttp.ClientTimeout(
+            total=TRANSPORT_CONNECT_TIMEOUT + read_timeout,
+            connect=TRANSPORT_CONNECT_TIMEOUT,
+            sock_read=read_timeout,
+        )
+        session = self.long_poll_session if long_poll else self.session
+        try:
+            async with session.request(
+                method, url, timeout=timeout, **kwargs
+            ) as response:
+                if response.status >= 500:
+                    self._async_record_failure()
+                elif self.breaker.record_success():
+                    _LOGGER.info("%s is responding again", self.host)
+                yield response
+        except (aiohttp.ClientError, TimeoutError):
+            self._async_record_failure()
+            raise
+        finally:
+            # Also when the probe was cancelled before it got a result
+            if probe:
+                self.breaker.end_probe()
+
+    @callback
+    def _async_record_failure(self) -> None:
+        """Count a failure and notify the entries if the circuit opened."""
+        if not self.breaker.record_failure():
+            return
+
+        _LOGGER.warning(
+            "%s failed %s times in a row, pausing requests for %s s",
+            self.host,
+            self.breaker.failures,
+            self.breaker.reset_timeout,
+        )
+        for listener in list(self._open_listeners):
+            listener()
+
+    @callback
+    def async_add_open_listener(self, listener: CALLBACK_TYPE) -> CALLBACK_TYPE:
+        """Call a listener whenever the circuit opens."""
+        self._open_listeners[listener] = None
+
+        @callback
+        def remove_listener() -> None:
+            """Remove the listener."""
+            self._open_listeners.pop(listener, None)
+
+        return remove_listener
+
+    async def async_release(self) -> None:
+        """Release the transport of an entry, closing it with the last one."""
+        self.refs -= 1
+        if self.refs > 0:
+            return
+
+        transports: dict[str, HostTransport] = self.hass.data.get(DATA_TRANSPORTS, {})
+        if transports.get(self.host) is self:
+            del transports[self.host]
+        if self._unsub_close is not None:
+            self._unsub_close()
+            self._unsub_close = None
+        await self._async_close_sessions()
+        self._session = self._long_poll_session = None
+
+    async def _async_close_session(self, _event: Event) -> None:
+        """Close the sessions when Home Assistant shuts down."""
+        self._unsub_close = None
+        await self._async_close_sessions()
+
+    async def _async_close_sessions(self) -> None:
+        """Close both sessions."""
+        for session in (self._session, self._long_poll_session):
+            if session is not None:
+                await session.close()
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the state of the transport for diagnostics."""
+        return {
+            "circuit": self.breaker.state,
+            "failures": self.breaker.failures,
+            "probing": self.breaker.probing,
+            "trips": self.breaker.trips,
+            "rejected": self.breaker.rejected,
+            "entries": self.refs,
+        }
+
+
+@callback
+def async_get_transport(hass: HomeAssistant, host: str) -> HostTransport:
+    """Return the transport of a host, shared with its other entries.
+
+    Every call has to be paired with HostTransport.async_release.
+    """
+    transports: dict[str, HostTransport] = hass.data.setdefault(DATA_TRANSPORTS, {})
+    if (transport := transports.get(host)) is None:
+        transport = transports[host] = HostTransport(hass, host)
+    transport.refs += 1
+    return transport
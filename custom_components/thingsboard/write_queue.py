@@ -0,0 +1,113 @@
+"""Coalescing write queue for ThingsBoard shared attributes."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from datetime import datetime
+import logging
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class AttributeWriteQueue:
+    """Merge attribute writes within a short window into a single request.
+
+    Every caller waits for the request that carries its values and gets
+    its result. Writes are sent one request at a time, in order.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        delay: float,
+        send: Callable[[dict[str, Any]], Awaitable[bool]],
+    ) -> None:
+        """Initialize the write queue."""
+        self.hass = hass
+        self.delay = delay
+        self._send = send
+        self._pending: dict[str, Any] = {}
+        self._waiters: list[asyncio.Future[bool]] = []
+        self._lock = asyncio.Lock()
+        self._unsub_flush: CALLBACK_TYPE | None = None
+
+    @property
+    def depth(self) -> int:
+        """Return the number of attributes waiting to be sent."""
+        return len(self._pending)
+
+    async def async_write(
+        self, attributes: dict[str, Any], immediate: bool = False
+    ) -> bool:
+        """Queue attributes and wait until they were sent.
+
+        Immediate writes skip the rest of the window and are sent right away,
+        together with everything queued before them.
+        """
+        self._pending.update(attributes)
+        waiter: asyncio.Future[bool] = self.hass.loop.create_future()
+        self._waiters.append(waiter)
+
+        if immediate:
+            await self.async_flush()
+        elif self._unsub_flush is None:
+            self._unsub_flush = async_call_later(
+                self.hass, self.delay, self._async_flush_later
+            )
+
+        return await waiter
+
+    async def _async_flush_later(self, _now: datetime) -> None:
+        """Flush the queue once the debounce window has passed."""
+        self._unsub_flush = None
+        await self.async_flush()
+
+    async def async_flush(self) -> None:
+        """Send all pending attributes in one request.
+
+        Callers of a write that raised an error get False as its result.
+        """
+        if self._unsub_flush is not None:
+            self._unsub_flush()
+            self._unsub_flush = None
+
+        async with self._lock:
+            if not self._pending:
+                return
+
+            attributes, self._pending = self._pending, {}
+            waiters, self._waiters = self._waiters, []
+
+            _LOGGER.debug(
+                "Sending %s coalesced attribute(s) for %s write(s)",
+                len(attributes),
+                len(waiters),
+            )
+            success = False
+            try:
+                success = await self._send(attributes)
+            except Exception:
+                _LOGGER.exception("Unexpected error sending attributes")
+            finally:
+                # Also release the callers if the flush was cancelled
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(success)
+
+    @callback
+    def async_cancel(self) -> None:
+        """Drop pending writes and release their callers."""
+        if self._unsub_flush is not None:
+            self._unsub_flush()
+            self._unsub_flush = None
+
+        self._pending = {}
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(False)